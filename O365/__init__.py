@@ -17,17 +17,29 @@ Python library for interfacing with the Microsoft Office 365 online.
 #__all__ = ['attachment','cal','contact','event','group','inbox','message','schedule']
 
 # This imports all the libraries into the local namespace. This makes it easy to work with.
+import sys
 
 from .contact import Contact
 from .group import Group
 from .cal import Calendar
 from .event import Event
-from .attachment import Attachment
+from .attachment import Attachment, fetch_attachments_many
 from .inbox import Inbox
 from .message import Message
-from .schedule import Schedule
+from .schedule import Schedule, fetch_all_events
 from .connection import Connection
 from .fluent_inbox import FluentInbox
+from .sync import FileStateStore, SqliteStateStore
+from .token_store import FileTokenStore, SqliteTokenStore
+from .batch import Batch
+from .upload import UploadSession
+from .folders import FolderIndex
+from .subscriptions import Subscriptions, NotificationListener, LocalNotifier
+from .template import MessageTemplate
+
+if sys.version_info >= (3, 6):
+	from .async_connection import AsyncConnection
+	from .async_fluent_inbox import AsyncFluentInbox
 
 
 #To the King!
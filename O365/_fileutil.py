@@ -0,0 +1,29 @@
+'''
+File helpers shared by the stores that keep their state on disk.
+'''
+import os
+import tempfile
+
+
+def atomic_write(file_path, content):
+	""" Writes the content to a temporary file then renames it over the destination, so readers
+	never see a half written file. Every write has its own temporary file, so threads and processes
+	writing the same file at once don't get in each other's way: the last rename wins
+
+	:param file_path: destination path
+	:param content: text to write
+	"""
+	directory, name = os.path.split(os.path.abspath(file_path))
+	fd, temp_path = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory)
+	try:
+		with os.fdopen(fd, 'w') as temp_file:
+			temp_file.write(content)
+			temp_file.flush()
+			os.fsync(temp_file.fileno())
+		getattr(os, 'replace', os.rename)(temp_path, file_path)
+	except BaseException:
+		try:
+			os.unlink(temp_path)
+		except OSError:
+			pass
+		raise
@@ -0,0 +1,128 @@
+'''
+asyncio front end for the Connection.
+
+The requests are still made by the pooled Connection, in a thread pool, while a semaphore bounds how
+many of them are in flight. This lets a single event loop drive hundreds of mailboxes at once.
+'''
+import asyncio
+import functools
+import logging
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from O365.connection import Connection
+
+log = logging.getLogger(__name__)
+
+
+class AsyncConnection(object):
+	'''
+	Coroutine versions of the requests of a Connection, sharing its authentication and pool.
+
+	Example:
+		connection = AsyncConnection(max_concurrency=100)
+		inboxes = [AsyncFluentInbox(connection) for mailbox in mailboxes]
+		results = await asyncio.gather(*[
+			fetch_unread(inbox, mailbox) for inbox, mailbox in zip(inboxes, mailboxes)])
+
+	Methods:
+		run -- runs any blocking call within the concurrency limit.
+		send_request, get_response, get_page, iter_response, post_data, patch_data, delete_data --
+			coroutine versions of the Connection methods.
+		close -- shuts the thread pool down.
+	'''
+
+	def __init__(self, max_concurrency=50, executor=None, connection=None, resize_pool=False):
+		'''
+		Creates an asyncio connection.
+
+		The pool of the connection is used as it is: with a pool_maxsize under max_concurrency, the
+		requests beyond it open throw-away connections (or wait, with pool_block). resize_pool grows
+		the pool to max_concurrency, which replaces the session of the connection, closing the
+		connections of everyone using it, so it is best done before any request is made.
+
+		:param max_concurrency: max no.of requests in flight at once
+		:param executor: executor running the blocking requests, a thread pool of max_concurrency
+			workers if None
+		:param connection: the Connection making the requests, the default connection if None
+		:param resize_pool: whether to grow the pool of the connection to max_concurrency connections
+		'''
+		self.connection = connection or Connection()
+		self.max_concurrency = max_concurrency
+		# one semaphore per event loop, a semaphore can't be shared between loops
+		self._semaphores = weakref.WeakKeyDictionary()
+		self._own_executor = executor is None
+		self.executor = executor or ThreadPoolExecutor(max_workers=max_concurrency)
+
+		settings = dict(self.connection.pool_settings)
+		if settings['pool_maxsize'] < max_concurrency:
+			if resize_pool:
+				# keep a pooled connection for every request that can be in flight
+				settings['pool_maxsize'] = max_concurrency
+				self.connection.configure_pool(**settings)
+			else:
+				log.debug('pool_maxsize {} is under max_concurrency {}, see resize_pool'.format(
+					settings['pool_maxsize'], max_concurrency))
+
+	async def run(self, func, *args, **kwargs):
+		'''
+		Runs a blocking call in the executor once a concurrency slot is free.
+
+		:param func: callable to run
+		:returns: what func returned
+		'''
+		loop = asyncio.get_running_loop()
+		semaphore = self._semaphores.get(loop)
+		if semaphore is None:
+			# created here so it belongs to the running loop
+			semaphore = self._semaphores.setdefault(loop, asyncio.Semaphore(self.max_concurrency))
+
+		async with semaphore:
+			return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+	async def send_request(self, method, request_url, data=None, **kwargs):
+		return await self.run(self.connection.send_request, method, request_url, data, **kwargs)
+
+	async def get_response(self, request_url, **kwargs):
+		return await self.run(self.connection.get_response, request_url, **kwargs)
+
+	async def get_page(self, request_url, **kwargs):
+		return await self.run(self.connection.get_page, request_url, **kwargs)
+
+	async def iter_response(self, request_url, page_size=None, max_items=None, **kwargs):
+		'''
+		Asynchronously iterates over all the results for specified url, following the next links.
+		Like Connection.iter_response, only one page is held in memory at a time.
+		'''
+		if page_size and max_items is not None:
+			page_size = min(page_size, max_items)
+		if page_size:
+			params = dict(kwargs.get('params') or {})
+			params['$top'] = page_size
+			kwargs['params'] = params
+
+		count = 0
+		next_link = request_url
+		while next_link and (max_items is None or count < max_items):
+			page, next_link = await self.get_page(next_link, **kwargs)
+			kwargs.pop('params', None)
+
+			for value in page:
+				if max_items is not None and count >= max_items:
+					return
+				count += 1
+				yield value
+
+	async def post_data(self, request_url, data, **kwargs):
+		return await self.run(self.connection.post_data, request_url, data, **kwargs)
+
+	async def patch_data(self, request_url, data, **kwargs):
+		return await self.run(self.connection.patch_data, request_url, data, **kwargs)
+
+	async def delete_data(self, request_url, **kwargs):
+		return await self.run(self.connection.delete_data, request_url, **kwargs)
+
+	def close(self):
+		''' Shuts down the thread pool if it was created by this connection '''
+		if self._own_executor:
+			self.executor.shutdown(wait=False)
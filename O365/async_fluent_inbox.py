@@ -0,0 +1,92 @@
+import logging
+
+from O365.async_connection import AsyncConnection
+from O365.fluent_inbox import FluentInbox
+
+log = logging.getLogger(__name__)
+
+
+class AsyncFluentInbox(object):
+	'''
+	asyncio version of FluentInbox, with the same fluent surface. Methods making requests are
+	coroutines, the ones only changing the query return the inbox right away.
+
+	Example:
+		inbox = AsyncFluentInbox(connection)
+		await inbox.from_folder('Inbox', user_id='shared@company.com')
+		messages = await inbox.filter('IsRead eq false').fetch_first(50)
+	'''
+
+	def __init__(self, connection=None, verify=True, folder_index=None):
+		'''
+		Creates a new asyncio inbox wrapper.
+
+		:param connection: AsyncConnection bounding the concurrency, share it between inboxes
+		:param verify: whether or not to verify SSL certificate
+		:param folder_index: FolderIndex shared with other inboxes, see FluentInbox
+		'''
+		self.connection = connection or AsyncConnection()
+		self.inbox = FluentInbox(verify=verify, connection=self.connection.connection,
+								 folder_index=folder_index)
+
+	@property
+	def url(self):
+		return self.inbox.url
+
+	@property
+	def fetched_count(self):
+		return self.inbox.fetched_count
+
+	async def from_folder(self, folder_name, user_id=None):
+		""" Configure to use this folder for fetching the mails
+
+		:param folder_name: name of the outlook folder
+		:param user_id: user id the folder belongs to (shared mailboxes)
+		"""
+		await self.connection.run(self.inbox.from_folder, folder_name, user_id=user_id)
+		return self
+
+	async def get_folder(self, value, by='Id', parent_id=None, user_id=None):
+		""" Return a folder by a given attribute, see FluentInbox.get_folder """
+		return await self.connection.run(self.inbox.get_folder, value, by=by, parent_id=parent_id,
+										 user_id=user_id)
+
+	async def list_folders(self, parent_id=None, user_id=None):
+		""" List the folders, see FluentInbox.list_folders """
+		return await self.connection.run(self.inbox.list_folders, parent_id=parent_id, user_id=user_id)
+
+	def filter(self, filter_string):
+		""" Set the value of a filter, see FluentInbox.filter """
+		self.inbox.filter(filter_string)
+		return self
+
+	def select(self, *fields):
+		""" Only download the given fields of the messages, see FluentInbox.select """
+		self.inbox.select(*fields)
+		return self
+
+	def search(self, search_string):
+		""" Set the value of a search, see FluentInbox.search """
+		self.inbox.search(search_string)
+		return self
+
+	def skip(self, count):
+		""" Skips the first n messages, where n is the specified count """
+		self.inbox.skip(count)
+		return self
+
+	async def fetch_first(self, count=10):
+		""" Fetch the first n messages, where n is the specified count """
+		return await self.connection.run(self.inbox.fetch_first, count=count)
+
+	async def fetch(self, count=10):
+		""" Fetch n messages from the result, where n is the specified count """
+		return await self.connection.run(self.inbox.fetch, count=count)
+
+	async def fetch_next(self, count=1):
+		""" Fetch the next n messages after the previous fetch, where n is the specified count """
+		return await self.connection.run(self.inbox.fetch_next, count=count)
+
+	async def sync(self, state_store, page_size=None):
+		""" Fetches the changes since the last sync, see FluentInbox.sync """
+		return await self.connection.run(self.inbox.sync, state_store, page_size=page_size)
@@ -4,12 +4,20 @@ binary of the file directly. The file is stored locally as a string using base64
 '''
 
 import base64
+import hashlib
 import logging
 import json
-import requests
+import os
+import threading
+from O365.connection import Connection
 import sys
 from os import path
 
+try:
+	from queue import Queue
+except ImportError:
+	from Queue import Queue
+
 log = logging.getLogger(__name__)
 
 class Attachment( object ):
@@ -25,6 +33,9 @@ class Attachment( object ):
 	isType - compares file extension to extension given. not case sensative.
 	getType - returns file extension.
 	save - save attachment locally.
+	download - stream the attachment to a file without holding it in memory.
+	fetch - download the content of an attachment listed without it.
+	getSize - returns the size of the attachment in bytes.
 	getByteString - returns the attached file as a byte string.
 	setByteString - set the attached file using a byte string.
 	getBase64 - returns the attached file as a base64 encoded string.
@@ -32,8 +43,13 @@ class Attachment( object ):
 	'''
 
 	create_url = 'https://outlook.office365.com/api/v1.0/me/messages/{0}/attachments'
+	# files larger than this are not loaded in memory, they are sent through an upload session
+	inline_limit = 3 * 1024 * 1024
+	# max base64 content of all the attachments sent inline in a request, Graph rejects requests
+	# larger than 4 MB
+	request_limit = 4 * 1024 * 1024 - 256 * 1024
 
-	def __init__(self,json=None,path=None,verify=True):
+	def __init__(self,json=None,path=None,verify=True,message=None):
 		'''
 		Creates a new attachment class, optionally from existing JSON.
 		
@@ -44,25 +60,34 @@ class Attachment( object ):
 		path -- a string giving the path to a file. it is cross platform as long as you break
 		windows convention and use '/' instead of '\'. Passing this argument will tend to
 		the rest of the process of making an attachment. Note that passing in json as well
-		will cause this argument to be ignored.
+		will cause this argument to be ignored. Files larger than inline_limit are only read
+		when sent.
+		message -- the message the attachment was downloaded from, needed to download its raw
+		content. (default = None)
 		'''
+		self.path = None
 		if json:
 			self.json = json
 			self.isPDF = '.pdf' in self.json['Name'].lower()
 		elif path:
-			with open(path,'rb') as val:
-				self.json = {'@odata.type':'#Microsoft.OutlookServices.FileAttachment'}
-				self.isPDF = '.pdf' in path.lower()
+			self.path = path
+			self.json = {'@odata.type':'#Microsoft.OutlookServices.FileAttachment'}
+			self.isPDF = '.pdf' in path.lower()
+			try:
+				self.setName(path[path.rindex('/')+1:])
+			except:
+				self.setName(path)
 
-				self.setByteString(val.read())
-				try:
-					self.setName(path[path.rindex('/')+1:])
-				except:
-					self.setName(path)
+			size = os.path.getsize(path)
+			if size > self.inline_limit:
+				self.json['Size'] = size
+			else:
+				self.load()
 		else:
 			self.json = {'@odata.type':'#Microsoft.OutlookServices.FileAttachment'}
 
 		self.verify = verify
+		self.message = message
 
 	def isType(self,typeString):
 		'''Test to if the attachment is the same type as you are seeking. Do not include a period.'''
@@ -82,6 +107,7 @@ class Attachment( object ):
 		location -- path to where the file is to be saved.
 		'''
 		try:
+			self._content()
 			outs = open(path.join(location, self.json['Name']),'wb')
 			outs.write(base64.b64decode(self.json['ContentBytes']))
 			outs.close()
@@ -94,6 +120,115 @@ class Attachment( object ):
 		log.debug('file saving successful')
 		return True
 
+	def load(self):
+		'''reads the content of the file the attachment was created from.'''
+		with open(self.path,'rb') as val:
+			self.setByteString(val.read())
+
+	def isLarge(self):
+		'''True if the attachment is a file too large to be sent inline, see inline_limit.'''
+		return self.path is not None and 'ContentBytes' not in self.json
+
+	def inline(self):
+		'''returns the json of the attachment with its content, reading the file if needed.'''
+		if self.isLarge():
+			self.load()
+		return self.json
+
+	def inlineSize(self):
+		'''no.of base64 bytes the attachment takes when sent inline, 0 if unknown.'''
+		if 'ContentBytes' in self.json:
+			return len(self.json['ContentBytes'] or '')
+		if self.path is not None:
+			return 4 * ((os.path.getsize(self.path) + 2) // 3)
+		return 0
+
+	def getSize(self):
+		'''returns the size of the attachment in bytes, None if unknown.'''
+		return self.json.get('Size') or self.json.get('size')
+
+	def fetch(self):
+		'''
+		Downloads the content of an attachment listed with fetchAttachments(lazy=True). This is done
+		for you by getByteString, getBase64 and save.
+		'''
+		if self.message is None or self.getId() is None:
+			raise RuntimeError('Only attachments listed with Message.fetchAttachments can be fetched')
+
+		url = '{0}/{1}'.format(self.message.att_url.format(self.message.json['Id']), self.getId())
+		response = self.message._request('GET', url, auth=self.message.auth, verify=self.message.verify)
+		if response.status_code != 200:
+			raise RuntimeError('Unable to fetch attachment {0}, status code {1}'.format(
+				self.getName(), response.status_code))
+
+		content = response.json()
+		self.json['ContentBytes'] = content.get('ContentBytes') or content.get('contentBytes')
+		log.debug('attachment content fetched.')
+		return True
+
+	def _content(self):
+		'''fetches the content if the attachment was listed without it.'''
+		if 'ContentBytes' not in self.json and self.message is not None and self.getId() is not None:
+			self.fetch()
+
+	def getId(self):
+		'''returns the id of the attachment, None if it was not downloaded.'''
+		return self.json.get('Id') or self.json.get('id')
+
+	def download(self,destination,chunk_size=65536,checksum=None,algorithm='sha256'):
+		'''
+		Streams the raw content of the attachment ($value) to a file or file-like object, a chunk at
+		a time, so the memory used doesn't depend on the size of the attachment.
+
+		destination -- path of the file to write, of a directory to write the attachment in under
+		its name, or a file-like object with a write method.
+		chunk_size -- no.of bytes read and written at a time.
+		checksum -- expected hex digest of the content. When it doesn't match a RuntimeError is
+		raised and no file is left at the destination path.
+		algorithm -- hashlib algorithm of the checksum.
+
+		returns the hex digest of the content.
+		'''
+		if self.message is None or self.getId() is None:
+			raise RuntimeError('Only attachments downloaded with Message.fetchAttachments can be downloaded')
+
+		url = '{0}/{1}/$value'.format(self.message.att_url.format(self.message.json['Id']), self.getId())
+		response = self.message._request('GET', url, auth=self.message.auth, verify=self.message.verify,
+										 stream=True)
+		try:
+			if response.status_code != 200:
+				raise RuntimeError('Unable to download attachment {0}, status code {1}'.format(
+					self.json.get('Name') or self.json.get('name'), response.status_code))
+
+			digest = hashlib.new(algorithm)
+			if hasattr(destination, 'write'):
+				for chunk in response.iter_content(chunk_size):
+					digest.update(chunk)
+					destination.write(chunk)
+			else:
+				if path.isdir(destination):
+					destination = path.join(destination, self.json.get('Name') or self.json.get('name'))
+				# written next to the destination, renamed once complete and verified
+				part_path = destination + '.part'
+				try:
+					with open(part_path, 'wb') as outs:
+						for chunk in response.iter_content(chunk_size):
+							digest.update(chunk)
+							outs.write(chunk)
+					if checksum is not None and digest.hexdigest() != checksum.lower():
+						raise RuntimeError('Checksum mismatch for {0}'.format(destination))
+					getattr(os, 'replace', os.rename)(part_path, destination)
+				finally:
+					if path.exists(part_path):
+						os.unlink(part_path)
+		finally:
+			response.close()
+
+		if checksum is not None and digest.hexdigest() != checksum.lower():
+			raise RuntimeError('Checksum mismatch for {0}'.format(self.json.get('Name') or self.json.get('name')))
+		log.debug('attachment downloaded.')
+		return digest.hexdigest()
+
 	def attach(self,message):
 		'''
 		This does the actual creating of the attachment as well as attaching to a message.
@@ -106,7 +241,7 @@ class Attachment( object ):
 
 		data = json.dumps(self.json)
 
-		response = requests.post(self.create_url.format(mid),data,header=headers,auth=message.auth,verify=self.verify)
+		response = Connection.get_session().post(self.create_url.format(mid),data,header=headers,auth=message.auth,verify=self.verify)
 		log.debug('Response from server for attaching: {0}'.format(str(response)))
 
 		return response
@@ -117,6 +252,7 @@ class Attachment( object ):
 		you to make scripts that use linux pipe lines in their execution.
 		'''
 		try:
+			self._content()
 			return base64.b64decode(self.json['ContentBytes'])
 
 		except Exception as e:
@@ -127,6 +263,7 @@ class Attachment( object ):
 	def getBase64(self):
 		'''Returns the base64 encoding representation of the attachment.'''
 		try:
+			self._content()
 			return self.json['ContentBytes']
 		except Exception as e:
 			log.debug('what? no clue what went wrong here. probably no attachment.')
@@ -166,4 +303,93 @@ class Attachment( object ):
 		self.json['ContentBytes'] = val
 		return True
 
+
+def _held_bytes(message):
+	'''no.of bytes of attachment content held by the message.'''
+	return sum(len(att.json.get('ContentBytes') or att.json.get('contentBytes') or '') for att in message.attachments)
+
+
+def fetch_attachments_many(messages, workers=8, max_bytes=64 * 1024 * 1024, lazy=False):
+	'''
+	Downloads the attachments of many messages concurrently, yielding the messages as their
+	attachments arrive (not in the order they were given).
+
+	Example:
+		for message, error in fetch_attachments_many(inbox.messages, workers=8):
+			if error is None:
+				for att in message.attachments:
+					att.save('/tmp/')
+
+	Keyword Arguments:
+	messages -- iterable of Message (or fluent Message), consumed lazily.
+	workers -- no.of downloads in flight at once. The connection pool should hold as many
+	connections, see Connection.configure_pool.
+	max_bytes -- the workers stop starting new downloads while the messages downloaded but not
+	consumed yet hold more attachment content than this. The content held can go over it by the
+	downloads already in flight.
+	lazy -- only list the attachments, their content is fetched when it is read. see
+	Message.fetchAttachments.
+
+	Yields (message, error) tuples, error being the exception raised by fetchAttachments if any.
+	'''
+	pending = iter(messages)
+	pending_lock = threading.Lock()
+	budget = threading.Condition()
+	state = {'held': 0, 'stopped': False}
+	done = Queue()
+
+	def work():
+		try:
+			while True:
+				with budget:
+					while state['held'] >= max_bytes and not state['stopped']:
+						budget.wait()
+					if state['stopped']:
+						return
+				with pending_lock:
+					try:
+						message = next(pending)
+					except StopIteration:
+						return
+
+				error = None
+				try:
+					if lazy:
+						message.fetchAttachments(lazy=True)
+					else:
+						message.fetchAttachments()
+				except Exception as e:
+					log.info('failed to download attachments: {0}'.format(str(e)))
+					error = e
+				size = _held_bytes(message)
+				with budget:
+					state['held'] += size
+				done.put((message, error, size))
+		finally:
+			# tells the consumer this worker is done
+			done.put(None)
+
+	threads = [threading.Thread(target=work) for i in range(max(1, workers))]
+	for thread in threads:
+		thread.daemon = True
+		thread.start()
+
+	try:
+		finished = 0
+		while finished < len(threads):
+			result = done.get()
+			if result is None:
+				finished += 1
+				continue
+			message, error, size = result
+			yield message, error
+			with budget:
+				state['held'] -= size
+				budget.notify_all()
+	finally:
+		with budget:
+			state['stopped'] = True
+			budget.notify_all()
+
+
 #To the King!
@@ -0,0 +1,172 @@
+'''
+JSON batching of Microsoft Graph requests.
+
+Operations like Message.markAsRead or Event.delete accept a Batch instead of being sent right away.
+The queued operations are sent as $batch requests of up to 20 sub requests each, and the outcome of
+every operation is kept on the BatchRequest returned when it was queued.
+'''
+import json
+import logging
+
+from O365.connection import Connection
+
+log = logging.getLogger(__name__)
+
+
+class BatchRequest(object):
+	'''
+	A single operation of a batch.
+
+	Variables:
+		method -- HTTP method of the operation.
+		url -- url of the operation, relative to the Graph version root.
+		body -- JSON body of the operation, if any.
+		target -- the object (Message, Event...) the operation was queued for.
+		status -- HTTP status returned for this operation, None until the batch is flushed.
+		response -- JSON body returned for this operation, if any.
+		error -- error message if the operation failed.
+	'''
+
+	def __init__(self, method, url, body=None, target=None):
+		self.method = method
+		self.url = url
+		self.body = body
+		self.target = target
+		self.status = None
+		self.response = None
+		self.error = None
+
+	@property
+	def ok(self):
+		'''True once the operation succeeded.'''
+		return self.status is not None and 200 <= self.status < 300
+
+	def __repr__(self):
+		return '<BatchRequest {} {} status={}>'.format(self.method, self.url, self.status)
+
+
+class Batch(object):
+	'''
+	Queue of operations sent to Microsoft Graph with JSON batching.
+
+	Example:
+		with Batch() as batch:
+			for message in messages:
+				message.markAsRead(batch=batch)
+		failed = [request.target for request in batch.errors]
+
+	Methods:
+		add -- queues an operation.
+		flush -- sends every queued operation.
+		errors -- operations of the sent batches that failed.
+
+	Variables:
+		batch_url -- url of the Graph $batch endpoint.
+		max_requests -- number of operations sent per $batch request, as allowed by Graph.
+	'''
+	batch_url = 'https://graph.microsoft.com/v1.0/$batch'
+	max_requests = 20
+	_url_prefixes = ('https://graph.microsoft.com/v1.0', 'https://outlook.office365.com/api/v1.0')
+
+	def __init__(self, sequential=False, verify=True, connection=None):
+		'''
+		Creates an empty batch.
+
+		:param sequential: when True the operations of a $batch request are run one after the other
+			in the order they were added (a failed operation then fails the ones after it),
+			otherwise Graph may run them in any order
+		:param verify: whether or not to verify SSL certificate
+		:param connection: the Connection to send the batches with, the default connection if None
+		'''
+		self.connection = connection or Connection()
+		self.sequential = sequential
+		self.verify = verify
+		self.pending = []
+		self.sent = []
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if exc_type is None:
+			self.flush()
+
+	def __len__(self):
+		return len(self.pending)
+
+	def add(self, method, url, body=None, target=None):
+		'''
+		Queues an operation.
+
+		:param method: HTTP method of the operation
+		:param url: absolute or version relative url of the operation
+		:param body: JSON serializable body of the operation
+		:param target: object the operation is for, kept on the returned request
+		:returns: the queued BatchRequest
+		'''
+		for prefix in self._url_prefixes:
+			if url.startswith(prefix):
+				url = url[len(prefix):]
+				break
+
+		request = BatchRequest(method.upper(), url, body, target)
+		self.pending.append(request)
+		return request
+
+	def flush(self):
+		'''
+		Sends the queued operations, max_requests at a time, in the order they were queued.
+
+		:returns: list of the BatchRequest that were sent
+		'''
+		if self.pending and self.connection.api_version != '2.0':
+			raise RuntimeError('Batching requires the Microsoft Graph API, please use '
+							   '"Connection.oauth2" to configure the connection')
+
+		pending, self.pending = self.pending, []
+
+		for start in range(0, len(pending), self.max_requests):
+			self._send(pending[start:start + self.max_requests])
+
+		self.sent.extend(pending)
+		return pending
+
+	@property
+	def errors(self):
+		'''Operations already sent that did not succeed.'''
+		return [request for request in self.sent if not request.ok]
+
+	def _send(self, requests):
+		''' Sends a single $batch request and maps the responses back onto the operations '''
+		payload = {'requests': []}
+		for i, request in enumerate(requests):
+			sub_request = {'id': str(i), 'method': request.method, 'url': request.url}
+			if request.body is not None:
+				sub_request['body'] = request.body
+				sub_request['headers'] = {'Content-Type': 'application/json'}
+			if self.sequential and i > 0:
+				sub_request['dependsOn'] = [str(i - 1)]
+			payload['requests'].append(sub_request)
+
+		headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+		log.debug('sending a batch of {} requests'.format(len(requests)))
+		try:
+			response = self.connection.send_request('POST', self.batch_url, json.dumps(payload),
+													headers=headers, verify=self.verify)
+			if response.status_code != 200:
+				raise RuntimeError('Batch request failed with status code {}: {}'.format(
+					response.status_code, response.text))
+			responses = response.json()['responses']
+		except Exception as e:
+			log.error('Batch request failed: {}'.format(str(e)))
+			for request in requests:
+				request.error = str(e)
+			return
+
+		for sub_response in responses:
+			request = requests[int(sub_response['id'])]
+			request.status = sub_response.get('status')
+			request.response = sub_response.get('body')
+			if not request.ok:
+				error = request.response.get('error', {}) if isinstance(request.response, dict) else {}
+				request.error = error.get('message') or 'status code {}'.format(request.status)
@@ -0,0 +1,164 @@
+'''
+Cache of the responses of list requests that rarely change, like the mail folders and the calendars.
+
+A response younger than the ttl is served without any request. An older one is revalidated with
+its ETag (If-None-Match), so when nothing changed the server answers with an empty 304 instead of
+the whole list.
+'''
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from O365._fileutil import atomic_write
+
+log = logging.getLogger(__name__)
+
+
+class MemoryBackend(object):
+	'''
+	Least recently used entries kept in memory.
+	'''
+
+	def __init__(self, max_entries=256):
+		'''
+		:param max_entries: no.of responses kept, the least recently used are dropped first
+		'''
+		self.max_entries = max_entries
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key):
+		with self._lock:
+			entry = self._entries.pop(key, None)
+			if entry is not None:
+				self._entries[key] = entry
+			return entry
+
+	def set(self, key, entry):
+		with self._lock:
+			self._entries.pop(key, None)
+			self._entries[key] = entry
+			while len(self._entries) > self.max_entries:
+				self._entries.popitem(last=False)
+
+	def delete(self, key):
+		with self._lock:
+			self._entries.pop(key, None)
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+
+
+class FileBackend(object):
+	'''
+	Entries saved as json files in a directory, so they survive restarts and are shared by the
+	processes polling the same account.
+	'''
+
+	def __init__(self, directory):
+		'''
+		:param directory: directory the responses are saved in, created if needed
+		'''
+		self.directory = os.path.expanduser(directory)
+		if not os.path.isdir(self.directory):
+			os.makedirs(self.directory)
+
+	def _path(self, key):
+		return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+	def get(self, key):
+		try:
+			with open(self._path(key), 'r') as entry_file:
+				entry = json.load(entry_file)
+		except (IOError, OSError, ValueError):
+			return None
+		# two keys with the same hash
+		if entry.get('key') != key:
+			return None
+		return entry
+
+	def set(self, key, entry):
+		entry = dict(entry, key=key)
+		atomic_write(self._path(key), json.dumps(entry))
+
+	def delete(self, key):
+		try:
+			os.unlink(self._path(key))
+		except OSError:
+			pass
+
+	def clear(self):
+		for name in os.listdir(self.directory):
+			if name.endswith('.json'):
+				os.unlink(os.path.join(self.directory, name))
+
+
+class ResponseCache(object):
+	'''
+	Cache of response bodies with a time to live and ETag revalidation, see Connection.set_cache.
+
+	Example:
+		Connection.set_cache(ResponseCache(ttl=600, backend=FileBackend('~/.o365_cache')))
+	'''
+
+	def __init__(self, ttl=300, backend=None):
+		'''
+		:param ttl: no.of seconds a response is served without asking the server
+		:param backend: where the responses are kept, a MemoryBackend if None
+		'''
+		self.ttl = ttl
+		self.backend = backend if backend is not None else MemoryBackend()
+		self._lock = threading.Lock()
+		self.reset_stats()
+
+	def reset_stats(self):
+		with self._lock:
+			self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0}
+
+	def count(self, name):
+		with self._lock:
+			self.stats[name] += 1
+
+	def lookup(self, key, now=None):
+		'''
+		:param key: key of the request
+		:returns: tuple of the entry (None if there is none) and whether it is still fresh
+		'''
+		entry = self.backend.get(key)
+		if entry is None:
+			return None, False
+		now = time.time() if now is None else now
+		return entry, now - entry['stored'] < self.ttl
+
+	def store(self, key, body, etag=None, now=None):
+		'''
+		:param key: key of the request
+		:param body: text of the response
+		:param etag: ETag header of the response, if any
+		'''
+		self.backend.set(key, {'body': body, 'etag': etag,
+							   'stored': time.time() if now is None else now})
+
+	def touch(self, key, entry, now=None):
+		''' Restarts the time to live of an entry the server confirmed unchanged '''
+		self.store(key, entry['body'], entry.get('etag'), now)
+
+	def invalidate(self, key=None):
+		''' Drops the response of a key, or every response if None '''
+		if key is None:
+			self.backend.clear()
+		else:
+			self.backend.delete(key)
+
+	def get_stats(self):
+		'''
+		:returns: dictionary with the no.of responses served from the cache, revalidated with a 304
+			and downloaded
+		'''
+		with self._lock:
+			return dict(self.stats)
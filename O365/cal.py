@@ -6,6 +6,7 @@ import time
 
 from O365.event import Event
 from O365.connection import Connection
+from O365.collection import ItemIndex
 
 log = logging.getLogger(__name__)
 
@@ -18,22 +19,30 @@ class Calendar( object ):
 		getCalendarid - returns the GUid that identifies the calendar on office365
 		getid - synonym of getCalendarid
 		getEvents - kicks off the process of fetching events.
+		getCalendarView - fetches all the events between two dates, page after page.
 		fetchEvents - legacy duplicate of getEvents
 
 	Variable:
 		events_url - the url that is actually called to fetch events. takes an id, start, and end date.
+		view_url - the url called by getCalendarView, takes an id.
 		time_string - used for converting between struct_time and json's time format.
 	'''
 	events_url = 'https://outlook.office365.com/api/v1.0/me/calendars/{0}/calendarView?startDateTime={1}&endDateTime={2}&$top={3}'
+	view_url = 'https://outlook.office365.com/api/v1.0/me/calendars/{0}/calendarView'
 	time_string = '%Y-%m-%dT%H:%M:%SZ'
 
-	def __init__(self, json=None, auth=None, verify=True):
+	def __init__(self, json=None, auth=None, verify=True, connection=None, max_events=None):
 		'''
 		Wraps all the information for managing calendars.
+
+		connection -- the Connection to use, the default connection if None.
+		max_events -- only keep that many events, the least recently downloaded ones being dropped
+		first. All of them are kept if None.
 		'''
 		self.json = json
 		self.auth = auth
-		self.events = []
+		self.connection = connection or Connection()
+		self.events = ItemIndex(max_size=max_events)
 
 		if json:
 			log.debug('translating calendar information into local variables.')
@@ -86,7 +95,7 @@ class Calendar( object ):
 			end = time.gmtime(end)
 			end = time.strftime(self.time_string,end)
 
-		connection = Connection()
+		connection = self.connection
 
 		# Change URL if we use Oauth
 		if connection.is_valid() and connection.oauth != None:
@@ -99,17 +108,8 @@ class Calendar( object ):
 		#This takes that response and then parses it into individual calendar events.
 		for event in response:
 			try:
-				duplicate = False
-
-				# checks to see if the event is a duplicate. if it is local changes are clobbered.
-				for i,e in enumerate(self.events):
-					if e.json['Id'] == event['id']:
-						self.events[i] = Event(event,self.auth,self)
-						duplicate = True
-						break
-
-				if not duplicate:
-					self.events.append(Event(event,self.auth,self))
+				# if the event is a duplicate local changes are clobbered.
+				self.events.upsert(Event(event,self.auth,self), event['id'])
 
 				log.debug('appended event: %s',event['subject'])
 			except Exception as e:
@@ -118,4 +118,45 @@ class Calendar( object ):
 		log.debug('all events retrieved and put in to the list.')
 		return True
 
+	def getCalendarView(self,start=None,end=None,page_size=100):
+		'''
+		Pulls all the events of this calendar between start and end, following the pages of results
+		instead of stopping at the first one like getEvents.
+
+		Keyword Arguments:
+		start -- struct_time or string in time_string format. Default is now.
+		end -- struct_time or string in time_string format. Default is a year from now.
+		page_size -- no.of events per request.
+
+		Returns the list of Event, which are also put in events. Their times are in UTC.
+		'''
+		if not start:
+			start = time.gmtime()
+		if not end:
+			end = time.gmtime(time.time() + 3600*24*365)
+		if isinstance(start, time.struct_time):
+			start = time.strftime(self.time_string, start)
+		if isinstance(end, time.struct_time):
+			end = time.strftime(self.time_string, end)
+
+		connection = self.connection
+		url = self.view_url
+		if connection.is_valid() and connection.oauth != None:
+			url = url.replace("outlook.office365.com/api", "graph.microsoft.com")
+
+		# the times of every calendar in UTC, so events of calendars in other time zones can be sorted
+		headers = dict(connection.default_headers or {})
+		headers['Prefer'] = 'outlook.timezone="UTC"'
+		response = connection.iter_response(url.format(self.json['Id']), page_size=page_size,
+											params={'startDateTime': start, 'endDateTime': end},
+											headers=headers, auth=self.auth, verify=self.verify)
+		events = []
+		for event in response:
+			event = Event(event,self.auth,self)
+			self.events.upsert(event, event.json['Id'])
+			events.append(event)
+
+		log.debug('{0} events retrieved for calendar {1}.'.format(len(events), self.json['Name']))
+		return events
+
 # To the King!
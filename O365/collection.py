@@ -0,0 +1,168 @@
+'''
+Containers used for the messages, events, calendars and contacts downloaded by the library.
+'''
+import logging
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+def json_id(item):
+	''' Returns the id of an O365 object, from its json (Outlook REST 'Id' or Graph 'id') '''
+	item_id = item.json.get('Id')
+	if item_id is None:
+		item_id = item.json.get('id')
+	return item_id
+
+
+class ItemIndex(object):
+	'''
+	Insertion ordered collection of items indexed by id, so adding or replacing an item is O(1)
+	whatever the no.of items. It behaves like the list it replaces: len, iteration, indexing,
+	append, extend, pop, remove and item assignment work the same, except that an item added with
+	the id of another one replaces it.
+
+	With max_size the least recently added or updated items are dropped once the collection is
+	full, the items are then kept from the least to the most recently added or updated. This is not
+	a least recently used cache: reading an item (get, indexing, iteration) doesn't keep it longer.
+
+	Methods:
+		upsert -- adds an item, or replaces the one with the same id.
+		get -- returns the item with the given id.
+		remove -- drops the item, or the item with the given id.
+	'''
+
+	def __init__(self, items=None, key=json_id, max_size=None):
+		'''
+		:param items: items to start with
+		:param key: function returning the id of an item
+		:param max_size: max no.of items kept, unbounded if None
+		'''
+		self.key = key
+		self.max_size = max_size
+		self._items = OrderedDict()
+		# positional list of the items, built when indexing and kept until the order changes
+		self._values = None
+		self.extend(items or [])
+
+	def upsert(self, item, item_id=None):
+		'''
+		Adds an item, or replaces the one with the same id keeping its place unless the collection
+		is bounded.
+
+		:param item: the item
+		:param item_id: id of the item, found with the key function if None
+		:returns: the item replaced, None if the item is new
+		'''
+		if item_id is None:
+			item_id = self.key(item)
+		previous = self._items.get(item_id)
+		if previous is not None and self.max_size is not None:
+			# most recently updated item
+			del self._items[item_id]
+			self._values = None
+		self._items[item_id] = item
+
+		if self._values is not None:
+			if previous is None:
+				self._values.append(item)
+			else:
+				self._values = None
+		if self.max_size is not None:
+			while len(self._items) > self.max_size:
+				evicted_id, evicted = self._items.popitem(last=False)
+				self._values = None
+				log.debug('dropped item {} from the collection'.format(evicted_id))
+		return previous
+
+	append = upsert
+
+	def extend(self, items):
+		''' Upserts the items one after the other '''
+		for item in items:
+			self.upsert(item)
+
+	def get(self, item_id, default=None):
+		return self._items.get(item_id, default)
+
+	def _id_of(self, item):
+		''' Returns the id of an item of the collection, or the id itself. None if it is in neither '''
+		try:
+			if item in self._items:
+				return item
+		except TypeError:
+			pass
+		try:
+			item_id = self.key(item)
+		except (AttributeError, TypeError, KeyError):
+			return None
+		return item_id if self._items.get(item_id) is item else None
+
+	def remove(self, item):
+		'''
+		Drops an item, or the item with the given id.
+
+		:param item: the item or its id
+		:returns: the item dropped, None if there was none
+		'''
+		item_id = self._id_of(item)
+		if item_id is None:
+			return None
+		self._values = None
+		return self._items.pop(item_id)
+
+	def pop(self, index=-1):
+		''' Drops and returns the item at the given position, the last one by default '''
+		if not self._items:
+			raise IndexError('pop from empty ItemIndex')
+		if index in (-1, len(self._items) - 1):
+			item = self._items.popitem(last=True)[1]
+			if self._values is not None:
+				self._values.pop()
+			return item
+		item = self[index]
+		return self.remove(item)
+
+	def ids(self):
+		return list(self._items.keys())
+
+	def clear(self):
+		self._items.clear()
+		self._values = None
+
+	def _list(self):
+		if self._values is None:
+			self._values = list(self._items.values())
+		return self._values
+
+	def __len__(self):
+		return len(self._items)
+
+	def __iter__(self):
+		return iter(list(self._items.values()))
+
+	def __getitem__(self, index):
+		''' Positional access like a list, use get to look items up by id '''
+		return self._list()[index]
+
+	def __setitem__(self, index, item):
+		''' Replaces the item at the given position, the other item with the same id is dropped '''
+		values = self._list()
+		previous = values[index]
+		item_id = self.key(item)
+		if self._items.get(item_id) is previous:
+			self._items[item_id] = item
+			values[index] = item
+			return
+		pairs = list(self._items.items())
+		position = range(len(pairs))[index]
+		pairs[position] = (item_id, item)
+		self._items = OrderedDict(pair for i, pair in enumerate(pairs) if i == position or pair[0] != item_id)
+		self._values = None
+
+	def __contains__(self, item):
+		''' Accepts an id or an item '''
+		return self._id_of(item) is not None
+
+	def __repr__(self):
+		return '<ItemIndex of {} items>'.format(len(self._items))
@@ -1,39 +1,188 @@
+import base64
+import json
 import logging
 import os
 import os.path as path
-import json
+
+import threading
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.compat import urlparse
 from oauthlib.oauth2 import TokenExpiredError
 from requests_oauthlib import OAuth2Session
 from future.utils import with_metaclass
 
+from O365.retry import RetryPolicy
+from O365.streaming import iter_values
+from O365.token_store import FileTokenStore
+
 
 log = logging.getLogger(__name__)
 
 
-class MicroDict(dict):
-	def __getitem__(self, key):
-		result = super(MicroDict, self).get(key[:1].lower() + key[1:], None)
-		if result is None:
-			result = super(MicroDict, self).get(key[:1].upper() + key[1:])
-		if type(result) is dict:
-			result = MicroDict(result)
-		return result
+def _token_claims(access_token):
+	""" Returns the claims of a JWT access token, without checking its signature (they only tell the
+	users apart), or an empty dictionary for tokens that aren't JWTs
 
+	:param access_token: the access token
+	"""
+	try:
+		payload = access_token.split('.')[1]
+		payload += '=' * (-len(payload) % 4)
+		claims = json.loads(base64.urlsafe_b64decode(payload.encode('ascii')).decode('utf-8'))
+	except Exception:
+		return {}
+	return claims if isinstance(claims, dict) else {}
 
-class Singleton(type):
-	_instance = None
 
-	def __call__(cls, *args, **kwargs):
-		if not cls._instance:
-			cls._instance = super(Singleton, cls).__call__(*args, **kwargs)
-		return cls._instance
+class MicroDict(dict):
+	""" Dictionary of an API result accepting both casings of the first letter of its keys
+	(Outlook REST uses 'Subject', Graph 'subject'), None being returned for missing keys.
 
-	# def __new__(cls, *args, **kwargs):
-	#	 if not cls._instance:
-	#		 cls._instance = object.__new__(cls)
-	#	 return cls._instance
+	Nested dictionaries, also inside lists, are converted once when the MicroDict is built, so
+	lookups return the same nested objects every time without allocating.
+	"""
+	# key -> the key with the casing of its first letter swapped, shared by all the instances
+	_alternate_keys = {}
+
+	def __init__(self, *args, **kwargs):
+		super(MicroDict, self).__init__(*args, **kwargs)
+		for key, value in self.items():
+			value_type = type(value)
+			if value_type is dict:
+				dict.__setitem__(self, key, MicroDict(value))
+			elif value_type is list:
+				dict.__setitem__(self, key, _micro_list(value))
+
+	def __missing__(self, key):
+		alternate = MicroDict._alternate_keys.get(key)
+		if alternate is None:
+			first = key[:1]
+			alternate = (first.upper() if first.islower() else first.lower()) + key[1:]
+			MicroDict._alternate_keys[key] = alternate
+		return dict.get(self, alternate)
+
+
+def _micro_list(values):
+	""" Converts the dictionaries of a list to MicroDict """
+	return [MicroDict(value) if type(value) is dict else
+			_micro_list(value) if type(value) is list else value
+			for value in values]
+
+
+def micro_object(values):
+	""" json object_hook building the MicroDict while parsing, e.g. response.json(object_hook=micro_object).
+	Objects are parsed inner first, so the nested ones are converted already """
+	micro_dict = MicroDict.__new__(MicroDict)
+	dict.update(micro_dict, values)
+	return micro_dict
+
+
+def mailbox_from_url(request_url):
+	""" Returns the mailbox a request is for: the user id of /users/{id}/ urls, 'me' otherwise
+
+	:param request_url: url of the request
+	"""
+	path_parts = urlparse(request_url).path.split('/')
+	if 'users' in path_parts:
+		index = path_parts.index('users') + 1
+		if index < len(path_parts):
+			return path_parts[index].lower()
+	return 'me'
+
+
+class ConnectionRegistry(type):
+	""" Keeps one connection per name: Connection() is the default connection, Connection('name')
+	the one registered under that name, created on first use """
+	_lock = threading.Lock()
+
+	def __init__(cls, *args, **kwargs):
+		super(ConnectionRegistry, cls).__init__(*args, **kwargs)
+		cls._instances = {}
+
+	def __call__(cls, name=None):
+		with ConnectionRegistry._lock:
+			if name not in cls._instances:
+				cls._instances[name] = super(ConnectionRegistry, cls).__call__(name)
+			return cls._instances[name]
+
+	def names(cls):
+		""" Returns the names of the registered connections, the default one being None """
+		with ConnectionRegistry._lock:
+			return list(cls._instances.keys())
+
+	def remove(cls, name):
+		""" Forgets the connection registered under name, closing its connection pool """
+		with ConnectionRegistry._lock:
+			connection = cls._instances.pop(name, None)
+		if connection is not None and connection.session is not None:
+			connection.session.close()
+
+
+class connection_method(object):
+	""" Decorator for the Connection methods that can be called on a connection, or on the class to
+	use the default connection: Connection.get_response(url) or Connection('tenant').get_response(url) """
+
+	def __init__(self, func):
+		self.func = func
+		self.__doc__ = func.__doc__
+
+	def __get__(self, instance, owner):
+		if instance is None:
+			instance = owner()
+		return self.func.__get__(instance, owner)
+
+
+_oauth2_login_url = 'https://login.microsoftonline.com/'
+
+
+class PooledAdapter(HTTPAdapter):
+	""" Transport adapter that keeps track of how often pooled connections get reused, per host,
+	and paces the requests with the rate limiter of the connection owning it """
+
+	def __init__(self, *args, **kwargs):
+		self.owner = kwargs.pop('owner', None)
+		self._stats = {}
+		self._stats_lock = threading.Lock()
+		self._local = threading.local()
+		super(PooledAdapter, self).__init__(*args, **kwargs)
+
+	def _track(self, pool):
+		self._local.pool = pool
+		self._local.opened = pool.num_connections
+		return pool
+
+	def get_connection_with_tls_context(self, *args, **kwargs):
+		return self._track(super(PooledAdapter, self).get_connection_with_tls_context(*args, **kwargs))
+
+	def get_connection(self, *args, **kwargs):
+		return self._track(super(PooledAdapter, self).get_connection(*args, **kwargs))
+
+	def send(self, request, **kwargs):
+		owner = self.owner
+		if owner is not None and owner.rate_limiter is not None and not request.url.startswith(_oauth2_login_url):
+			owner.rate_limiter.acquire(owner.mailbox(request.url), owner.tenant())
+
+		self._local.pool = None
+		response = super(PooledAdapter, self).send(request, **kwargs)
+
+		pool = self._local.pool
+		new_connections = max(pool.num_connections - self._local.opened, 0) if pool else 0
+		host = urlparse(request.url).netloc
+		with self._stats_lock:
+			stats = self._stats.setdefault(host, {'requests': 0, 'connections': 0, 'reused': 0})
+			stats['requests'] += 1
+			stats['connections'] += new_connections
+			if not new_connections:
+				stats['reused'] += 1
+		return response
+
+	def get_stats(self):
+		""" Returns a copy of the per host statistics """
+		with self._stats_lock:
+			return dict((host, dict(stats)) for host, stats in self._stats.items())
 
 
 _default_token_file = '.o365_token'
@@ -50,8 +199,7 @@ def save_token(token, token_path=None):
 	if not token_path:
 		token_path = default_token_path
 
-	with open(token_path, 'w') as token_file:
-		json.dump(token, token_file, indent=True)
+	FileTokenStore(token_path).save(token)
 
 
 def load_token(token_path=None):
@@ -62,11 +210,7 @@ def load_token(token_path=None):
 	if not token_path:
 		token_path = default_token_path
 
-	token = None
-	if path.exists(token_path):
-		with open(token_path, 'r') as token_file:
-			token = json.load(token_file)
-	return token
+	return FileTokenStore(token_path).load()
 
 
 def delete_token(token_path=None):
@@ -77,17 +221,22 @@ def delete_token(token_path=None):
 	if not token_path:
 		token_path = default_token_path
 
-	if path.exists(token_path):
-		os.unlink(token_path)
+	FileTokenStore(token_path).delete()
 
 
-class Connection(with_metaclass(Singleton)):
-	_oauth2_authorize_url = 'https://login.microsoftonline.com/common/oauth2/v2.0/authorize'
-	_oauth2_token_url = 'https://login.microsoftonline.com/common/oauth2/v2.0/token'
+class Connection(with_metaclass(ConnectionRegistry)):
+	_oauth2_authorize_url = _oauth2_login_url + 'common/oauth2/v2.0/authorize'
+	_oauth2_token_url = _oauth2_login_url + 'common/oauth2/v2.0/token'
 	default_headers = None
+	# the OAuth token is refreshed this many seconds before it expires
+	refresh_margin = 60
 
-	def __init__(self):
-		""" Creates a O365 connection object """
+	def __init__(self, name=None):
+		""" Creates a O365 connection object, use Connection(name) to get a registered one
+
+		:param name: name the connection is registered under, None for the default connection
+		"""
+		self.name = name
 		self.api_version = None
 		self.auth = None
 
@@ -96,7 +245,24 @@ class Connection(with_metaclass(Singleton)):
 		self.client_secret = None
 		self.token = None
 		self.token_path = None
+		self.token_store = None
 		self.proxy_dict = None
+		self._token_lock = threading.Lock()
+
+		self.pool_settings = {
+			'pool_connections': 10,
+			'pool_maxsize': 10,
+			'pool_block': False,
+			'keep_alive': True,
+		}
+		self.session = None
+		self.adapter = None
+		self._pool_lock = threading.RLock()
+
+		self.retry_policy = RetryPolicy()
+		self.rate_limiter = None
+		self.cache = None
+		self._claims_cache = None
 
 	def is_valid(self):
 		valid = False
@@ -108,49 +274,52 @@ class Connection(with_metaclass(Singleton)):
 
 		return valid
 
-	@staticmethod
-	def login(username, password):
+	@connection_method
+	def login(self, username, password):
 		""" Connect to office 365 using specified username and password
 
 		:param username: username to login with
 		:param password: password for authentication
 		"""
-		connection = Connection()
-
-		connection.api_version = '1.0'
-		connection.auth = (username, password)
-		return connection
+		self.api_version = '1.0'
+		self.auth = (username, password)
+		return self
 
-	@staticmethod
-	def oauth2(client_id, client_secret, store_token=True, token_path=None):
+	@connection_method
+	def oauth2(self, client_id, client_secret, store_token=True, token_path=None, token_store=None):
 		""" Connect to office 365 using specified Open Authentication protocol
 
 		:param client_id: application_id generated by https://apps.dev.microsoft.com when you register your app
 		:param client_secret: secret password key generated for your application
 		:param store_token: whether or not to store the token in file system, so u don't have to keep opening
 			the auth link and authenticating every time
-		:param token_path: full path to where the token should be saved to
+		:param token_path: full path to where the token should be saved to, named connections default
+			to their own file next to the default one
+		:param token_store: an O365.token_store.TokenStore to keep the token in instead of the
+			token_path file, e.g. a SqliteTokenStore shared by several processes
 		"""
-		connection = Connection()
+		if not token_path and self.name:
+			token_path = '{}_{}'.format(default_token_path, self.name)
 
-		connection.api_version = '2.0'
-		connection.client_id = client_id
-		connection.client_secret = client_secret
-		connection.token_path = token_path
+		self.api_version = '2.0'
+		self.client_id = client_id
+		self.client_secret = client_secret
+		self.token_path = token_path
+		self.token_store = token_store or FileTokenStore(token_path or default_token_path)
 
 		if not store_token:
-			delete_token(token_path)
+			self.token_store.delete()
 
-		token = load_token(token_path)
+		token = self.token_store.load()
 
 		if not token:
-			connection.oauth = OAuth2Session(client_id=client_id,
-											 redirect_uri='https://outlook.office365.com/owa/',
-											 scope=['https://graph.microsoft.com/Mail.ReadWrite',
-													'https://graph.microsoft.com/Mail.Send',
-													'https://graph.microsoft.com/Calendars.ReadWrite',
-													'offline_access'], )
-			oauth = connection.oauth
+			self.oauth = OAuth2Session(client_id=client_id,
+									   redirect_uri='https://outlook.office365.com/owa/',
+									   scope=['https://graph.microsoft.com/Mail.ReadWrite',
+											  'https://graph.microsoft.com/Mail.Send',
+											  'https://graph.microsoft.com/Calendars.ReadWrite',
+											  'offline_access'], )
+			oauth = self.oauth
 			auth_url, state = oauth.authorization_url(
 				url=Connection._oauth2_authorize_url,
 				access_type='offline')
@@ -159,15 +328,16 @@ class Connection(with_metaclass(Singleton)):
 			os.environ['OAUTHLIB_RELAX_TOKEN_SCOPE'] = 'Y'
 			token = oauth.fetch_token(token_url=Connection._oauth2_token_url,
 									  authorization_response=auth_resp, client_secret=client_secret)
-			save_token(token, token_path)
+			self.token_store.save(token)
 		else:
-			connection.oauth = OAuth2Session(client_id=client_id,
-											 token=token)
+			self.oauth = OAuth2Session(client_id=client_id,
+									   token=token)
 
-		return connection
+		self._mount_pool(self.oauth)
+		return self
 
-	@staticmethod
-	def proxy(url, port, username, password):
+	@connection_method
+	def proxy(self, url, port, username, password):
 		""" Connect to Office 365 though the specified proxy
 
 		:param url: url of the proxy server
@@ -175,108 +345,447 @@ class Connection(with_metaclass(Singleton)):
 		:param username: username for authentication in the proxy server
 		:param password: password for the specified username
 		"""
-		connection = Connection()
-
-		connection.proxy_dict = {
+		self.proxy_dict = {
 			"http": "http://{}:{}@{}:{}".format(username, password, url, port),
 			"https": "https://{}:{}@{}:{}".format(username, password, url,
 												  port),
 		}
-		return connection
+		if self.session:
+			self.session.proxies.update(self.proxy_dict)
+		return self
+
+	@connection_method
+	def configure_pool(self, pool_connections=10, pool_maxsize=10, pool_block=False, keep_alive=True):
+		""" Configure the connection pool shared by every request made through this connection
+
+		:param pool_connections: number of hosts to keep a connection pool for
+		:param pool_maxsize: maximum number of connections kept open per host
+		:param pool_block: whether to wait for a free connection when a host's pool is exhausted
+			instead of opening a throw-away one
+		:param keep_alive: whether to keep connections open between requests
+		"""
+		with self._pool_lock:
+			self.pool_settings = {
+				'pool_connections': pool_connections,
+				'pool_maxsize': pool_maxsize,
+				'pool_block': pool_block,
+				'keep_alive': keep_alive,
+			}
+			if self.session:
+				self.session.close()
+			replaced = self.adapter
+			self.session = None
+			self.adapter = None
+
+			if self.oauth:
+				self._mount_pool(self.oauth)
+			if replaced is not None:
+				# the OAuth session was the last one using it
+				replaced.close()
+		return self
+
+	@connection_method
+	def get_session(self):
+		""" Returns the pooled session used for basic authentication requests, creating it if needed
+
+		:return: requests.Session
+		"""
+		with self._pool_lock:
+			if self.session is None:
+				session = requests.Session()
+				self._mount_pool(session)
+				if self.proxy_dict:
+					session.proxies.update(self.proxy_dict)
+				self.session = session
+		return self.session
+
+	@connection_method
+	def pool_stats(self):
+		""" Returns how pooled connections have been used so far, per host
+
+		:return: dictionary of host -> {'requests': .., 'connections': .., 'reused': ..}
+		"""
+		if self.adapter is None:
+			return {}
+		return self.adapter.get_stats()
 
-	@staticmethod
-	def get_response(request_url, **kwargs):
-		""" Fetches the response for specified url and arguments, adding the auth and proxy information to the url
+	def _mount_pool(self, session):
+		""" Makes the given session use the connection pool of this connection
+
+		:param session: requests.Session (or OAuth2Session) to configure
+		"""
+		with self._pool_lock:
+			if self.adapter is None:
+				settings = self.pool_settings
+				self.adapter = PooledAdapter(pool_connections=settings['pool_connections'],
+											 pool_maxsize=settings['pool_maxsize'],
+											 pool_block=settings['pool_block'],
+											 owner=self)
+			session.mount('https://', self.adapter)
+			session.mount('http://', self.adapter)
+			if not self.pool_settings['keep_alive']:
+				session.headers['Connection'] = 'close'
+			elif session.headers.get('Connection') == 'close':
+				# set by a previous configuration without keep alive
+				del session.headers['Connection']
+
+	@connection_method
+	def set_retry_policy(self, policy):
+		""" Set the policy used to retry throttled or failed requests
+
+		:param policy: O365.retry.RetryPolicy instance, None to never retry
+		"""
+		self.retry_policy = policy
+		return self
 
+	@connection_method
+	def retry_stats(self):
+		""" Returns the counters of the retry policy
+
+		:return: dictionary with the no.of retries, throttled responses, seconds spent throttled and
+			requests given up on
+		"""
+		if self.retry_policy is None:
+			return {}
+		return self.retry_policy.get_stats()
+
+	@connection_method
+	def set_rate_limiter(self, limiter):
+		""" Set the rate limiter pacing every request made through the connection pool
+
+		:param limiter: O365.ratelimit.RateLimiter, or any object with an acquire(mailbox, tenant)
+			method blocking until the request may be sent. None to disable
+		"""
+		self.rate_limiter = limiter
+		return self
+
+	@connection_method
+	def rate_limit_stats(self):
+		""" Returns the histogram of the time spent waiting for the rate limiter
+
+		:return: dictionary with the no.of waits, their sum and the cumulative buckets
+		"""
+		if self.rate_limiter is None or not hasattr(self.rate_limiter, 'get_stats'):
+			return {}
+		return self.rate_limiter.get_stats()
+
+	@connection_method
+	def set_cache(self, cache):
+		""" Set the cache of the list responses that rarely change (mail folders, calendars)
+
+		:param cache: O365.cache.ResponseCache, None to disable
+		"""
+		self.cache = cache
+		return self
+
+	@connection_method
+	def cache_stats(self):
+		""" Returns the counters of the response cache
+
+		:return: dictionary with the no.of responses served from the cache, revalidated and downloaded
+		"""
+		if self.cache is None:
+			return {}
+		return self.cache.get_stats()
+
+	def _claims(self):
+		""" Returns the claims of the current access token, parsed once per token """
+		access_token = self.oauth.access_token if self.oauth else None
+		cached = self._claims_cache
+		if cached is None or cached[0] != access_token:
+			cached = self._claims_cache = (access_token, _token_claims(access_token))
+		return cached[1]
+
+	def tenant(self):
+		""" Returns the key of the tenant the connection works for: the tenant id (tid) of the OAuth
+		access token, the client id if the token doesn't tell, or the domain of the basic
+		authentication user """
+		if self.api_version == '2.0':
+			return self._claims().get('tid') or self.client_id
+		if self.auth:
+			return self.auth[0].split('@')[-1].lower()
+		return None
+
+	def mailbox(self, request_url):
+		""" Returns the key of the mailbox a request is for: the user id of /users/{id}/ urls, for
+		/me/ urls the signed in user (oid of the OAuth access token, or the basic authentication
+		user), so the delegated users of an app don't share a mailbox
+
+		:param request_url: url of the request
+		"""
+		mailbox = mailbox_from_url(request_url)
+		if mailbox != 'me':
+			return mailbox
+		if self.api_version == '2.0':
+			claims = self._claims()
+			user = claims.get('oid') or claims.get('sub')
+			# tokens that aren't JWTs: at least one mailbox per connection
+			return user.lower() if user else 'me {}'.format(self.name)
+		if self.auth:
+			return self.auth[0].lower()
+		return mailbox
+
+	@connection_method
+	def send_request(self, method, request_url, data=None, idempotent=None, **kwargs):
+		""" Sends a request to the specified url, adding the auth and proxy information to it
+
+		Throttled (429, 503) and failed requests are retried as decided by the retry policy.
+
+		:param method: HTTP method to use (GET, POST, PATCH, DELETE...)
 		:param request_url: url to request
+		:param data: body to send, if any
+		:param idempotent: whether the request can be safely sent again, guessed from the method if None
 		:param kwargs: any keyword arguments to pass to the requests api
 		:return: response object
 		"""
-		connection = Connection()
-
-		if not connection.is_valid():
+		if not self.is_valid():
 			raise RuntimeError('Connection is not configured, please use "O365.Connection" '
 							   'to set username and password or OAuth2 authentication')
 
 		con_params = {}
-		if connection.proxy_dict:
-			con_params['proxies'] = connection.proxy_dict
-		if connection.default_headers:
-			con_params['headers'] = connection.default_headers
+		if self.proxy_dict:
+			con_params['proxies'] = self.proxy_dict
+		if self.default_headers:
+			con_params['headers'] = self.default_headers
 		con_params.update(kwargs)
+		if data is not None:
+			con_params['data'] = data
 
+		policy = self.retry_policy
+		mailbox = self.mailbox(request_url)
+		attempt = 0
+		while True:
+			try:
+				response = self._send_once(method, request_url, con_params)
+			except (requests.ConnectionError, requests.Timeout) as e:
+				delay = policy.get_delay(method, attempt, mailbox, error=e,
+										 idempotent=idempotent) if policy else None
+				if delay is None:
+					raise
+			else:
+				delay = policy.get_delay(method, attempt, mailbox, response=response,
+										 idempotent=idempotent) if policy else None
+				if delay is None:
+					break
+			policy.sleep(delay)
+			attempt += 1
+
+		if response.status_code == 401:
+			raise RuntimeError('API returned status code 401 Unauthorized, check the connection credentials')
+		if response.status_code in (429, 503):
+			raise RuntimeError('API returned status code {}, the requests are being throttled'.format(
+				response.status_code))
+
+		return response
+
+	def _send_once(self, method, request_url, con_params):
+		""" Sends a single request, refreshing the OAuth token if it expired """
 		log.info('Requesting URL: {}'.format(request_url))
 
-		if connection.api_version == '1.0':
-			con_params['auth'] = connection.auth
-			response = requests.get(request_url, **con_params)
+		if self.api_version == '1.0':
+			con_params['auth'] = self.auth
+			response = self.get_session().request(method, request_url, **con_params)
 		else:
+			access_token = self._fresh_token()
 			try:
-				response = connection.oauth.get(request_url, **con_params)
+				response = self.oauth.request(method, request_url, **con_params)
 			except TokenExpiredError:
 				log.info('Token is expired, fetching a new token')
-				token = connection.oauth.refresh_token(Connection._oauth2_token_url, client_id=connection.client_id,
-													   client_secret=connection.client_secret)
-				log.info('New token fetched')
-				save_token(token, connection.token_path)
+				self.refresh_token(access_token)
 
-				response = connection.oauth.get(request_url, **con_params)
+				response = self.oauth.request(method, request_url, **con_params)
 
 		log.info('Received response from URL {}'.format(response.url))
+		return response
 
-		if response.status_code == 401:
-			raise RuntimeError('API returned status code 401 Unauthorized, check the connection credentials')
+	def _fresh_token(self):
+		""" Refreshes the OAuth token ahead of time when it is about to expire
 
-		response_json = response.json()
-		if 'value' not in response_json:
-			raise RuntimeError('Something went wrong, received an unexpected result \n{}'.format(response_json))
+		:return: the access token the request will be sent with
+		"""
+		token = self.oauth.token or {}
+		expires_at = token.get('expires_at')
+		if expires_at and token.get('refresh_token') and expires_at - self.refresh_margin <= time.time():
+			log.info('Token is about to expire, fetching a new token')
+			self.refresh_token(token.get('access_token'))
+		return self.oauth.access_token
+
+	@connection_method
+	def refresh_token(self, expired_access_token=None):
+		""" Fetches a new OAuth token and saves it, once for all the threads finding the token expired
+
+		Threads calling this while a refresh is in flight wait for it and reuse the new token, and so
+		do the other processes sharing the token store.
+
+		:param expired_access_token: the access token found expired, the refresh is skipped if the
+			current token is another one, i.e. it was already refreshed. Always refreshes if None
+		:return: the token dictionary
+		"""
+		store = self.token_store or FileTokenStore(self.token_path or default_token_path)
+		with self._token_lock, store.lock():
+			if expired_access_token is not None and self.oauth.access_token != expired_access_token:
+				log.debug('Token was already refreshed by another thread')
+				return self.oauth.token
+
+			# forced refreshes (None) never reuse a stored token, which may be the one being replaced
+			stored = store.load() if expired_access_token is not None else None
+			if stored and stored.get('access_token') != expired_access_token and \
+					(stored.get('expires_at') or float('inf')) - self.refresh_margin > time.time():
+				log.info('Token was already refreshed by another process')
+				self.oauth.token = stored
+				return stored
+
+			token = self.oauth.refresh_token(Connection._oauth2_token_url, client_id=self.client_id,
+											 client_secret=self.client_secret)
+			log.info('New token fetched')
+			store.save(token)
+			return token
+
+	@connection_method
+	def get_response(self, request_url, **kwargs):
+		""" Fetches the response for specified url and arguments, adding the auth and proxy information to the url
 
-		response_values = [MicroDict(x) for x in response_json['value']]
+		:param request_url: url to request
+		:param kwargs: any keyword arguments to pass to the requests api, or cached (see get_page)
+		:return: response object
+		"""
+		response_values, next_link = self.get_page(request_url, **kwargs)
 		return response_values
 
-	@staticmethod
-	def post_data(request_url, data, **kwargs):
-		""" Posts data for specified url, data and arguments, adding the auth and proxy information to the url
+	@connection_method
+	def get_page(self, request_url, cached=False, **kwargs):
+		""" Fetches a single page of results for specified url and arguments
 
 		:param request_url: url to request
-		:param data: data to post
+		:param cached: serve the page from the response cache of the connection, if one is set
 		:param kwargs: any keyword arguments to pass to the requests api
-		:return: response object
+		:return: tuple of the page values and the url of the next page (None on the last page)
 		"""
-		connection = Connection()
+		if cached and self.cache is not None:
+			response_json = json.loads(self._cached_body(request_url, kwargs), object_hook=micro_object)
+		else:
+			response = self.send_request('GET', request_url, **kwargs)
+			response_json = response.json(object_hook=micro_object)
+		if 'value' not in response_json:
+			raise RuntimeError('Something went wrong, received an unexpected result \n{}'.format(response_json))
 
-		if not connection.is_valid():
-			raise RuntimeError('Connection is not configured, please use "O365.Connection" '
-							   'to set username and password or OAuth2 authentication')
+		return response_json['value'], response_json.get('@odata.nextLink')
 
-		con_params = {}
-		if connection.proxy_dict:
-			con_params['proxies'] = connection.proxy_dict
-		if connection.default_headers:
-			con_params['headers'] = connection.default_headers
-		con_params.update(kwargs)
+	def _cache_identity(self, auth=None):
+		""" Returns who the cached responses belong to, so connections sharing a cache never read each
+		other's responses: the basic authentication user, or for OAuth the connection name and token
+		file with the tenant and user of the access token (every user of an app shares its client id)
+		"""
+		auth = auth or self.auth
+		if auth:
+			return auth[0]
+		claims = self._claims()
+		return '{} {} {} {} {}'.format(self.name, self.client_id, self.token_path, claims.get('tid'),
+									   claims.get('oid') or claims.get('sub'))
+
+	def _cached_body(self, request_url, kwargs):
+		""" Returns the body of a GET request from the cache, asking the server only when the cached
+		response is older than the ttl, with its ETag so an unchanged response is a 304 without body """
+		params = kwargs.get('params') or {}
+		key = '{} {} {}'.format(self._cache_identity(kwargs.get('auth')), request_url,
+								'&'.join('{}={}'.format(k, params[k]) for k in sorted(params)))
+
+		entry, fresh = self.cache.lookup(key)
+		if fresh:
+			log.debug('Serving {} from the cache'.format(request_url))
+			self.cache.count('hits')
+			return entry['body']
+
+		if entry is not None and entry.get('etag'):
+			headers = dict(self.default_headers or {})
+			headers.update(kwargs.get('headers') or {})
+			headers['If-None-Match'] = entry['etag']
+			kwargs = dict(kwargs, headers=headers)
+
+		response = self.send_request('GET', request_url, **kwargs)
+		if response.status_code == 304 and entry is not None:
+			log.debug('{} is unchanged'.format(request_url))
+			self.cache.count('revalidated')
+			self.cache.touch(key, entry)
+			return entry['body']
+
+		self.cache.count('misses')
+		if response.status_code == 200:
+			self.cache.store(key, response.text, response.headers.get('ETag'))
+		return response.text
+
+	@connection_method
+	def iter_response(self, request_url, page_size=None, max_items=None, stream=False, cached=False, **kwargs):
+		""" Lazily iterates over all the results for specified url, following the server side next links
+
+		Only one page of results is held in memory at a time, or only one result with stream.
 
-		log.info('Requesting URL: {}'.format(request_url))
+		:param request_url: url to request
+		:param page_size: number of results to ask for per page, the server default is used if None
+		:param max_items: stop after this many results, no limit if None
+		:param stream: parse the results one at a time while they are received instead of parsing
+			whole pages, for pages too large to be held in memory
+		:param cached: serve the pages from the response cache of the connection, see get_page
+		:param kwargs: any keyword arguments to pass to the requests api
+		:return: generator of results
+		"""
+		if page_size and max_items is not None:
+			page_size = min(page_size, max_items)
+		if page_size:
+			params = dict(kwargs.get('params') or {})
+			params['$top'] = page_size
+			kwargs['params'] = params
+
+		count = 0
+		next_link = request_url
+		while next_link and (max_items is None or count < max_items):
+			if stream:
+				fields = {}
+				page = self._stream_page(next_link, fields, **kwargs)
+			else:
+				page, next_link = self.get_page(next_link, cached=cached, **kwargs)
+			# the next link already carries the query of the first request
+			kwargs.pop('params', None)
 
-		if connection.api_version == '1.0':
-			con_params['auth'] = connection.auth
-			response = requests.post(request_url, data, **con_params)
-		else:
 			try:
-				response = connection.oauth.post(request_url, data, **con_params)
-			except TokenExpiredError:
-				log.info('Token is expired, fetching a new token')
-				token = connection.oauth.refresh_token(Connection._oauth2_token_url, client_id=connection.client_id,
-													   client_secret=connection.client_secret)
-				log.info('New token fetched')
-				save_token(token, connection.token_path)
+				for value in page:
+					if max_items is not None and count >= max_items:
+						return
+					count += 1
+					yield value
+			finally:
+				if stream:
+					page.close()
 
-				response = connection.oauth.post(request_url, data, **con_params)
+			if stream:
+				next_link = fields.get('@odata.nextLink')
 
-		log.info('Received response from URL {}'.format(response.url))
+	def _stream_page(self, request_url, fields, chunk_size=65536, **kwargs):
+		""" Yields the results of a single page while they are received
 
-		if response.status_code == 401:
-			raise RuntimeError('API returned status code 401 Unauthorized, check the connection credentials')
+		:param request_url: url to request
+		:param fields: dictionary receiving the other members of the page, like the next link
+		:param chunk_size: no.of bytes read from the socket at a time
+		:param kwargs: any keyword arguments to pass to the requests api
+		:return: generator of results
+		"""
+		response = self.send_request('GET', request_url, stream=True, **kwargs)
+		try:
+			for value in iter_values(response.iter_content(chunk_size), fields, object_hook=micro_object):
+				yield value
+		finally:
+			response.close()
+
+	@connection_method
+	def post_data(self, request_url, data, **kwargs):
+		""" Posts data for specified url, data and arguments, adding the auth and proxy information to the url
+
+		:param request_url: url to request
+		:param data: data to post
+		:param kwargs: any keyword arguments to pass to the requests api
+		:return: response object
+		"""
+		response = self.send_request('POST', request_url, data, **kwargs)
 
 		response_json = response.json()
 		if 'id' not in response_json:
@@ -284,8 +793,8 @@ class Connection(with_metaclass(Singleton)):
 
 		return response_json
 
-	@staticmethod
-	def patch_data(request_url, data, **kwargs):
+	@connection_method
+	def patch_data(self, request_url, data, **kwargs):
 		""" Patches for specified url, data and arguments, adding the auth and proxy information to the url
 
 		:param request_url: url to request
@@ -293,40 +802,7 @@ class Connection(with_metaclass(Singleton)):
 		:param kwargs: any keyword arguments to pass to the requests api
 		:return: response object
 		"""
-		connection = Connection()
-
-		if not connection.is_valid():
-			raise RuntimeError('Connection is not configured, please use "O365.Connection" '
-							   'to set username and password or OAuth2 authentication')
-
-		con_params = {}
-		if connection.proxy_dict:
-			con_params['proxies'] = connection.proxy_dict
-		if connection.default_headers:
-			con_params['headers'] = connection.default_headers
-		con_params.update(kwargs)
-
-		log.info('Requesting URL: {}'.format(request_url))
-
-		if connection.api_version == '1.0':
-			con_params['auth'] = connection.auth
-			response = requests.patch(request_url, data, **con_params)
-		else:
-			try:
-				response = connection.oauth.patch(request_url, data, **con_params)
-			except TokenExpiredError:
-				log.info('Token is expired, fetching a new token')
-				token = connection.oauth.refresh_token(Connection._oauth2_token_url, client_id=connection.client_id,
-													   client_secret=connection.client_secret)
-				log.info('New token fetched')
-				save_token(token, connection.token_path)
-
-				response = connection.oauth.patch(request_url, data, **con_params)
-
-		log.info('Received response from URL {}'.format(response.url))
-
-		if response.status_code == 401:
-			raise RuntimeError('API returned status code 401 Unauthorized, check the connection credentials')
+		response = self.send_request('PATCH', request_url, data, **kwargs)
 
 		response_json = response.json()
 		if 'id' not in response_json:
@@ -334,48 +810,15 @@ class Connection(with_metaclass(Singleton)):
 
 		return response_json
 
-	@staticmethod
-	def delete_data(request_url, **kwargs):
+	@connection_method
+	def delete_data(self, request_url, **kwargs):
 		""" Deletes data for specified url and arguments, adding the auth and proxy information to the url
 
 		:param request_url: url to request
 		:param kwargs: any keyword arguments to pass to the requests api
 		:return: True if it worked
 		"""
-		connection = Connection()
-
-		if not connection.is_valid():
-			raise RuntimeError('Connection is not configured, please use "O365.Connection" '
-							   'to set username and password or OAuth2 authentication')
-
-		con_params = {}
-		if connection.proxy_dict:
-			con_params['proxies'] = connection.proxy_dict
-		if connection.default_headers:
-			con_params['headers'] = connection.default_headers
-		con_params.update(kwargs)
-
-		log.info('Requesting URL: {}'.format(request_url))
-
-		if connection.api_version == '1.0':
-			con_params['auth'] = connection.auth
-			response = requests.delete(request_url, **con_params)
-		else:
-			try:
-				response = connection.oauth.delete(request_url, **con_params)
-			except TokenExpiredError:
-				log.info('Token is expired, fetching a new token')
-				token = connection.oauth.refresh_token(Connection._oauth2_token_url, client_id=connection.client_id,
-													   client_secret=connection.client_secret)
-				log.info('New token fetched')
-				save_token(token, connection.token_path)
-
-				response = connection.oauth.delete(request_url, **con_params)
-
-		log.info('Received response from URL {}'.format(response.url))
-
-		if response.status_code == 401:
-			raise RuntimeError('API returned status code 401 Unauthorized, check the connection credentials')
+		response = self.send_request('DELETE', request_url, **kwargs)
 
 		if response.status_code != 204:
 			raise RuntimeError("Something went wrong, unable to delete data")
@@ -1,4 +1,4 @@
-import requests
+from O365.connection import Connection
 import base64
 import json
 import logging
@@ -45,7 +45,7 @@ class Contact( object ):
 		headers = {'Content-type': 'application/json', 'Accept': 'text/plain'}
 
 		log.debug('preparing to delete contact.')
-		response = requests.delete(self.con_url.format(str(self.contactId)),headers=headers,auth=self.auth,verify=self.verify)
+		response = Connection.get_session().delete(self.con_url.format(str(self.contactId)),headers=headers,auth=self.auth,verify=self.verify)
 		log.debug('response from delete attempt: {0}'.format(str(response)))
 
 		return response.status_code == 204
@@ -62,7 +62,7 @@ class Contact( object ):
 
 		response = None
 		try:
-			response = requests.patch(self.con_url.format(str(self.contactId)),data,headers=headers,auth=self.auth,verify=self.verify)
+			response = Connection.get_session().patch(self.con_url.format(str(self.contactId)),data,headers=headers,auth=self.auth,verify=self.verify)
 			log.debug('sent update request')
 		except Exception as e:
 			if response:
@@ -87,7 +87,7 @@ class Contact( object ):
 
 		response = None
 		try:
-			response = requests.post(self.con_url.format(str(self.contactId)),data,headers=headers,auth=self.auth,verify=self.verify)
+			response = Connection.get_session().post(self.con_url.format(str(self.contactId)),data,headers=headers,auth=self.auth,verify=self.verify)
 			log.debug('sent create request')
 		except Exception as e:
 			if response:
@@ -52,7 +52,7 @@ class Event( object ):
 	delete_url = 'https://outlook.office365.com/api/v1.0/me/events/{0}'
 
 
-	def __init__(self,json=None,auth=None,cal=None,verify=True):
+	def __init__(self,json=None,auth=None,cal=None,verify=True,connection=None):
 		'''
 		Creates a new event wrapper.
 
@@ -62,9 +62,12 @@ class Event( object ):
 			auth (default = None) -- a (email,password) tuple which will be used for authentication
 			to office365.
 			cal (default = None) -- an instance of the calendar for this event to associate with.
+			connection (default = None) -- the Connection to use, the one of the calendar or the
+			default connection if None.
 		'''
 		self.auth = auth
 		self.calendar = cal
+		self.connection = connection or getattr(cal, 'connection', None) or Connection()
 		self.attendees = []
 
 		if json:
@@ -92,7 +95,7 @@ class Event( object ):
 		default is specified, then the event cannot be created.
 
 		'''
-		connection = Connection()
+		connection = self.connection
 
 		# Change URL if we use Oauth
 		if connection.is_valid() and connection.oauth != None:
@@ -134,12 +137,12 @@ class Event( object ):
 			return False
 
 		log.debug('response to event creation: %s',str(response))
-		return Event(response.json(),self.auth,calendar)
+		return Event(response.json(),self.auth,calendar,connection=connection)
 
 	def update(self):
 		'''Updates an event that already exists in a calendar.'''
 
-		connection = Connection()
+		connection = self.connection
 
 		# Change URL if we use Oauth
 		if connection.is_valid() and connection.oauth != None:
@@ -172,18 +175,21 @@ class Event( object ):
 
 		log.debug('response to event creation: %s',str(response))
 
-		return Event(json.dumps(response),self.auth)
+		return Event(json.dumps(response),self.auth,connection=connection)
 
 
-	def delete(self):
+	def delete(self, batch=None):
 		'''
 		Delete's an event from the calendar it is in.
 
 		But leaves you this handle. You could then change the calendar and transfer the event to
 		that new calendar. You know, if that's your thing.
+
+		batch -- an O365.batch.Batch to queue the deletion in instead of sending it right away, the
+		queued BatchRequest is returned then.
 		'''
 
-		connection = Connection()
+		connection = self.connection
 
 		# Change URL if we use Oauth
 		if connection.is_valid() and connection.oauth != None:
@@ -192,6 +198,9 @@ class Event( object ):
 		elif not self.auth:
 			return False
 
+		if batch is not None:
+			return batch.add('DELETE', self.delete_url.format(self.json['id']), target=self)
+
 		headers = {'Content-type': 'application/json', 'Accept': 'text/plain'}
 
 		response = None
@@ -1,7 +1,10 @@
 import logging
+from collections import OrderedDict
 
-from O365.connection import Connection
+from O365.connection import Connection, micro_object
+from O365.folders import FolderIndex
 from O365.fluent_message import Message
+from O365.sync import SyncResult
 
 log = logging.getLogger(__name__)
 
@@ -35,38 +38,58 @@ class FluentInbox(object):
 		'user_child_folders': {
 			'1.0': 'https://outlook.office365.com/api/v1.0/users/{user_id}/Folders/{folder_id}/childfolders',
 			'2.0': 'https://graph.microsoft.com/v1.0/users/{user_id}/MailFolders/{folder_id}/childfolders',
+		},
+		'inbox_delta': {
+			'1.0': None,
+			'2.0': 'https://graph.microsoft.com/v1.0/me/MailFolders/inbox/messages/delta',
 		}
 	}
 
-	def __init__(self, verify=True):
+	# no.of messages asked for by the first request of a query (more if the fetch asks for more), the
+	# server keeps it for the following pages
+	page_size = 50
+
+	def __init__(self, verify=True, connection=None, folder_index=None):
 		""" Creates a new inbox wrapper.
 
 		:param verify: whether or not to verify SSL certificate
+		:param connection: the Connection to use, the default connection if None
+		:param folder_index: FolderIndex resolving the folders without requests, can be shared by
+			many inboxes. One is crawled the first time a folder path is used if None
 		"""
-		self.url = FluentInbox._get_url('inbox')
+		self.connection = connection or Connection()
+		self.folder_index = folder_index
+		# folder indexes crawled for the other mailboxes, by user id
+		self._folder_indexes = {}
+		self.url = self._get_url('inbox')
 		self.fetched_count = 0
 		self._filter = ''
 		self._search = ''
+		self._select = ()
 		self.verify = verify
 		self.messages = []
+		self._reset_cursor()
 
 	def from_folder(self, folder_name, user_id=None):
 		""" Configure to use this folder for fetching the mails
 
-		:param folder_name: name of the outlook folder
+		:param folder_name: name of the outlook folder, or its path like 'Inbox/Clients/Acme'
 		:param user_id: user id the folder belongs to (shared mailboxes)
 		"""
 		self._reset()
 
-		folder_id = self.get_folder(value=folder_name,
-									by='DisplayName',
-									user_id=user_id)['Id']
+		if self.folder_index is not None or FolderIndex.separator in folder_name:
+			folder_id = self._folder_index(user_id).get(folder_name)['Id']
+		else:
+			folder_id = self.get_folder(value=folder_name,
+										by='DisplayName',
+										user_id=user_id)['Id']
 
 		if user_id:
-			self.url = FluentInbox._get_url('user_folder').format(
+			self.url = self._get_url('user_folder').format(
 				user_id=user_id, folder_id=folder_id)
 		else:
-			self.url = FluentInbox._get_url('folder').format(
+			self.url = self._get_url('folder').format(
 				folder_id=folder_id)
 
 		return self
@@ -90,21 +113,28 @@ class FluentInbox(object):
 		:param user_id: user id the folder belongs to (shared mailboxes)
 		:returns: Single folder data
 		"""
+		index = self.folder_index
+		if index is not None and index.user_id == user_id and by in ('Id', 'DisplayName'):
+			if by == 'DisplayName' and parent_id:
+				value = index.path(parent_id) + index.separator + value
+			return index.get(value)
+
 		if parent_id and user_id:
-			folders_url = FluentInbox._get_url('user_child_folders').format(
+			folders_url = self._get_url('user_child_folders').format(
 				folder_id=parent_id, user_id=user_id)
 		elif parent_id:
-			folders_url = FluentInbox._get_url('child_folders').format(
+			folders_url = self._get_url('child_folders').format(
 				folder_id=parent_id)
 		elif user_id:
-			folders_url = FluentInbox._get_url('user_folders').format(
+			folders_url = self._get_url('user_folders').format(
 				user_id=user_id)
 		else:
-			folders_url = FluentInbox._get_url('folders')
+			folders_url = self._get_url('folders')
 
-		response = Connection.get_response(folders_url,
-										   verify=self.verify,
-										   params={'$top': 100})
+		response = self.connection.iter_response(folders_url,
+											verify=self.verify,
+											page_size=100,
+											cached=True)
 
 		folder_id = None
 		all_folders = []
@@ -126,20 +156,21 @@ class FluentInbox(object):
 		:return: List of all folder data
 		"""
 		if parent_id and user_id:
-			folders_url = FluentInbox._get_url('user_child_folders').format(
+			folders_url = self._get_url('user_child_folders').format(
 				folder_id=parent_id, user_id=user_id)
 		elif parent_id:
-			folders_url = FluentInbox._get_url('child_folders').format(
+			folders_url = self._get_url('child_folders').format(
 				folder_id=parent_id)
 		elif user_id:
-			folders_url = FluentInbox._get_url('user_folders').format(
+			folders_url = self._get_url('user_folders').format(
 				user_id=user_id)
 		else:
-			folders_url = FluentInbox._get_url('folders')
+			folders_url = self._get_url('folders')
 
-		response = Connection.get_response(folders_url,
-										   verify=self.verify,
-										   params={'$top': 100})
+		response = self.connection.iter_response(folders_url,
+											verify=self.verify,
+											page_size=100,
+											cached=True)
 
 		folders = []
 		for folder in response:
@@ -147,6 +178,21 @@ class FluentInbox(object):
 
 		return folders
 
+	def _folder_index(self, user_id=None):
+		""" Returns the folder index of the mailbox, crawling the folders the first time it is used """
+		if self.folder_index is not None and self.folder_index.user_id == user_id:
+			return self.folder_index
+		index = self._folder_indexes.get(user_id)
+		if index is not None:
+			return index
+
+		index = FolderIndex(self.connection, user_id=user_id, verify=self.verify).load()
+		if self.folder_index is None:
+			self.folder_index = index
+		else:
+			self._folder_indexes[user_id] = index
+		return index
+
 	def filter(self, filter_string):
 		""" Set the value of a filter. More information on what filters are available can be found here:
 		https://msdn.microsoft.com/office/office365/APi/complex-types-for-mail-contacts-calendar#RESTAPIResourcesMessage
@@ -158,6 +204,7 @@ class FluentInbox(object):
 				if that accepts it then you know it works.
 		"""
 		self._filter = filter_string
+		self._reset_cursor()
 		return self
 
 	def search(self, search_string):
@@ -173,6 +220,21 @@ class FluentInbox(object):
 		or directly in your mailbox, if that accepts it then you know it works.
 		"""
 		self._search = search_string
+		self._reset_cursor()
+		return self
+
+	def select(self, *fields):
+		""" Only download the given fields of the messages, e.g. select('Subject', 'From').
+		The other fields are loaded on first access, with a single request per message.
+		Call without fields to download whole messages again.
+
+		:param fields: names of the message fields to download
+		"""
+		if fields and 'HasAttachments' not in fields:
+			# needed by every message wrapper
+			fields = fields + ('HasAttachments',)
+		self._select = fields
+		self._reset_cursor()
 		return self
 
 	def fetch_first(self, count=10):
@@ -181,6 +243,7 @@ class FluentInbox(object):
 		:param count: no.of messages to fetch
 		"""
 		self.fetched_count = 0
+		self._reset_cursor()
 		return self.fetch_next(count=count)
 
 	def skip(self, count):
@@ -189,6 +252,7 @@ class FluentInbox(object):
 		:param count: no.of messages to skip
 		"""
 		self.fetched_count = count
+		self._reset_cursor()
 		return self
 
 	def fetch(self, count=10):
@@ -201,37 +265,149 @@ class FluentInbox(object):
 	def fetch_next(self, count=1):
 		""" Fetch the next n messages after the previous fetch, where n is the specified count
 
+		The first request of a query skips the messages already fetched, the following ones resume
+		from the cursor (next link) returned by the server, so the cost of a page doesn't depend on
+		its offset and new mail arriving between pages doesn't shift the results.
+
 		:param count: no.of messages to fetch
 		"""
-		skip_count = self.fetched_count
-		if self._search:
-			params = {'$filter': self._filter, '$top': count,
-					  '$search': '"{}"'.format(self._search)}
+		connection = self.connection
+		messages = []
+		while len(messages) < count:
+			if not self._page:
+				if not self._load_page(count - len(messages)):
+					break
+			take = count - len(messages)
+			messages.extend(Message(message, connection.auth, oauth=connection.oauth, connection=connection,
+									selected=self._select or None)
+							for message in self._page[:take])
+			del self._page[:take]
+
+		self.fetched_count += len(messages)
+		return messages
+
+	def _load_page(self, count):
+		""" Loads the next page of results into the cursor
+
+		:param count: no.of messages needed if this is the first request of the query, at least
+			page_size are asked for since the next links keep the size of the first page
+		:return: False if there are no more results
+		"""
+		count = max(count, self.page_size)
+		if self._next_link:
+			self._page, self._next_link = self.connection.get_page(self._next_link, verify=self.verify)
+		elif not self._started:
+			if self._search:
+				params = {'$filter': self._filter, '$top': count,
+						  '$search': '"{}"'.format(self._search)}
+			else:
+				params = {'$filter': self._filter, '$top': count,
+						  '$skip': self.fetched_count}
+			if self._select:
+				params['$select'] = ','.join(self._select)
+
+			self._page, self._next_link = self.connection.get_page(self.url, verify=self.verify,
+															   params=params)
 		else:
-			params = {'$filter': self._filter, '$top': count,
-					  '$skip': skip_count}
+			return False
 
-		response = Connection.get_response(self.url, verify=self.verify,
-										   params=params)
-		self.fetched_count += count
+		self._started = True
+		return len(self._page) > 0 or self._next_link is not None
 
-		connection = Connection()
-		messages = []
-		for message in response:
-			messages.append(Message(message, connection.auth, oauth=connection.oauth))
+	def sync(self, state_store, page_size=None):
+		""" Fetches the messages added, changed or removed in the current folder since the last sync
 
-		return messages
+		Uses the Microsoft Graph delta queries: the first sync downloads the whole folder, the
+		following ones only what changed, resuming from the delta link saved in the state store.
+		Filters and searches are not applied to delta queries.
 
-	@staticmethod
-	def _get_url(key):
+		Example:
+			store = FileStateStore('/var/lib/poller/sync.json')
+			changes = inbox.from_folder('Inbox').sync(store)
+			for message in changes.added:
+				print(message.getSubject())
+
+		:param state_store: a StateStore from O365.sync to keep the delta link and seen messages in
+		:param page_size: max no.of messages per response, server default if None
+		:returns: SyncResult with the added, changed and removed messages
+		"""
+		connection = self.connection
+		if connection.api_version != '2.0':
+			raise RuntimeError('Delta sync requires the Microsoft Graph API, please use '
+							   '"Connection.oauth2" to configure the connection')
+
+		key = self.url
+		kwargs = {'verify': self.verify}
+		if page_size:
+			kwargs['headers'] = {'Prefer': 'odata.maxpagesize={}'.format(page_size)}
+
+		request_url = state_store.get_delta_link(key) or self._delta_url()
+		changes = OrderedDict()
+		removed = []
+		delta_link = None
+
+		while request_url:
+			response = self.connection.send_request('GET', request_url, **kwargs)
+
+			if response.status_code == 410:
+				# the delta token expired, the whole folder has to be synced again
+				log.info('Delta token expired for {}, starting a full sync'.format(key))
+				state_store.clear(key)
+				request_url = self._delta_url()
+				changes.clear()
+				del removed[:]
+				continue
+
+			response_json = response.json(object_hook=micro_object)
+			if 'value' not in response_json:
+				raise RuntimeError('Something went wrong, received an unexpected result \n{}'.format(response_json))
+
+			for item in response_json['value']:
+				item_id = item['Id']
+				if '@removed' in item:
+					changes.pop(item_id, None)
+					removed.append(item_id)
+				else:
+					# a message can show up on several pages, the last version wins
+					changes[item_id] = Message(item, connection.auth, oauth=connection.oauth, connection=connection)
+
+			request_url = response_json.get('@odata.nextLink')
+			delta_link = response_json.get('@odata.deltaLink', delta_link)
+
+		result = SyncResult()
+		result.removed = removed
+		for item_id, message in changes.items():
+			if state_store.is_known(key, item_id):
+				result.changed.append(message)
+			else:
+				result.added.append(message)
+
+		# only saved once every page was received, an interrupted sync is simply replayed
+		state_store.save(key, delta_link, list(changes.keys()), removed)
+		return result
+
+	def _delta_url(self):
+		""" Returns the url starting a delta query on the current folder """
+		if self.url == self._get_url('inbox'):
+			return self._get_url('inbox_delta')
+		return self.url + '/delta'
+
+	def _get_url(self, key):
 		""" Fetches the url for specified key as per the connection version configured
 
 		:param key: the key for which url is required
 		:return: URL to use for requests
 		"""
-		return FluentInbox.url_dict[key][Connection().api_version]
+		return FluentInbox.url_dict[key][self.connection.api_version]
 
 	def _reset(self):
 		""" Resets the current reference """
 		self.fetched_count = 0
 		self.messages = []
+		self._reset_cursor()
+
+	def _reset_cursor(self):
+		""" Forgets the server cursor, the next fetch starts a new query """
+		self._started = False
+		self._next_link = None
+		self._page = []
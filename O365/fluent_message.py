@@ -3,7 +3,8 @@ from O365.contact import Contact
 from O365.group import Group
 import logging
 import json
-import requests
+from O365.connection import Connection, MicroDict
+from O365.upload import UploadSession
 
 log = logging.getLogger(__name__)
 
@@ -34,18 +35,22 @@ class Message(object):
 
 	Variables:
 					att_url -- url for requestiong attachments. takes message GUID
+					att_fields -- fields of the attachments listed by fetchAttachments(lazy=True)
 					send_url -- url for sending an email
 					update_url -- url for updating an email already existing in the cloud.
 
 	'''
 
 	att_url = 'https://outlook.office365.com/api/v1.0/me/messages/{0}/attachments'
+	att_fields = 'Id,Name,Size,ContentType'
 	send_url = 'https://outlook.office365.com/api/v1.0/me/sendmail'
 	send_as_url = 'https://outlook.office365.com/api/v1.0/users/{user_id}/sendmail'
+	messages_url = 'https://graph.microsoft.com/v1.0/me/messages'
+	user_messages_url = 'https://graph.microsoft.com/v1.0/users/{user_id}/messages'
 	draft_url = 'https://outlook.office365.com/api/v1.0/me/folders/{folder_id}/messages'
 	update_url = 'https://outlook.office365.com/api/v1.0/me/messages/{0}'
 
-	def __init__(self, json=None, auth=None, verify=True, oauth=None):
+	def __init__(self, json=None, auth=None, verify=True, oauth=None, connection=None, selected=None):
 		'''
 		Makes a new message wrapper for sending and receiving messages.
 
@@ -54,6 +59,10 @@ class Message(object):
 						this is mostly used inside the library for when new messages are downloaded.
 						auth (default = None) -- Takes an (email,password) tuple that will be used for
 						authentication with office365.
+						connection (default = None) -- the Connection the message was fetched with,
+						the default connection if None.
+						selected (default = None) -- the fields json was downloaded with ($select), the
+						other ones are loaded on first access. None if json is the whole message.
 		'''
 		if json:
 			self.json = json
@@ -69,6 +78,8 @@ class Message(object):
 		self.receiver = None
 		self.verify = verify
 		self.oauth = oauth
+		self.connection = connection or Connection()
+		self.selected = set(field.lower() for field in selected) if selected else None
 
 		# Update to 2.0 versions
 		if self.oauth:
@@ -79,20 +90,83 @@ class Message(object):
 				'folders', 'MailFolders', 1)
 			self.update_url = self.update_url.replace('https://outlook.office365.com/api', 'https://graph.microsoft.com')
 
-	def fetchAttachments(self,**kwargs):
-		'''kicks off the process that downloads attachments locally.'''
+	def _session(self):
+		'''returns the OAuth session if there is one, the pooled basic auth session otherwise.'''
+		if self.oauth is not None:
+			return self.oauth
+		return self.connection.get_session()
+
+	def _uses_connection(self):
+		'''True if the message has the credentials of its connection.'''
+		connection = self.connection
+		if self.oauth is not None:
+			return self.oauth is connection.oauth
+		return connection.api_version == '1.0' and self.auth is not None and \
+			tuple(self.auth) == tuple(connection.auth or ())
+
+	def _request(self, method, url, **kwargs):
+		'''
+		Sends a request for the message. It goes through Connection.send_request when the message
+		has the credentials of its connection, so an expired OAuth token is refreshed and throttled
+		requests are retried and rate limited. Raises RuntimeError when the server keeps refusing.
+
+		:param method: HTTP method
+		:param url: url of the request
+		:param kwargs: arguments of the requests api
+		'''
+		if self._uses_connection():
+			kwargs.pop('auth', None)
+			return self.connection.send_request(method, url, **kwargs)
+		return getattr(self._session(), method.lower())(url, **kwargs)
+
+	def load(self, **kwargs):
+		'''downloads the whole message, filling in the fields left out by a $select.'''
+		response = self._request('GET', self.update_url.format(self.json['Id']), auth=self.auth,
+								 verify=self.verify, **kwargs)
+		log.debug('response from server for loading message: %s', str(response))
+		if not response.ok:
+			raise RuntimeError('Unable to load message {}, status code {}'.format(
+				self.json['Id'], response.status_code))
+
+		fields = MicroDict(response.json())
+		# keep the local changes to the fields that were already there
+		for key, value in self.json.items():
+			fields.pop(key[:1].lower() + key[1:], None)
+			fields.pop(key[:1].upper() + key[1:], None)
+			fields[key] = value
+		self.json = fields
+		self.selected = None
+		return self
+
+	def _field(self, name):
+		'''returns a field of the message, loading the message if the field was not downloaded.'''
+		if self.selected is not None and name.lower() not in self.selected:
+			self.load()
+		return self.json[name]
+
+	def fetchAttachments(self,lazy=False,**kwargs):
+		'''
+		kicks off the process that downloads attachments locally.
+
+		:param lazy: only list the name, size, content type and id of the attachments, their content
+			is fetched when read with getByteString, getBase64 or save.
+		'''
 		if not self.hasAttachments:
 			log.debug('message has no attachments, skipping out early.')
 			return False
 
-		response = (self.oauth, requests)[self.oauth is None].get(self.att_url.format(
+		if lazy:
+			kwargs.setdefault('params', {})['$select'] = self.att_fields
+		response = self._request('GET', self.att_url.format(
 			self.json['Id']), auth=self.auth, verify=self.verify, **kwargs)
 		log.info('response from O365 for retriving message attachments: %s', str(response))
 		json = response.json()
 
 		for att in json['value']:
 			try:
-				self.attachments.append(Attachment(att))
+				attachment = Attachment(att)
+				attachment.message = self
+				self.attachments.append(attachment)
 				log.debug('successfully downloaded attachment for: %s.', self.auth[0])
 			except Exception as e:
 				log.info('failed to download attachment for: %s', self.auth[0])
@@ -103,32 +177,68 @@ class Message(object):
 		'''
 		Takes local variabls and forms them into a message to be sent.
 
+		Attachments too large to be sent inline (see Attachment.inline_limit), and the largest files
+		when the attachments together are too large for a request (see Attachment.request_limit),
+		are uploaded to a draft through upload sessions, the draft being sent once they are all
+		uploaded.
+
 		:param user_id: User id (email) if sending as other user
 		'''
-
-		headers = {'Content-Type': 'application/json', 'Accept': 'text/plain'}
+		if self.oauth:
+			uploads = self._uploads()
+			if uploads:
+				return self._sendWithUploads(user_id, uploads, **kwargs)
 
 		try:
-			data = {'Message': {'Body': {}}}
-			data['Message']['Subject'] = self.json['Subject']
-			data['Message']['Body']['Content'] = self.json['Body']['Content']
-			data['Message']['Body']['ContentType'] = self.json['Body']['ContentType']
-			data['Message']['ToRecipients'] = self.json['ToRecipients']
-			data['Message']['CcRecipients'] = self.json['CcRecipients']
-			data['Message']['BccRecipients'] = self.json['BccRecipients']
-			data['Message']['Attachments'] = [att.json for att in self.attachments]
-			data = json.dumps(data)
+			data = json.dumps(self._sendData())
 		except Exception as e:
 			log.error(
 				'Error while trying to compile the json string to send: {0}'.format(str(e)))
 			return False
 
+		return self._post(data, user_id, **kwargs)
+
+	def _sendData(self, subject=None, body=None):
+		'''
+		Builds the request sending the message.
+
+		:param subject: subject sent instead of the one of the message
+		:param body: body content sent instead of the one of the message
+		'''
+		try:
+			body_json = self.json['Body'] or {}
+		except KeyError:
+			# new messages only get a body once it is set
+			body_json = {}
+
+		data = {'Message': {'Body': {}}}
+		data['Message']['Subject'] = self.json['Subject'] if subject is None else subject
+		data['Message']['Body']['Content'] = body_json['Content'] if body is None else body
+		data['Message']['Body']['ContentType'] = body_json.get('ContentType', 'Text')
+		data['Message']['ToRecipients'] = self.json['ToRecipients']
+		data['Message']['CcRecipients'] = self.json['CcRecipients']
+		data['Message']['BccRecipients'] = self.json['BccRecipients']
+		data['Message']['Attachments'] = [att.inline() for att in self.attachments]
+		return data
+
+	def _post(self, data, user_id=None, **kwargs):
+		'''
+		Posts the serialized request sending the message, see MessageTemplate.
+
+		:param data: json string of the request
+		:param user_id: User id (email) if sending as other user
+		'''
+		headers = {'Content-Type': 'application/json', 'Accept': 'text/plain'}
 		if user_id:
 			url = self.send_as_url.format(user_id=user_id)
 		else:
-			usl = self.send_url
-		response = (self.oauth, requests)[self.oauth is None].post(
-			url, data, headers=headers, auth=self.auth, verify=self.verify, **kwargs)
+			url = self.send_url
+		try:
+			response = self._request('POST', url, data=data, headers=headers, auth=self.auth,
+									 verify=self.verify, **kwargs)
+		except RuntimeError as e:
+			log.error('Unable to send the message: {0}'.format(str(e)))
+			return False
 		log.debug('response from server for sending message:' + str(response))
 		log.debug("respnse body: {}".format(response.text))
 		if response.status_code != 202:
@@ -136,30 +246,135 @@ class Message(object):
 
 		return True
 
-	def markAsRead(self):
-		'''marks analogous message as read in the cloud.'''
+	def _uploads(self):
+		'''
+		Returns the attachments to send through upload sessions: the files too large to be sent
+		inline, then the largest files until the others fit in a request (see Attachment.request_limit).
+		'''
+		uploads = [att for att in self.attachments if att.isLarge()]
+		inline = [att for att in self.attachments if not att.isLarge()]
+		total = sum(att.inlineSize() for att in inline)
+		for att in sorted((att for att in inline if att.path is not None), key=lambda att: att.inlineSize(),
+						  reverse=True):
+			if total <= Attachment.request_limit:
+				break
+			uploads.append(att)
+			total -= att.inlineSize()
+		if total > Attachment.request_limit:
+			log.warning('The attachments made from content ({0} bytes) are too large to be sent inline, '
+						'attach files instead'.format(total))
+		return uploads
+
+	def _sendWithUploads(self, user_id=None, uploads=None, **kwargs):
+		'''
+		Sends the message as a draft with the small attachments inline, uploads the others to it
+		then sends it.
+
+		:param user_id: User id (email) if sending as other user
+		:param uploads: attachments to upload, see _uploads
+		'''
+		uploads = self._uploads() if uploads is None else uploads
+		headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+		messages_url = self.user_messages_url.format(user_id=user_id) if user_id else self.messages_url
+
+		try:
+			data = {'Body': {}}
+			data['Subject'] = self.json['Subject']
+			data['Body']['Content'] = self.json['Body']['Content']
+			data['Body']['ContentType'] = self.json['Body']['ContentType']
+			data['ToRecipients'] = self.json['ToRecipients']
+			data['CcRecipients'] = self.json['CcRecipients']
+			data['BccRecipients'] = self.json['BccRecipients']
+			data['Attachments'] = [att.json for att in self.attachments if att not in uploads]
+			data = json.dumps(data)
+		except Exception as e:
+			log.error(
+				'Error while trying to compile the json string to send: {0}'.format(str(e)))
+			return False
+
+		try:
+			response = self._request('POST', messages_url, data=data, headers=headers, verify=self.verify,
+									 **kwargs)
+		except RuntimeError as e:
+			log.error('Unable to create the draft: {0}'.format(str(e)))
+			return False
+		log.debug('response from server for creating draft:' + str(response))
+		if response.status_code != 201:
+			log.error('Unable to create the draft: {0}'.format(response.text))
+			return False
+		draft_url = '{0}/{1}'.format(messages_url, response.json()['id'])
+
+		try:
+			for att in uploads:
+				upload = UploadSession.create(draft_url + '/attachments', att.path, self.oauth,
+											  name=att.getName(), verify=self.verify,
+											  connection=self.connection if self._uses_connection() else None,
+											  session=self.connection.get_session(),
+											  retry_policy=self.connection.retry_policy)
+				upload.upload()
+
+			response = self._request('POST', draft_url + '/send', headers=headers, verify=self.verify, **kwargs)
+			log.debug('response from server for sending message:' + str(response))
+			if response.status_code != 202:
+				raise RuntimeError('status code {0}: {1}'.format(response.status_code, response.text))
+		except Exception as e:
+			log.error('Unable to send the message: {0}'.format(str(e)))
+			self._deleteDraft(draft_url, **kwargs)
+			return False
+
+		return True
+
+	def _deleteDraft(self, draft_url, **kwargs):
+		'''
+		Deletes the draft of a message that could not be sent, logging its url if it is left behind.
+
+		:param draft_url: url of the draft
+		'''
+		try:
+			response = self._request('DELETE', draft_url, verify=self.verify, **kwargs)
+			if response.status_code == 204:
+				return
+			reason = 'status code {0}'.format(response.status_code)
+		except Exception as e:
+			reason = str(e)
+		log.error('Unable to delete the draft {0}, it is left in the mailbox: {1}'.format(draft_url, reason))
+
+	def markAsRead(self, batch=None):
+		'''
+		marks analogous message as read in the cloud.
+
+		:param batch: O365.batch.Batch to queue the update in instead of sending it right away
+		:returns: True on success, the queued BatchRequest if a batch was given
+		'''
+		if batch is not None:
+			return batch.add('PATCH', self.update_url.format(self.json['Id']), {'IsRead': True}, target=self)
+
 		read = '{"IsRead":true}'
 		headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
 		try:
-			response = (self.oauth, requests)[self.oauth is None].patch(self.update_url.format(
-				self.json['Id']), read, headers=headers, auth=self.auth, verify=self.verify)
+			response = self._request('PATCH', self.update_url.format(
+				self.json['Id']), data=read, headers=headers, auth=self.auth, verify=self.verify)
 		except:
 			return False
 		return response.ok
 
-	def moveToFolder(self, folder_id):
+	def moveToFolder(self, folder_id, batch=None):
 		"""
 		Move the message to a given folder
 
 		:param folder_id: Folder ID to move this message to
-		:returns: True on success
+		:param batch: O365.batch.Batch to queue the move in instead of sending it right away
+		:returns: True on success, the queued BatchRequest if a batch was given
 		"""
 		move_url = 'https://outlook.office365.com/api/v1.0/me/messages/{0}/move'
+		post_data = {"DestinationId": folder_id}
+		if batch is not None:
+			return batch.add('POST', move_url.format(self.json['Id']), post_data, target=self)
+
 		headers = {'Content-Type': 'application/json',
 				   'Accept': 'application/json'}
-		post_data = {"DestinationId": folder_id}
 		try:
-			response = (self.oauth, requests)[self.oauth is None].post(move_url.format(self.json['Id']),
+			response = self._request('POST', move_url.format(self.json['Id']),
 									 json=post_data, headers=headers,
 									 auth=self.auth, verify=self.verify)
 		except:
@@ -169,27 +384,27 @@ class Message(object):
 
 	def getSender(self):
 		'''get all available information for the sender of the email.'''
-		return self.json['Sender']
+		return self._field('Sender')
 
 	def getSenderEmail(self):
 		'''get the email address of the sender.'''
-		return self.json['Sender']['EmailAddress']['Address']
+		return self._field('Sender')['EmailAddress']['Address']
 
 	def getSenderName(self):
 		'''try to get the name of the sender.'''
 		try:
-			return self.json['Sender']['EmailAddress']['Name']
+			return self._field('Sender')['EmailAddress']['Name']
 		except:
 			return ''
 
 	def getSubject(self):
 		'''get email subject line.'''
-		return self.json['Subject']
+		return self._field('Subject')
 
 	def getBody(self):
 		'''get email body.'''
 		try:
-			return self.json['Body']['Content']
+			return self._field('Body')['Content']
 		except KeyError as e:
 			log.debug("Fluent inbox getBody: No body content.")
 			return ""
@@ -302,12 +517,23 @@ class Message(object):
 		"Sets the email's category"
 		self.update_category(self, category_name, **kwargs)
 
-	def update_category(self, category_name, **kwargs):
+	def update_category(self, category_name, batch=None, **kwargs):
+		'''
+		Replaces the email's categories with the given one.
+
+		:param category_name: name of the category
+		:param batch: O365.batch.Batch to queue the update in instead of sending it right away
+		:returns: True on success, the queued BatchRequest if a batch was given
+		'''
+		if batch is not None:
+			return batch.add('PATCH', self.update_url.format(self.json['Id']),
+							 {'Categories': [category_name]}, target=self)
+
 		category = '{{"Categories":["{}"]}}'.format(category_name)
 		headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
 		try:
-			response = (self.oauth, requests)[self.oauth is None].patch(self.update_url.format(
-				self.json['Id']), category, headers=headers, auth=self.auth, verify=self.verify, **kwargs)
+			response = self._request('PATCH', self.update_url.format(
+				self.json['Id']), data=category, headers=headers, auth=self.auth, verify=self.verify, **kwargs)
 		except:
 			return False
 		return response.ok
@@ -0,0 +1,268 @@
+'''
+Index of the whole mail folder tree of a mailbox, crawled once so folders are then looked up by
+id or by path ('Inbox/Clients/Acme') without any request.
+'''
+import logging
+import threading
+
+try:
+	from queue import Queue
+except ImportError:
+	from Queue import Queue
+
+from O365.connection import Connection, MicroDict, micro_object
+
+log = logging.getLogger(__name__)
+
+
+class FolderIndex(object):
+	'''
+	Mail folders of a mailbox indexed by id and by path. The tree is crawled once, the child folders
+	of each level being listed concurrently, then kept up to date with refresh. An index can be
+	shared by any number of FluentInbox.
+
+	Example:
+		index = FolderIndex(workers=8).load()
+		acme = index.get('Inbox/Clients/Acme')
+		inbox = FluentInbox(folder_index=index).from_folder('Inbox/Clients/Acme')
+
+	Methods:
+		load -- crawls the whole folder tree.
+		refresh -- applies the changes made since the last load or refresh.
+		get -- returns a folder by path or id.
+		path -- returns the path of a folder.
+		children -- returns the child folders of a folder.
+	'''
+	url_dict = {
+		'folders': {
+			'1.0': 'https://outlook.office365.com/api/v1.0/me/Folders',
+			'2.0': 'https://graph.microsoft.com/v1.0/me/MailFolders',
+		},
+		'child_folders': {
+			'1.0': 'https://outlook.office365.com/api/v1.0/me/Folders/{folder_id}/childfolders',
+			'2.0': 'https://graph.microsoft.com/v1.0/me/MailFolders/{folder_id}/childfolders',
+		},
+		'delta': {
+			'1.0': None,
+			'2.0': 'https://graph.microsoft.com/v1.0/me/MailFolders/delta',
+		},
+		'user_folders': {
+			'1.0': 'https://outlook.office365.com/api/v1.0/users/{user_id}/Folders',
+			'2.0': 'https://graph.microsoft.com/v1.0/users/{user_id}/MailFolders',
+		},
+		'user_child_folders': {
+			'1.0': 'https://outlook.office365.com/api/v1.0/users/{user_id}/Folders/{folder_id}/childfolders',
+			'2.0': 'https://graph.microsoft.com/v1.0/users/{user_id}/MailFolders/{folder_id}/childfolders',
+		},
+		'user_delta': {
+			'1.0': None,
+			'2.0': 'https://graph.microsoft.com/v1.0/users/{user_id}/MailFolders/delta',
+		},
+	}
+	separator = '/'
+
+	def __init__(self, connection=None, user_id=None, workers=8, verify=True):
+		'''
+		:param connection: the Connection to use, the default connection if None
+		:param user_id: user id the mailbox belongs to (shared mailboxes)
+		:param workers: no.of folders whose child folders are listed at once while crawling
+		:param verify: whether or not to verify SSL certificate
+		'''
+		self.connection = connection or Connection()
+		self.user_id = user_id
+		self.workers = workers
+		self.verify = verify
+		self.delta_link = None
+		self._lock = threading.RLock()
+		self._clear()
+
+	def _clear(self):
+		self._folders = {}
+		self._children = {}
+		self._paths = {}
+		self._ids_by_path = {}
+
+	def _get_url(self, key, **kwargs):
+		if self.user_id:
+			key = 'user_' + key
+			kwargs['user_id'] = self.user_id
+		url = FolderIndex.url_dict[key][self.connection.api_version]
+		return url.format(**kwargs) if url else None
+
+	def _list(self, url):
+		return list(self.connection.iter_response(url, verify=self.verify, page_size=100))
+
+	def load(self):
+		'''
+		Crawls the whole folder tree, listing the child folders of up to workers folders at once.
+
+		:returns: the index
+		'''
+		folders = {}
+		errors = []
+		pending = Queue()
+		results_lock = threading.Lock()
+
+		def add(items, parent_id):
+			with results_lock:
+				for folder in items:
+					if folder['ParentFolderId'] is None and parent_id is not None:
+						folder['ParentFolderId'] = parent_id
+					folders[folder['Id']] = folder
+			for folder in items:
+				# folders without child folders are not listed
+				if folder['ChildFolderCount'] != 0:
+					pending.put(folder['Id'])
+
+		def work():
+			while True:
+				folder_id = pending.get()
+				try:
+					if folder_id is None:
+						return
+					if not errors:
+						add(self._list(self._get_url('child_folders', folder_id=folder_id)), folder_id)
+				except Exception as e:
+					log.info('failed to list the child folders of {}: {}'.format(folder_id, str(e)))
+					errors.append(e)
+				finally:
+					pending.task_done()
+
+		add(self._list(self._get_url('folders')), None)
+
+		threads = [threading.Thread(target=work) for i in range(max(1, self.workers))]
+		for thread in threads:
+			thread.daemon = True
+			thread.start()
+		pending.join()
+		for thread in threads:
+			pending.put(None)
+		if errors:
+			raise errors[0]
+
+		with self._lock:
+			self._clear()
+			self._folders = folders
+			self._index_paths()
+		log.debug('indexed {} folders'.format(len(folders)))
+		return self
+
+	def refresh(self):
+		'''
+		Applies the folders added, changed, moved and deleted since the last refresh through a delta
+		query. The first refresh reads the whole delta to start tracking the changes. Without delta
+		queries (Outlook REST API) the tree is crawled again.
+
+		:returns: the index
+		'''
+		delta_url = self.delta_link or self._get_url('delta')
+		if delta_url is None:
+			return self.load()
+
+		changed = []
+		removed = []
+		next_link = delta_url
+		while next_link:
+			response = self.connection.send_request('GET', next_link, verify=self.verify)
+			if response.status_code == 410:
+				# the delta link expired, starts over
+				log.info('folder delta link expired, crawling the folders again')
+				self.delta_link = None
+				return self.load().refresh()
+			if response.status_code != 200:
+				raise RuntimeError('Unable to get the folder changes, status code {}'.format(response.status_code))
+
+			page = response.json(object_hook=micro_object)
+			for folder in page.get('value', []):
+				if '@removed' in folder:
+					removed.append(folder['Id'])
+				else:
+					changed.append(folder)
+			next_link = page.get('@odata.nextLink')
+			if page.get('@odata.deltaLink'):
+				self.delta_link = page['@odata.deltaLink']
+
+		with self._lock:
+			for folder_id in removed:
+				self._remove(folder_id)
+			for folder in changed:
+				folder_id = folder['Id']
+				previous = self._folders.get(folder_id)
+				if previous is not None:
+					# the full folder is not always sent back, keeps what is known
+					merged = MicroDict(previous)
+					merged.update(folder)
+					folder = merged
+				self._folders[folder_id] = folder
+			self._index_paths()
+		log.debug('{} folders changed, {} removed'.format(len(changed), len(removed)))
+		return self
+
+	def _parent(self, folder):
+		''' Id of the parent folder, None for the top level folders (whose parent is the hidden root
+		folder of the mailbox) '''
+		parent_id = folder['ParentFolderId']
+		return parent_id if parent_id in self._folders else None
+
+	def _remove(self, folder_id):
+		''' Drops a folder and its child folders, the paths are to be indexed again '''
+		self._folders.pop(folder_id, None)
+		for child_id in list(self._children.pop(folder_id, ())):
+			self._remove(child_id)
+
+	def _index_paths(self):
+		''' Computes the children and the path of every folder, from the top level folders down '''
+		children = {}
+		for folder_id, folder in self._folders.items():
+			children.setdefault(self._parent(folder), []).append(folder_id)
+		self._children = dict((parent_id, set(ids)) for parent_id, ids in children.items())
+
+		self._paths = {}
+		self._ids_by_path = {}
+		level = [(folder_id, '') for folder_id in children.get(None, [])]
+		while level:
+			next_level = []
+			for folder_id, parent_path in level:
+				path = parent_path + self._folders[folder_id]['DisplayName']
+				self._paths[folder_id] = path
+				self._ids_by_path[path.lower()] = folder_id
+				next_level.extend((child_id, path + self.separator) for child_id in children.get(folder_id, []))
+			level = next_level
+
+	def get(self, value):
+		'''
+		Returns a folder by its path from the top of the mailbox ('Inbox/Clients/Acme', not case
+		sensitive) or by its id.
+
+		:param value: path or id of the folder
+		:returns: the folder data
+		'''
+		with self._lock:
+			folder = self._folders.get(value)
+			if folder is None:
+				folder_id = self._ids_by_path.get(value.strip(self.separator).lower())
+				folder = self._folders.get(folder_id)
+		if folder is None:
+			raise RuntimeError('Folder "{}" is not found'.format(value))
+		return folder
+
+	def path(self, folder_id):
+		''' Returns the path of the folder with the given id '''
+		with self._lock:
+			return self._paths[folder_id]
+
+	def children(self, value=None):
+		'''
+		:param value: path or id of the folder, None for the top level folders
+		:returns: list of the child folders
+		'''
+		with self._lock:
+			parent_id = None if value is None else self.get(value)['Id']
+			return [self._folders[folder_id] for folder_id in self._children.get(parent_id, ())]
+
+	def __len__(self):
+		return len(self._folders)
+
+	def __contains__(self, value):
+		with self._lock:
+			return value in self._folders or value.strip(self.separator).lower() in self._ids_by_path
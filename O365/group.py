@@ -1,7 +1,8 @@
 from O365.contact import Contact
 import logging
 import json
-import requests
+from O365.connection import Connection
+from O365.collection import ItemIndex
 
 log = logging.getLogger(__name__)
 
@@ -31,7 +32,7 @@ class Group( object ):
 		'''
 		log.debug('setting up for the schedule of the email %s',auth[0])
 		self.auth = auth
-		self.contacts = []
+		self.contacts = ItemIndex()
 		self.folderName = folderName
 
 		self.verify = verify
@@ -41,30 +42,25 @@ class Group( object ):
 		'''Begin the process of downloading contact metadata.'''
 		if self.folderName is None:
 			log.debug('fetching contacts.')
-			response = requests.get(self.con_url,auth=self.auth,verify=self.verify)
+			response = Connection.get_session().get(self.con_url,auth=self.auth,verify=self.verify)
 			log.info('Response from O365: %s', str(response))
 
 		else:
 			log.debug('fetching contact folder.')
-			response = requests.get(self.folder_url.format(self.folderName),auth=self.auth,verify=self.verify)
+			response = Connection.get_session().get(self.folder_url.format(self.folderName),auth=self.auth,verify=self.verify)
 			fid = response.json()['value'][0]['Id']
 			log.debug('got a response of {0} and an Id of {1}'.format(response.status_code,fid))
 
 			log.debug('fetching contacts for {0}.'.format(self.folderName))
-			response = requests.get(self.con_folder_url.format(fid),auth=self.auth,verify=self.verify)
+			response = Connection.get_session().get(self.con_folder_url.format(fid),auth=self.auth,verify=self.verify)
 			log.info('Response from O365: {0}'.format(str(response)))
 
 		for contact in response.json()['value']:
-			duplicate = False
 			log.debug('Got a contact Named: {0}'.format(contact['DisplayName']))
-			for existing in self.contacts:
-				if existing.json['Id'] == contact['Id']:
-					log.info('duplicate contact')
-					duplicate = True
-					break
-
-			if not duplicate:
-				self.contacts.append(Contact(contact,self.auth))
+			if contact['Id'] in self.contacts:
+				log.info('duplicate contact')
+			else:
+				self.contacts.upsert(Contact(contact,self.auth), contact['Id'])
 
 			log.debug('Appended Contact.')
 
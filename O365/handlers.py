@@ -1,7 +1,13 @@
 import logging
 import json
 import copy
+import os
+import socket
+import threading
+import time
+from collections import deque, OrderedDict
 import O365
+from O365.template import MessageTemplate
 
 log = logging.getLogger(__name__)
 
@@ -32,6 +38,7 @@ class O365Handler(logging.Handler):
 		super(O365Handler, self).__init__()
 
 		self._defaultMessage = O365.Message(*args, **kwargs)
+		self._template = None
 
 	def emit(self, record):
 		'''
@@ -41,35 +48,215 @@ class O365Handler(logging.Handler):
 		record -- the record to handle
 		'''
 
-		# We'll need to try to use our default message to send this, so start
-		# by making a copy
-		message = copy.deepcopy(self._defaultMessage)
-
 		# If we can deserialize this record's message, use that to try to send
 		# the message
 		try:
-			message.json = json.loads(record.getMessage())
-			message.sendMessage()
-			return
+			messageJson = json.loads(record.getMessage())
+		except ValueError:
+			messageJson = None
+
+		try:
+			if isinstance(messageJson, dict):
+				# only the json is replaced, the rest of the default message is shared: a deep copy
+				# would copy its connection too, whose locks can not be copied
+				message = copy.copy(self._defaultMessage)
+				message.json = messageJson
+				message.sendMessage()
+			else:
+				# the record's message is appended to the body of the default message
+				self.template().send(record.getMessage())
 		except Exception as e:
-			pass
+			log.info('Could not send message: {}'.format(str(e)))
+
+	def template(self):
+		'''
+		Returns the template of the default message, made on the first record. Call refresh after
+		changing the default message.
+		'''
+		if self._template is None:
+			self._template = MessageTemplate(self._defaultMessage)
+		return self._template
+
+	def refresh(self):
+		''' Makes the template again, after the default message was changed '''
+		self._template = None
+
+
+class BatchingO365Handler(O365Handler):
+	'''
+	Logging handler sending the records as digest emails, from a background thread.
 
-		# There could be a few things missing from the various dictionaries,
-		# and the dictionary layout might change, so just be cheap and wrap
-		# this in a dictionary try/catch.
+	emit only appends the record to a bounded queue, so logging doesn't wait for any request. The
+	sender thread sends one digest per window, or as soon as max_records are waiting, with the
+	repeated records (same logger, level, location and message format) counted instead of listed
+	again. When the queue is full the records are dropped, or written to spill_path and added to
+	the next digest.
+
+	Example:
+		handler = BatchingO365Handler(auth=auth, window=60, spill_path='/var/log/o365.spill')
+		handler.setLevel(logging.ERROR)
+		handler._defaultMessage.setRecipients('ops@example.com')
+		logging.getLogger().addHandler(handler)
+	'''
+
+	def __init__(self, *args, **kwargs):
+		'''
+		Creates a new batching logging handler, the arguments are those of O365.Message plus:
+
+		:param window: no.of seconds the records are gathered before a digest is sent
+		:param max_records: no.of waiting records sending a digest before the end of the window
+		:param capacity: max no.of records waiting, the others are dropped or spilled
+		:param spill_path: file the records are written to when the queue is full, dropped if None
+		:param subject: subject of the digests, formatted with the no.of records and the host name
+		'''
+		self.window = kwargs.pop('window', 60)
+		self.max_records = kwargs.pop('max_records', 500)
+		self.capacity = kwargs.pop('capacity', 10000)
+		self.spill_path = kwargs.pop('spill_path', None)
+		self.subject = kwargs.pop('subject', '{count} log records from {host}')
+		super(BatchingO365Handler, self).__init__(*args, **kwargs)
+
+		self._records = deque()
+		self._wake = threading.Event()
+		self._spill_lock = threading.Lock()
+		self._send_lock = threading.Lock()
+		self._closed = False
+		self.stats = {'records': 0, 'digests': 0, 'dropped': 0, 'spilled': 0, 'failed': 0}
+
+		self._thread = threading.Thread(target=self._run)
+		self._thread.daemon = True
+		self._thread.start()
+
+	def emit(self, record):
+		'''
+		Queues a record for the next digest. The record is formatted when the digest is built, so
+		its arguments should not be changed after logging.
+
+		Arguments
+		record -- the record to handle
+		'''
+		# the requests of the sender thread are logged too, they would never end
+		if threading.current_thread() is self._thread:
+			return
+
+		records = self._records
+		if len(records) >= self.capacity:
+			self._overflow(record)
+			return
+		records.append(record)
+		if len(records) >= self.max_records:
+			self._wake.set()
+
+	def _overflow(self, record):
+		if self.spill_path is None:
+			self.stats['dropped'] += 1
+			return
 		try:
-			defaultMessageBody = self._defaultMessage.getBody()
+			line = json.dumps([record.levelname, record.name, record.pathname, record.lineno,
+							   str(record.msg), self.format(record), record.created])
+			with self._spill_lock:
+				with open(self.spill_path, 'a') as spill:
+					spill.write(line + '\n')
+			self.stats['spilled'] += 1
+		except Exception:
+			self.stats['dropped'] += 1
+			self.handleError(record)
+
+	def _read_spill(self):
+		''' Returns the records spilled to disk, emptying the file '''
+		if self.spill_path is None:
+			return []
+		with self._spill_lock:
+			if not os.path.exists(self.spill_path):
+				return []
+			with open(self.spill_path, 'r') as spill:
+				lines = spill.readlines()
+			os.unlink(self.spill_path)
+		return [json.loads(line) for line in lines if line.strip()]
 
-			# We already have a body, so append to the end
-			message.setBody("{}{}".format(defaultMessageBody, record.getMessage()))
+	def _run(self):
+		while not self._closed:
+			self._wake.wait(self.window)
+			self._wake.clear()
+			self._send_digest()
 
-		except KeyError:
-			# We don't have a body yet, so just set the record's message as the
-			# body
-			message.setBody(record.getMessage())
+	def _drain(self):
+		''' Takes the waiting records, grouped with their count in order of first appearance '''
+		groups = OrderedDict()
 
-		# Send!
+		def add(key, level, text, created):
+			group = groups.get(key)
+			if group is None:
+				groups[key] = group = {'level': level, 'text': text, 'count': 0, 'first': created}
+			group['count'] += 1
+			group['last'] = created
+
+		records = self._records
+		while records:
+			record = records.popleft()
+			try:
+				text = self.format(record)
+			except Exception:
+				self.handleError(record)
+				continue
+			add((record.levelname, record.name, record.pathname, record.lineno, str(record.msg)),
+				record.levelname, text, record.created)
+		for level, name, pathname, lineno, msg, text, created in self._read_spill():
+			add((level, name, pathname, lineno, msg), level, text, created)
+		return list(groups.values())
+
+	def digest(self, groups):
+		'''
+		Returns the body of a digest, override it to change the layout.
+
+		:param groups: list of dictionaries with the level, text (the first record formatted), count
+			and the first and last times of each group of records
+		'''
+		lines = []
+		for group in groups:
+			if group['count'] > 1:
+				lines.append('[{} times from {} to {}] {}'.format(
+					group['count'], time.strftime('%H:%M:%S', time.localtime(group['first'])),
+					time.strftime('%H:%M:%S', time.localtime(group['last'])), group['text']))
+			else:
+				lines.append(group['text'])
+		dropped = self.stats['dropped']
+		if dropped:
+			lines.append('{} records were dropped, the queue was full'.format(dropped))
+		return '\n'.join(lines)
+
+	def _send_digest(self):
+		# not under the handler lock, logging would wait for the request
+		with self._send_lock:
+			groups = self._drain()
+			if groups:
+				self._send_groups(groups)
+
+	def _send_groups(self, groups):
+		count = sum(group['count'] for group in groups)
+		subject = self.subject.format(count=count, host=socket.gethostname())
+		body = self.digest(groups)
+		self.stats['records'] += count
+		self.stats['dropped'] = 0
 		try:
-			message.sendMessage()
+			self._send(subject, body)
+			self.stats['digests'] += 1
 		except Exception as e:
-			log.info('Could not send message: {}'.format(str(e)))
+			self.stats['failed'] += 1
+			log.info('Could not send log digest: {}'.format(str(e)))
+
+	def _send(self, subject, body):
+		if not self.template().send(body, subject=subject):
+			raise RuntimeError('the message was not sent')
+
+	def flush(self):
+		''' Sends the waiting records right away '''
+		self._send_digest()
+
+	def close(self):
+		''' Stops the sender thread, sending the waiting records '''
+		self._closed = True
+		self._wake.set()
+		self._thread.join(self.window + 30)
+		self._send_digest()
+		super(BatchingO365Handler, self).close()
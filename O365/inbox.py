@@ -1,7 +1,8 @@
 from O365.message import Message
 import logging
 import json
-import requests
+from O365.connection import Connection
+from O365.collection import ItemIndex
 
 log = logging.getLogger(__name__)
 
@@ -18,16 +19,18 @@ class Inbox( object ):
 	#url for fetching emails. Takes a flag for whether they are read or not.
 	inbox_url = 'https://outlook.office365.com/api/v1.0/me/messages'
 
-	def __init__(self, auth, getNow=True, verify=True):
+	def __init__(self, auth, getNow=True, verify=True, max_messages=None):
 		'''
 		Creates a new inbox wrapper. Send email and password for authentication.
 
 		set getNow to false if you don't want to immedeatly download new messages.
+		set max_messages to only keep that many messages, the least recently downloaded ones
+		being dropped first.
 		'''
 
 		log.debug('creating inbox for the email %s',auth[0])
 		self.auth = auth
-		self.messages = []
+		self.messages = ItemIndex(max_size=max_messages)
 		self.errors = ''
 
 		self.filters = ''
@@ -55,7 +58,7 @@ class Inbox( object ):
 		'''
 
 		log.debug('fetching messages.')
-		response = requests.get(self.inbox_url,auth=self.auth,params={'$orderby':self.order_by, '$filter':self.filters, '$top':number},verify=self.verify)
+		response = Connection.get_session().get(self.inbox_url,auth=self.auth,params={'$orderby':self.order_by, '$filter':self.filters, '$top':number},verify=self.verify)
 		if response.status_code in [400, 500]:
 			self.errors = response.text
 			return False
@@ -74,15 +77,8 @@ class Inbox( object ):
 
 		for message in response.json()['value']:
 			try:
-				duplicate = False
-				for i,m in enumerate(self.messages):
-					if message['Id'] == m.json['Id']:
-						self.messages[i] = Message(message,self.auth)
-						duplicate = True
-						break
-
-				if not duplicate:
-					self.messages.append(Message(message,self.auth))
+				# replaces the message if it was already downloaded
+				self.messages.upsert(Message(message,self.auth), message['Id'])
 
 				log.debug('appended message: %s',message['Subject'])
 			except Exception as e:
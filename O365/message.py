@@ -3,7 +3,7 @@ from O365.contact import Contact
 from O365.group import Group
 import logging
 import json
-import requests
+from O365.connection import Connection
 
 log = logging.getLogger(__name__)
 
@@ -34,17 +34,19 @@ class Message(object):
 
 	Variables:
 					att_url -- url for requestiong attachments. takes message GUID
+					att_fields -- fields of the attachments listed by fetchAttachments(lazy=True)
 					send_url -- url for sending an email
 					update_url -- url for updating an email already existing in the cloud.
 
 	'''
 
 	att_url = 'https://outlook.office365.com/api/v1.0/me/messages/{0}/attachments'
+	att_fields = 'Id,Name,Size,ContentType'
 	send_url = 'https://outlook.office365.com/api/v1.0/me/sendmail'
 	draft_url = 'https://outlook.office365.com/api/v1.0/me/folders/{folder_id}/messages'
 	update_url = 'https://outlook.office365.com/api/v1.0/me/messages/{0}'
 
-	def __init__(self, json=None, auth=None, verify=True):
+	def __init__(self, json=None, auth=None, verify=True, connection=None):
 		'''
 		Makes a new message wrapper for sending and receiving messages.
 
@@ -53,6 +55,8 @@ class Message(object):
 						this is mostly used inside the library for when new messages are downloaded.
 						auth (default = None) -- Takes an (email,password) tuple that will be used for
 						authentication with office365.
+						connection (default = None) -- the Connection whose connection pool is used,
+						the default connection if None.
 		'''
 		if json:
 			self.json = json
@@ -68,22 +72,47 @@ class Message(object):
 		self.receiver = None
 
 		self.verify = verify
+		self.connection = connection or Connection()
 
+	def _session(self):
+		'''returns the pooled session of the connection.'''
+		return self.connection.get_session()
 
-	def fetchAttachments(self):
-		'''kicks off the process that downloads attachments locally.'''
+	def _request(self, method, url, **kwargs):
+		'''
+		sends a request for the message, through Connection.send_request (retrying throttled
+		requests) when the message has the credentials of its connection.
+		'''
+		connection = self.connection
+		if connection.api_version == '1.0' and self.auth is not None and \
+				tuple(self.auth) == tuple(connection.auth or ()):
+			kwargs.pop('auth', None)
+			return connection.send_request(method, url, **kwargs)
+		return getattr(self._session(), method.lower())(url, **kwargs)
+
+	def fetchAttachments(self, lazy=False):
+		'''
+		kicks off the process that downloads attachments locally.
+
+		Keyword Arguments:
+						lazy (default = False) -- only list the name, size, content type and id of the
+						attachments, their content is fetched when read with getByteString, getBase64 or save.
+		'''
 		if not self.hasAttachments:
 			log.debug('message has no attachments, skipping out early.')
 			return False
 
-		response = requests.get(self.att_url.format(
-				self.json['Id']), auth=self.auth,verify=self.verify)
+		params = {'$select': self.att_fields} if lazy else None
+		response = self._request('GET', self.att_url.format(
+				self.json['Id']), params=params, auth=self.auth,verify=self.verify)
 		log.info('response from O365 for retriving message attachments: %s', str(response))
 		json = response.json()
 
 		for att in json['value']:
 			try:
-				self.attachments.append(Attachment(att))
+				attachment = Attachment(att)
+				attachment.message = self
+				self.attachments.append(attachment)
 				log.debug('successfully downloaded attachment for: %s.', self.auth[0])
 			except Exception as e:
 				log.info('failed to download attachment for: %s', self.auth[0])
@@ -92,25 +121,37 @@ class Message(object):
 
 	def sendMessage(self):
 		'''takes local variabls and forms them into a message to be sent.'''
-
-		headers = {'Content-type': 'application/json', 'Accept': 'text/plain'}
-
 		try:
-			data = {'Message': {'Body': {}}}
-			data['Message']['Subject'] = self.json['Subject']
-			data['Message']['Body']['Content'] = self.json['Body']['Content']
-			data['Message']['Body']['ContentType'] = self.json['Body']['ContentType']
-			data['Message']['ToRecipients'] = self.json['ToRecipients']
-			data['Message']['CcRecipients'] = self.json['CcRecipients']
-			data['Message']['BccRecipients'] = self.json['BccRecipients']
-			data['Message']['Attachments'] = [att.json for att in self.attachments]
-			data = json.dumps(data)
+			data = json.dumps(self._sendData())
 		except Exception as e:
 			log.error(
 					'Error while trying to compile the json string to send: {0}'.format(str(e)))
 			return False
 
-		response = requests.post(
+		return self._post(data)
+
+	def _sendData(self, subject=None, body=None):
+		'''
+		builds the request sending the message.
+
+		Keyword Arguments:
+						subject (default = None) -- subject sent instead of the one of the message.
+						body (default = None) -- body content sent instead of the one of the message.
+		'''
+		data = {'Message': {'Body': {}}}
+		data['Message']['Subject'] = self.json['Subject'] if subject is None else subject
+		data['Message']['Body']['Content'] = self.json['Body']['Content'] if body is None else body
+		data['Message']['Body']['ContentType'] = self.json['Body'].get('ContentType', 'Text')
+		data['Message']['ToRecipients'] = self.json['ToRecipients']
+		data['Message']['CcRecipients'] = self.json['CcRecipients']
+		data['Message']['BccRecipients'] = self.json['BccRecipients']
+		data['Message']['Attachments'] = [att.inline() for att in self.attachments]
+		return data
+
+	def _post(self, data):
+		'''posts the serialized request sending the message, see MessageTemplate.'''
+		headers = {'Content-type': 'application/json', 'Accept': 'text/plain'}
+		response = self.connection.get_session().post(
 				self.send_url, data, headers=headers, auth=self.auth,verify=self.verify)
 		log.debug('response from server for sending message:' + str(response))
 		log.debug("respnse body: {}".format(response.text))
@@ -124,7 +165,7 @@ class Message(object):
 		read = '{"IsRead":true}'
 		headers = {'Content-type': 'application/json', 'Accept': 'application/json'}
 		try:
-			response = requests.patch(self.update_url.format(
+			response = self.connection.get_session().patch(self.update_url.format(
 					self.json['Id']), read, headers=headers, auth=self.auth,verify=self.verify)
 		except:
 			return False
@@ -135,7 +176,7 @@ class Message(object):
 		categories = json.dumps(dict(Categories=categories))
 		headers = {'Content-type': 'application/json', 'Accept': 'application/json'}
 		try:
-			response = requests.patch(self.update_url.format(
+			response = self.connection.get_session().patch(self.update_url.format(
 					self.json['Id']), categories, headers=headers, auth=self.auth,verify=self.verify)
 		except:
 			return False
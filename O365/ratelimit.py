@@ -0,0 +1,158 @@
+'''
+Client side rate limiting, pacing the requests before they are sent so the service limits (about
+10000 requests per 10 minutes per mailbox for an application) are not hit in the first place.
+'''
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class TokenBucket(object):
+	'''
+	Token bucket filled at a constant rate. Tokens are reserved ahead of time, so callers from
+	several threads are queued fairly instead of all waking up at once.
+	'''
+
+	def __init__(self, rate, capacity):
+		'''
+		:param rate: no.of tokens added per second
+		:param capacity: max no.of tokens the bucket holds, i.e. the allowed burst
+		'''
+		self.rate = float(rate)
+		self.capacity = float(capacity)
+		self.tokens = float(capacity)
+		self.updated = time.time()
+		self._lock = threading.Lock()
+
+	def reserve(self, now=None):
+		'''
+		Takes a token, returns how many seconds to wait before it may be used.
+		'''
+		with self._lock:
+			now = time.time() if now is None else now
+			self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+			self.updated = now
+			self.tokens -= 1
+			if self.tokens >= 0:
+				return 0.0
+			return -self.tokens / self.rate
+
+	def is_full(self, now):
+		with self._lock:
+			return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class WaitHistogram(object):
+	'''
+	Cumulative histogram of the time spent waiting for the rate limiter, in seconds.
+	'''
+	default_bounds = (0.001, 0.01, 0.1, 0.5, 1, 5, 10, 30, 60)
+
+	def __init__(self, bounds=None):
+		self.bounds = tuple(bounds or self.default_bounds)
+		self._lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		with self._lock:
+			self.counts = [0] * (len(self.bounds) + 1)
+			self.count = 0
+			self.total = 0.0
+
+	def observe(self, value):
+		with self._lock:
+			self.count += 1
+			self.total += value
+			for i, bound in enumerate(self.bounds):
+				if value <= bound:
+					self.counts[i] += 1
+					break
+			else:
+				self.counts[-1] += 1
+
+	def get_stats(self):
+		'''
+		:returns: dictionary with the no.of observations, their sum and the cumulative count of
+			observations below each bound ('+Inf' being the last one)
+		'''
+		with self._lock:
+			buckets = []
+			cumulative = 0
+			for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+				cumulative += count
+				buckets.append((bound, cumulative))
+			return {'count': self.count, 'sum': self.total, 'buckets': buckets}
+
+
+class RateLimiter(object):
+	'''
+	In-process rate limiter keeping a token bucket per mailbox and one per tenant.
+
+	Any object with an acquire(mailbox, tenant) method blocking until the request may be sent can be
+	given to Connection.set_rate_limiter instead.
+	'''
+	# buckets of idle mailboxes are dropped past this no.of mailboxes
+	max_buckets = 10000
+
+	def __init__(self, mailbox_rate=10000 / 600.0, mailbox_burst=50, tenant_rate=None, tenant_burst=None,
+				 histogram_bounds=None):
+		'''
+		Creates a rate limiter.
+
+		:param mailbox_rate: requests per second allowed per mailbox
+		:param mailbox_burst: requests allowed at once per mailbox
+		:param tenant_rate: requests per second allowed per tenant, unlimited if None
+		:param tenant_burst: requests allowed at once per tenant, defaults to the tenant rate
+		:param histogram_bounds: upper bounds of the wait time histogram buckets, in seconds
+		'''
+		self.mailbox_rate = mailbox_rate
+		self.mailbox_burst = mailbox_burst
+		self.tenant_rate = tenant_rate
+		self.tenant_burst = tenant_burst or tenant_rate
+		self.histogram = WaitHistogram(histogram_bounds)
+
+		self.sleep = time.sleep
+		self._lock = threading.Lock()
+		self._mailboxes = {}
+		self._tenants = {}
+
+	def acquire(self, mailbox, tenant=None):
+		'''
+		Blocks until a request for the mailbox may be sent.
+
+		:param mailbox: mailbox the request is for
+		:param tenant: tenant the mailbox belongs to
+		:returns: the seconds waited
+		'''
+		wait = self._bucket(self._mailboxes, (tenant, mailbox), self.mailbox_rate, self.mailbox_burst).reserve()
+		if self.tenant_rate:
+			tenant_bucket = self._bucket(self._tenants, tenant, self.tenant_rate, self.tenant_burst)
+			wait = max(wait, tenant_bucket.reserve())
+
+		self.histogram.observe(wait)
+		if wait > 0:
+			log.debug('Rate limiting mailbox {} for {:.3f}s'.format(mailbox, wait))
+			self.sleep(wait)
+		return wait
+
+	def get_stats(self):
+		''' Returns the histogram of the waits, see WaitHistogram.get_stats '''
+		return self.histogram.get_stats()
+
+	def _bucket(self, buckets, key, rate, burst):
+		with self._lock:
+			bucket = buckets.get(key)
+			if bucket is None:
+				if len(buckets) >= self.max_buckets:
+					self._prune(buckets)
+				bucket = buckets[key] = TokenBucket(rate, burst)
+			return bucket
+
+	@staticmethod
+	def _prune(buckets):
+		''' Drops the full buckets, they are recreated full when needed '''
+		now = time.time()
+		for key in [key for key, bucket in buckets.items() if bucket.is_full(now)]:
+			del buckets[key]
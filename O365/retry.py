@@ -0,0 +1,148 @@
+'''
+Retry policy used by the Connection when the service is throttling requests (429) or temporarily
+unavailable (503, 504), or when a connection error occurs.
+'''
+import logging
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_tz, mktime_tz
+
+log = logging.getLogger(__name__)
+
+
+class RetryPolicy(object):
+	'''
+	Decides whether a request is retried and how long to wait before doing so.
+
+	Waits follow the Retry-After header sent by the server when there is one, an exponential backoff
+	with full jitter otherwise. POST requests are not idempotent, so they are only retried when the
+	server explicitly rejected them (429) unless they are flagged idempotent.
+
+	Variables:
+		retry_statuses -- status codes considered transient.
+		idempotent_methods -- methods that can safely be sent again after any transient failure.
+	'''
+	retry_statuses = (429, 503, 504)
+	idempotent_methods = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'PATCH')
+
+	def __init__(self, max_retries=5, backoff_factor=0.5, max_backoff=60, max_retry_after=300,
+				 mailbox_budget=None, budget_window=600, retry_post=False):
+		'''
+		Creates a retry policy.
+
+		:param max_retries: max no.of retries of a single request
+		:param backoff_factor: base of the exponential backoff, in seconds
+		:param max_backoff: upper bound of the backoff, in seconds
+		:param max_retry_after: give up instead of waiting when the server asks for more seconds than this
+		:param mailbox_budget: max no.of retries per mailbox within budget_window, unlimited if None
+		:param budget_window: length of the mailbox budget window, in seconds
+		:param retry_post: whether POST requests are retried like the idempotent ones
+		'''
+		self.max_retries = max_retries
+		self.backoff_factor = backoff_factor
+		self.max_backoff = max_backoff
+		self.max_retry_after = max_retry_after
+		self.mailbox_budget = mailbox_budget
+		self.budget_window = budget_window
+		self.retry_post = retry_post
+
+		self.sleep = time.sleep
+		self._lock = threading.Lock()
+		self._mailbox_retries = {}
+		self.reset_stats()
+
+	def reset_stats(self):
+		''' Resets the counters '''
+		with self._lock:
+			self._stats = {'retries': 0, 'throttled': 0, 'throttled_time': 0.0, 'gave_up': 0}
+
+	def get_stats(self):
+		'''
+		Returns the counters.
+
+		:returns: dictionary with the no.of retries, of throttled responses (429/503), the seconds
+			spent waiting on throttled responses and the no.of requests given up on
+		'''
+		with self._lock:
+			return dict(self._stats)
+
+	def get_delay(self, method, attempt, mailbox, response=None, error=None, idempotent=None):
+		'''
+		Returns how many seconds to wait before retrying, None if the request is not retried.
+
+		:param method: HTTP method of the request
+		:param attempt: no.of retries already done for this request
+		:param mailbox: mailbox the request is for, used for the budgets
+		:param response: response received, if any
+		:param error: exception raised by the request, if any
+		:param idempotent: whether the request can be safely sent again, guessed from the method if None
+		'''
+		status = response.status_code if response is not None else None
+		if response is not None and status not in self.retry_statuses:
+			return None
+		throttled = status in (429, 503)
+		if throttled:
+			with self._lock:
+				self._stats['throttled'] += 1
+
+		if idempotent is None:
+			idempotent = method.upper() in self.idempotent_methods or self.retry_post
+		# a throttled request was rejected without being processed, it can always be sent again
+		if not idempotent and status != 429:
+			return None
+
+		retry_after = self._retry_after(response) if response is not None else None
+		if attempt >= self.max_retries or (retry_after is not None and retry_after > self.max_retry_after):
+			return self._give_up(method, status, error)
+		if not self._spend_budget(mailbox):
+			log.info('Retry budget of mailbox {} is exhausted'.format(mailbox))
+			return self._give_up(method, status, error)
+
+		if retry_after is not None:
+			delay = retry_after
+		else:
+			delay = random.uniform(0, min(self.max_backoff, self.backoff_factor * (2 ** attempt)))
+
+		with self._lock:
+			self._stats['retries'] += 1
+			if throttled:
+				self._stats['throttled_time'] += delay
+		log.info('Retrying {} request (attempt {}) in {:.2f}s after {}'.format(
+			method, attempt + 1, delay, status or error))
+		return delay
+
+	def _give_up(self, method, status, error):
+		with self._lock:
+			self._stats['gave_up'] += 1
+		log.warning('Giving up {} request after {}'.format(method, status or error))
+		return None
+
+	def _spend_budget(self, mailbox):
+		if self.mailbox_budget is None:
+			return True
+
+		now = time.time()
+		with self._lock:
+			retries = self._mailbox_retries.setdefault(mailbox, deque())
+			while retries and retries[0] <= now - self.budget_window:
+				retries.popleft()
+			if len(retries) >= self.mailbox_budget:
+				return False
+			retries.append(now)
+			return True
+
+	@staticmethod
+	def _retry_after(response):
+		''' Returns the Retry-After header of the response in seconds, None if there is none '''
+		value = response.headers.get('Retry-After') if response.headers else None
+		if not value:
+			return None
+		try:
+			return max(float(value), 0)
+		except ValueError:
+			date = parsedate_tz(value)
+			if date is None:
+				return None
+			return max(mktime_tz(date) - time.time(), 0)
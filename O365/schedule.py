@@ -1,8 +1,19 @@
 from O365.cal import Calendar
 from O365.connection import Connection
+from O365.collection import ItemIndex
+import heapq
 import logging
 import json
+import re
 import requests
+import threading
+import time
+from datetime import datetime, timedelta
+
+try:
+	from queue import Queue, Empty
+except ImportError:
+	from Queue import Queue, Empty
 
 log = logging.getLogger(__name__)
 
@@ -13,48 +24,50 @@ class Schedule( object ):
 	Methods:
 		constructor -- takes your email and password for authentication.
 		getCalendars -- begins the actual process of downloading calendars.
+		fetch_all_events -- downloads the events of every calendar at once.
 
 	Variables:
 		cal_url -- the url that is requested for the retrival of the calendar GUids.
 	'''
 	cal_url = 'https://outlook.office365.com/api/v1.0/me/calendars'
 
-	def __init__(self, auth=None, verify=True):
-		'''Creates a Schedule class for managing all calendars associated with email+password.'''
+	def __init__(self, auth=None, verify=True, connection=None):
+		'''
+		Creates a Schedule class for managing all calendars associated with email+password.
+
+		connection -- the Connection to use, the default connection if None.
+		'''
 		log.debug('setting up for the schedule of the email %s')
 		self.auth = auth
-		self.calendars = []
+		self.connection = connection or Connection()
+		self.calendars = ItemIndex()
 
 		self.verify = verify
 
 	def getCalendars(self):
 		'''Begin the process of downloading calendar metadata.'''
 
-		connection = Connection()
+		connection = self.connection
 
 		# Change URL if we use Oauth
 		if connection.is_valid() and connection.oauth != None:
 			self.cal_url = self.cal_url.replace("outlook.office365.com/api", "graph.microsoft.com")
 
 		log.debug('fetching calendars.')
-		response = connection.get_response(self.cal_url,auth=self.auth,verify=self.verify)
+		response = connection.get_response(self.cal_url,auth=self.auth,verify=self.verify,cached=True)
 		log.info('response from O365 for retriving message attachments: %s', str(response))
 
 		for calendar in response:
 			try:
-				duplicate = False
 				log.debug('Got a calendar with name: {0} and id: {1}'.format(calendar['Name'],calendar['Id']))
-				for i,c in enumerate(self.calendars):
-					if c.json['id'] == calendar['Id']:
-						c.json = calendar
-						c.name = calendar['Name']
-						c.calendarid = calendar['Id']
-						duplicate = True
-						log.debug('Calendar: {0} is a duplicate',calendar['Name'])
-						break
-
-				if not duplicate:
-					self.calendars.append(Calendar(calendar,self.auth))
+				c = self.calendars.get(calendar['Id'])
+				if c is not None:
+					c.json = calendar
+					c.name = calendar['Name']
+					c.calendarid = calendar['Id']
+					log.debug('Calendar: {0} is a duplicate'.format(calendar['Name']))
+				else:
+					self.calendars.upsert(Calendar(calendar,self.auth,self.verify,connection), calendar['Id'])
 					log.debug('appended calendar: %s',calendar['Name'])
 
 				log.debug('Finished with calendar {0} moving on.'.format(calendar['Name']))
@@ -65,4 +78,154 @@ class Schedule( object ):
 		log.debug('all calendars retrieved and put in to the list.')
 		return True
 
+	def fetch_all_events(self, start=None, end=None, workers=8, page_size=100):
+		'''
+		Downloads the events of all the calendars concurrently, see fetch_all_events. The calendars
+		are downloaded first if they were not yet.
+
+		Returns the events sorted by start time and the CalendarFetch report of each calendar.
+		'''
+		if not len(self.calendars):
+			self.getCalendars()
+		return fetch_all_events(self.calendars, start, end, workers, page_size)
+
+
+class CalendarFetch(object):
+	'''
+	Outcome of the download of the events of a calendar by fetch_all_events.
+
+	Variables:
+		calendar -- the Calendar.
+		count -- no.of events downloaded.
+		seconds -- time spent downloading them.
+		error -- the exception raised, None if it worked.
+	'''
+
+	def __init__(self, calendar):
+		self.calendar = calendar
+		self.count = 0
+		self.seconds = 0.0
+		self.error = None
+
+	@property
+	def ok(self):
+		return self.error is None
+
+	def __repr__(self):
+		return '<CalendarFetch {0} events={1} seconds={2:.3f} error={3}>'.format(
+			self.calendar.json['Name'], self.count, self.seconds, self.error)
+
+
+# the UTC names of the time zones Graph and Outlook send back
+_utc_zones = ('UTC', 'GMT', 'Etc/UTC', 'Etc/GMT', 'Coordinated Universal Time', 'tzone://Microsoft/Utc')
+_datetime_pattern = re.compile(r'^(\d{4}-\d\d-\d\dT\d\d:\d\d(?::\d\d)?)(\.\d+)?(Z|[+-]\d\d:?\d\d)?$')
+
+
+def _to_utc(value, zone=None):
+	'''
+	Converts a date time of the API to a naive UTC datetime.
+
+	Keyword Arguments:
+	value -- ISO 8601 date time, with or without an offset ('Z', '+02:00').
+	zone -- time zone of a value without offset, UTC if None. IANA names are looked up with zoneinfo
+		when it is available, Graph being asked for UTC times (see Calendar.getCalendarView).
+	'''
+	match = _datetime_pattern.match(value.strip())
+	if match is None:
+		raise ValueError('Unknown date time format: {0}'.format(value))
+	base, fraction, offset = match.groups()
+	result = datetime.strptime(base, '%Y-%m-%dT%H:%M:%S' if base.count(':') == 2 else '%Y-%m-%dT%H:%M')
+	if fraction:
+		result = result.replace(microsecond=int(fraction[1:7].ljust(6, '0')))
+
+	if offset and offset != 'Z':
+		offset = offset.replace(':', '')
+		delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5]))
+		return result - delta if offset[0] == '+' else result + delta
+	if offset or not zone or zone in _utc_zones:
+		return result
+
+	try:
+		from zoneinfo import ZoneInfo
+		local = result.replace(tzinfo=ZoneInfo(zone))
+	except Exception:
+		log.debug('Unknown time zone {0}, {1} is taken as UTC'.format(zone, value))
+		return result
+	return (local - local.utcoffset()).replace(tzinfo=None)
+
+
+def _start_key(event):
+	'''start time of an event as a naive UTC datetime, Graph ({dateTime, timeZone}) or Outlook REST.'''
+	start = event.json['start']
+	zone = None
+	if isinstance(start, dict):
+		start, zone = start['dateTime'], start['timeZone']
+	if not start:
+		return datetime.min
+	try:
+		return _to_utc(start, zone)
+	except ValueError as e:
+		log.debug(str(e))
+		return datetime.min
+
+
+def fetch_all_events(calendars, start=None, end=None, workers=8, page_size=100):
+	'''
+	Downloads the events between start and end of many calendars, of one or many accounts, with
+	up to workers calendars downloaded at once. See Calendar.getCalendarView.
+
+	Example:
+		calendars = [cal for schedule in schedules for cal in schedule.calendars]
+		events, report = fetch_all_events(calendars, workers=16)
+		for event in events:
+			print(event.getSubject())
+		failed = [fetch.calendar.getName() for fetch in report if not fetch.ok]
+
+	Keyword Arguments:
+	calendars -- iterable of Calendar.
+	start -- struct_time or string, default is now.
+	end -- struct_time or string, default is a year from now.
+	workers -- no.of calendars downloaded at once. The connection pool should hold as many
+	connections, see Connection.configure_pool.
+	page_size -- no.of events per request.
+
+	Returns a tuple of the events of all the calendars merged by start time (a generator), and the
+	list of CalendarFetch reporting the time spent and the error, if any, for each calendar.
+	'''
+	report = [CalendarFetch(calendar) for calendar in calendars]
+	results = [[] for fetch in report]
+	pending = Queue()
+	for index, fetch in enumerate(report):
+		pending.put(index)
+
+	def work():
+		while True:
+			try:
+				index = pending.get_nowait()
+			except Empty:
+				return
+			fetch = report[index]
+			began = time.time()
+			try:
+				events = fetch.calendar.getCalendarView(start, end, page_size)
+				results[index] = sorted(events, key=_start_key)
+				fetch.count = len(events)
+			except Exception as e:
+				log.info('failed to fetch the events of {0}: {1}'.format(fetch.calendar.json['Name'], str(e)))
+				fetch.error = e
+			fetch.seconds = time.time() - began
+
+	threads = [threading.Thread(target=work) for i in range(max(1, min(workers, len(report))))]
+	for thread in threads:
+		thread.daemon = True
+		thread.start()
+	for thread in threads:
+		thread.join()
+
+	# the index of the calendar and of the event break the ties, events are never compared
+	decorated = [[(_start_key(event), index, position, event) for position, event in enumerate(events)]
+				 for index, events in enumerate(results)]
+	merged = (event for key, index, position, event in heapq.merge(*decorated))
+	return merged, report
+
 #To the King!
@@ -0,0 +1,118 @@
+'''
+Incremental parsing of the list responses of the API, {"value": [...], "@odata.nextLink": ...}.
+
+The items of the value array are decoded one at a time while the body is read from the socket,
+so only the item being parsed is held in memory instead of the whole body and its object tree.
+'''
+import codecs
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+_whitespace = ' \t\n\r'
+
+
+class _Reader(object):
+	''' Text buffer filled from an iterator of byte chunks, dropping what was already parsed '''
+
+	def __init__(self, chunks, object_hook=None):
+		self.chunks = iter(chunks)
+		self.decoder = codecs.getincrementaldecoder('utf-8')()
+		self.json_decoder = json.JSONDecoder(object_hook=object_hook)
+		self.buffer = ''
+		self.pos = 0
+		self.eof = False
+
+	def more(self):
+		''' Reads the next chunk, returns False at the end of the body '''
+		if self.eof:
+			return False
+		# drop the parsed text so the buffer stays around the size of one item
+		self.buffer = self.buffer[self.pos:]
+		self.pos = 0
+		try:
+			chunk = next(self.chunks)
+		except StopIteration:
+			self.eof = True
+			self.buffer += self.decoder.decode(b'', final=True)
+			return False
+		self.buffer += self.decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+		return True
+
+	def peek(self):
+		''' Skips the whitespace, returns the next character, None at the end of the body '''
+		while True:
+			while self.pos < len(self.buffer) and self.buffer[self.pos] in _whitespace:
+				self.pos += 1
+			if self.pos < len(self.buffer):
+				return self.buffer[self.pos]
+			if not self.more():
+				return None
+
+	def expect(self, characters):
+		character = self.peek()
+		if character is None or character not in characters:
+			raise ValueError('Expected one of {!r} at offset {}, found {!r}'.format(characters, self.pos, character))
+		self.pos += 1
+		return character
+
+	def decode(self):
+		''' Decodes the next JSON value, reading as many chunks as it needs '''
+		self.peek()
+		while True:
+			try:
+				value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+			except ValueError:
+				# the value is incomplete, at least double what is buffered so large values
+				# are not parsed again for every chunk
+				target = 2 * (len(self.buffer) - self.pos)
+				if not self.more():
+					raise
+				while len(self.buffer) < target and self.more():
+					pass
+				continue
+			# a number at the end of the buffer might go on in the next chunk
+			if end == len(self.buffer) and not self.eof and self.more():
+				continue
+			self.pos = end
+			return value
+
+
+def iter_values(chunks, fields=None, object_hook=None):
+	"""
+	Yields the items of the "value" array of a JSON list response as they are parsed.
+
+	:param chunks: iterator of the byte chunks of the body, e.g. response.iter_content(65536)
+	:param fields: dictionary receiving the other members of the response ('@odata.nextLink'...),
+		complete once the generator is exhausted
+	:param object_hook: object_hook of the json decoder, e.g. connection.micro_object
+	"""
+	reader = _Reader(chunks, object_hook)
+	fields = {} if fields is None else fields
+	found = False
+
+	reader.expect('{')
+	if reader.peek() == '}':
+		reader.pos += 1
+	else:
+		while True:
+			key = reader.decode()
+			reader.expect(':')
+			if key == 'value' and reader.peek() == '[':
+				found = True
+				reader.pos += 1
+				if reader.peek() == ']':
+					reader.pos += 1
+				else:
+					while True:
+						yield reader.decode()
+						if reader.expect(',]') == ']':
+							break
+			else:
+				fields[key] = reader.decode()
+			if reader.expect(',}') == '}':
+				break
+
+	if not found:
+		raise RuntimeError('Something went wrong, received an unexpected result \n{}'.format(fields))
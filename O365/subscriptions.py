@@ -0,0 +1,460 @@
+'''
+Microsoft Graph change notifications: the server calls a webhook when messages (or events, contacts...)
+are created or changed, instead of the mailbox being polled.
+
+Subscriptions are created, renewed and deleted with Subscriptions. NotificationListener is a small
+webhook receiver answering the validation requests of Graph and handing the notifications to
+callbacks. LocalNotifier plays the part of Graph against a listener, to try it out offline.
+'''
+import datetime
+import json
+import logging
+import threading
+import time
+import uuid
+
+try:
+	from http.server import BaseHTTPRequestHandler, HTTPServer
+	from socketserver import ThreadingMixIn
+	from urllib.parse import urlparse, parse_qs
+	from queue import Queue
+except ImportError:
+	from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+	from SocketServer import ThreadingMixIn
+	from urlparse import urlparse, parse_qs
+	from Queue import Queue
+
+import requests
+
+from O365.connection import Connection, micro_object
+
+log = logging.getLogger(__name__)
+
+
+def _graph_time(timestamp):
+	''' Formats a unix timestamp the way Graph expects it, in UTC '''
+	moment = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=timestamp)
+	return moment.strftime('%Y-%m-%dT%H:%M:%S.0000000Z')
+
+
+def _parse_graph_time(value):
+	''' Parses a Graph UTC date time into a unix timestamp '''
+	value = value.rstrip('Z').split('.')[0]
+	parsed = datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S')
+	return (parsed - datetime.datetime(1970, 1, 1)).total_seconds()
+
+
+class Subscriptions(object):
+	'''
+	Change notification subscriptions of a Graph connection.
+
+	Example:
+		subscriptions = Subscriptions()
+		subscriptions.create('me/mailFolders/inbox/messages', 'https://example.com/notifications')
+		...
+		subscriptions.renew_due()
+
+	Methods:
+		create -- subscribes a webhook to the changes of a resource.
+		renew -- pushes the expiration of a subscription back.
+		renew_due -- renews the subscriptions about to expire.
+		delete -- deletes a subscription.
+		client_states -- the secrets the notifications of the subscriptions carry.
+
+	Variables:
+		subscriptions_url -- url of the subscriptions.
+		lifetime -- no.of minutes a subscription lasts, Graph allows a bit less than 3 days for messages.
+	'''
+	subscriptions_url = 'https://graph.microsoft.com/v1.0/subscriptions'
+	lifetime = 4200
+
+	def __init__(self, connection=None, verify=True):
+		'''
+		:param connection: the Connection to use, the default connection if None. Subscriptions need
+			the Microsoft Graph API
+		:param verify: whether or not to verify SSL certificate
+		'''
+		self.connection = connection or Connection()
+		self.verify = verify
+		self.subscriptions = {}
+		self._lock = threading.Lock()
+
+	def _check(self):
+		if self.connection.api_version != '2.0':
+			raise RuntimeError('Subscriptions require the Microsoft Graph API, please use '
+							   '"Connection.oauth2" to configure the connection')
+
+	def create(self, resource, notification_url, change_type='created', client_state=None, lifetime=None):
+		'''
+		Subscribes a webhook to the changes of a resource. Graph first checks the webhook with a
+		validation request, which a running NotificationListener answers.
+
+		:param resource: resource to watch, like 'me/mailFolders/inbox/messages'
+		:param notification_url: https url of the webhook
+		:param change_type: comma separated changes to notify: created, updated, deleted
+		:param client_state: secret sent back with every notification, a random one if None
+		:param lifetime: no.of minutes before the subscription expires, see lifetime
+		:returns: the subscription data
+		'''
+		self._check()
+		data = {
+			'changeType': change_type,
+			'notificationUrl': notification_url,
+			'resource': resource,
+			'expirationDateTime': _graph_time(time.time() + 60 * (lifetime or self.lifetime)),
+			'clientState': client_state or uuid.uuid4().hex,
+		}
+		headers = {'Content-Type': 'application/json'}
+		subscription = self.connection.post_data(self.subscriptions_url, json.dumps(data),
+												  headers=headers, verify=self.verify)
+		# the client state is not sent back
+		subscription['clientState'] = data['clientState']
+		with self._lock:
+			self.subscriptions[subscription['id']] = subscription
+		log.info('subscribed to {} until {}'.format(resource, subscription.get('expirationDateTime')))
+		return subscription
+
+	def renew(self, subscription_id, lifetime=None):
+		'''
+		Pushes the expiration of a subscription back.
+
+		:param subscription_id: id of the subscription
+		:param lifetime: no.of minutes from now before it expires, see lifetime
+		:returns: the subscription data
+		'''
+		self._check()
+		data = {'expirationDateTime': _graph_time(time.time() + 60 * (lifetime or self.lifetime))}
+		headers = {'Content-Type': 'application/json'}
+		renewed = self.connection.patch_data('{}/{}'.format(self.subscriptions_url, subscription_id),
+											 json.dumps(data), headers=headers, verify=self.verify)
+		with self._lock:
+			subscription = self.subscriptions.setdefault(subscription_id, {})
+			subscription.update(renewed)
+		log.debug('renewed subscription {} until {}'.format(subscription_id, renewed.get('expirationDateTime')))
+		return subscription
+
+	def renew_due(self, margin=3600):
+		'''
+		Renews the subscriptions expiring in less than margin seconds, to be called periodically.
+
+		Subscriptions that expired or that Graph deleted are created again, the other failures are
+		logged and retried on the next call.
+
+		:param margin: no.of seconds before the expiration a subscription is renewed
+		:returns: list of the subscriptions renewed or created again
+		'''
+		with self._lock:
+			due = [subscription_id for subscription_id, subscription in self.subscriptions.items()
+				   if _parse_graph_time(subscription['expirationDateTime']) - margin <= time.time()]
+
+		renewed = []
+		for subscription_id in due:
+			try:
+				renewed.append(self.renew(subscription_id))
+			except Exception as e:
+				# an expired or deleted subscription can't be renewed, a new one replaces it
+				subscription = self.subscriptions.get(subscription_id)
+				expired = _parse_graph_time(subscription['expirationDateTime']) <= time.time()
+				if not expired and self._exists(subscription_id) is not False:
+					log.error('failed to renew subscription {}, retrying later: {}'.format(subscription_id, str(e)))
+					continue
+				try:
+					renewed.append(self._recreate(subscription_id))
+				except Exception as e:
+					log.error('failed to subscribe again to {}: {}'.format(subscription['resource'], str(e)))
+		return renewed
+
+	def _exists(self, subscription_id):
+		''' False if Graph doesn't know the subscription anymore, None if it can't be told '''
+		try:
+			response = self.connection.send_request(
+				'GET', '{}/{}'.format(self.subscriptions_url, subscription_id), verify=self.verify)
+		except Exception:
+			return None
+		if response.status_code == 404:
+			return False
+		return True if response.status_code == 200 else None
+
+	def _recreate(self, subscription_id):
+		''' Replaces a subscription by a new one for the same resource, with the same client state '''
+		with self._lock:
+			old = self.subscriptions[subscription_id]
+		subscription = self.create(old['resource'], old['notificationUrl'], change_type=old['changeType'],
+								   client_state=old['clientState'])
+		with self._lock:
+			self.subscriptions.pop(subscription_id, None)
+		log.info('subscription {} expired, replaced by {}'.format(subscription_id, subscription['id']))
+		return subscription
+
+	def delete(self, subscription_id):
+		'''
+		Deletes a subscription, no more notifications are sent for it.
+
+		:param subscription_id: id of the subscription
+		'''
+		self._check()
+		self.connection.delete_data('{}/{}'.format(self.subscriptions_url, subscription_id),
+									verify=self.verify)
+		with self._lock:
+			self.subscriptions.pop(subscription_id, None)
+		log.info('deleted subscription {}'.format(subscription_id))
+		return True
+
+	def client_states(self):
+		''' Returns the client states of the subscriptions, see NotificationListener '''
+		with self._lock:
+			return set(subscription['clientState'] for subscription in self.subscriptions.values()
+					   if subscription.get('clientState'))
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+
+class _NotificationHandler(BaseHTTPRequestHandler):
+	''' Answers the requests of Graph for a NotificationListener (the server's listener) '''
+
+	def log_message(self, format, *args):
+		log.debug('webhook: ' + format, *args)
+
+	def _reply(self, status, body=b'', content_type='text/plain'):
+		self.send_response(status)
+		self.send_header('Content-Type', content_type)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_GET(self):
+		self.do_POST()
+
+	def do_POST(self):
+		listener = self.server.listener
+		url = urlparse(self.path)
+		if url.path != listener.path:
+			return self._reply(404)
+
+		# the webhook is checked by echoing the token when a subscription is created
+		token = parse_qs(url.query).get('validationToken')
+		if token:
+			return self._reply(200, token[0].encode('utf-8'))
+
+		length = int(self.headers.get('Content-Length') or 0)
+		try:
+			notifications = json.loads(self.rfile.read(length).decode('utf-8'), object_hook=micro_object)['value']
+		except (ValueError, KeyError, TypeError):
+			return self._reply(400)
+
+		# only queued, so the answer is sent right away: Graph gives up on slow webhooks
+		for notification in notifications:
+			listener.receive(notification)
+		self._reply(202)
+
+
+class NotificationListener(object):
+	'''
+	Webhook receiver for Graph change notifications, calling back for each notification. The
+	callbacks run one at a time on a dispatcher thread, so a slow callback doesn't delay the answer
+	Graph waits for.
+
+	Graph needs a public https url, run the listener behind a reverse proxy or a tunnel.
+
+	Example:
+		subscriptions = Subscriptions()
+		listener = NotificationListener(port=8000, subscriptions=subscriptions)
+		listener.add_callback(lambda notification: print(notification['resourceData']['id']),
+							  change_type='created')
+		listener.start()
+		subscriptions.create('me/mailFolders/inbox/messages', 'https://example.com/notifications')
+	'''
+
+	def __init__(self, host='0.0.0.0', port=8000, path='/notifications', subscriptions=None, client_states=None):
+		'''
+		:param host: address to listen on
+		:param port: port to listen on, 0 for any free port
+		:param path: path of the webhook
+		:param subscriptions: Subscriptions whose client states are accepted
+		:param client_states: other client states accepted. Notifications with an unknown client
+			state are dropped. When neither this nor subscriptions is given every notification is accepted
+		'''
+		self.host = host
+		self.port = port
+		self.path = path
+		self.subscriptions = subscriptions
+		self.client_states = set(client_states or ())
+		self.callbacks = []
+		self.stats = {'received': 0, 'rejected': 0, 'failed': 0}
+		self._stats_lock = threading.Lock()
+		self._queue = Queue()
+		self._server = None
+		self._threads = []
+		self._state_lock = threading.RLock()
+
+	def add_callback(self, callback, change_type=None, resource=None):
+		'''
+		:param callback: function called with each notification
+		:param change_type: only the notifications of this change (created, updated, deleted)
+		:param resource: only the notifications whose resource contains this text
+		'''
+		self.callbacks.append((callback, change_type, resource))
+		return self
+
+	def _count(self, name):
+		with self._stats_lock:
+			self.stats[name] += 1
+
+	def _accepts(self, client_state):
+		states = set(self.client_states)
+		if self.subscriptions is not None:
+			states |= self.subscriptions.client_states()
+		elif not states:
+			return True
+		return client_state in states
+
+	def receive(self, notification):
+		''' Queues a notification for the callbacks if its client state is known '''
+		if not self._accepts(notification['clientState']):
+			log.warning('dropped a notification with an unknown client state for {}'.format(notification['resource']))
+			self._count('rejected')
+			return False
+		self._count('received')
+		self._queue.put(notification)
+		return True
+
+	def dispatch(self, notification):
+		''' Calls the callbacks matching a notification '''
+		for callback, change_type, resource in self.callbacks:
+			if change_type is not None and notification['changeType'] != change_type:
+				continue
+			if resource is not None and resource.lower() not in (notification['resource'] or '').lower():
+				continue
+			try:
+				callback(notification)
+			except Exception as e:
+				log.error('notification callback failed: {}'.format(str(e)))
+				self._count('failed')
+
+	def _dispatch_forever(self):
+		while True:
+			notification = self._queue.get()
+			try:
+				if notification is None:
+					return
+				self.dispatch(notification)
+			finally:
+				self._queue.task_done()
+
+	def start(self):
+		''' Starts listening on background threads, returns the listener. Does nothing if it is
+		already listening '''
+		with self._state_lock:
+			if self._server is not None:
+				return self
+			self._server = _ThreadingHTTPServer((self.host, self.port), _NotificationHandler)
+			self._server.listener = self
+			self.port = self._server.server_address[1]
+			self._threads = [threading.Thread(target=self._server.serve_forever),
+							 threading.Thread(target=self._dispatch_forever)]
+			for thread in self._threads:
+				thread.daemon = True
+				thread.start()
+		log.info('listening for notifications on {}'.format(self.url))
+		return self
+
+	def join(self):
+		''' Waits for the callbacks of the notifications received so far '''
+		self._queue.join()
+
+	def stop(self):
+		''' Stops listening, once the notifications received are dispatched '''
+		with self._state_lock:
+			server, self._server = self._server, None
+			if server is None:
+				return
+			server.shutdown()
+			server.server_close()
+			self._queue.put(None)
+			for thread in self._threads:
+				thread.join()
+			self._threads = []
+
+	def serve_forever(self, subscriptions=None, renew_interval=600):
+		'''
+		Listens until interrupted or stopped, renewing the subscriptions about to expire. Starts the
+		listener if start was not called. Failed renewals are logged and retried on the next check.
+
+		:param subscriptions: Subscriptions renewed periodically, the ones of the listener if None
+		:param renew_interval: no.of seconds between two renewal checks
+		'''
+		subscriptions = subscriptions or self.subscriptions
+		self.start()
+		try:
+			while self._server is not None:
+				time.sleep(renew_interval)
+				if subscriptions is not None:
+					try:
+						subscriptions.renew_due(margin=2 * renew_interval)
+					except Exception as e:
+						log.error('failed to renew the subscriptions: {}'.format(str(e)))
+		finally:
+			self.stop()
+
+	@property
+	def url(self):
+		''' Local url of the webhook '''
+		host = '127.0.0.1' if self.host in ('', '0.0.0.0') else self.host
+		return 'http://{}:{}{}'.format(host, self.port, self.path)
+
+
+class LocalNotifier(object):
+	'''
+	Stand-in for Graph sending validation requests and notifications to a listener, to develop
+	and test the callbacks offline.
+
+	Example:
+		notifier = LocalNotifier(listener.url, client_state='secret')
+		notifier.validate()
+		notifier.notify('Users/me/Messages/AAMkAD', resource_id='AAMkAD')
+	'''
+
+	def __init__(self, url, client_state=None, subscription_id=None):
+		'''
+		:param url: url of the webhook
+		:param client_state: client state sent with the notifications
+		:param subscription_id: id of the subscription the notifications are sent for
+		'''
+		self.url = url
+		self.client_state = client_state
+		self.subscription_id = subscription_id or str(uuid.uuid4())
+		self.session = requests.Session()
+
+	def validate(self):
+		''' Sends a validation request like Graph does on create, True if the token is echoed '''
+		token = uuid.uuid4().hex
+		response = self.session.post(self.url, params={'validationToken': token})
+		return response.status_code == 200 and response.text == token
+
+	def notify(self, resource, change_type='created', resource_id=None, **resource_data):
+		'''
+		Sends a change notification.
+
+		:param resource: resource that changed, like 'Users/{user-id}/Messages/{message-id}'
+		:param change_type: created, updated or deleted
+		:param resource_id: id of the item that changed, the end of the resource if None
+		:param resource_data: other fields of the resourceData
+		:returns: the status code of the webhook
+		'''
+		data = dict(resource_data)
+		data['id'] = resource_id or resource.rstrip('/').split('/')[-1]
+		notification = {
+			'subscriptionId': self.subscription_id,
+			'subscriptionExpirationDateTime': _graph_time(time.time() + 3600),
+			'changeType': change_type,
+			'resource': resource,
+			'resourceData': data,
+			'clientState': self.client_state,
+			'tenantId': '',
+		}
+		response = self.session.post(self.url, data=json.dumps({'value': [notification]}),
+									 headers={'Content-Type': 'application/json'})
+		return response.status_code
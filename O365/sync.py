@@ -0,0 +1,245 @@
+'''
+State stores used by FluentInbox.sync to remember where the previous synchronisation stopped.
+
+A state store keeps, for every synchronised folder, the delta link returned by the server and the
+ids of the messages seen so far, so a sync can tell new messages from changed ones.
+'''
+import json
+import logging
+import os
+import os.path as path
+import sqlite3
+import threading
+
+from O365._fileutil import atomic_write
+
+log = logging.getLogger(__name__)
+
+
+class SyncResult(object):
+	'''
+	Changes found by a FluentInbox.sync call.
+
+	Variables:
+		added -- messages that were not seen by a previous sync.
+		changed -- messages seen before that were modified since.
+		removed -- ids of the messages deleted (or moved out of the folder) since.
+	'''
+
+	def __init__(self):
+		self.added = []
+		self.changed = []
+		self.removed = []
+
+	def __len__(self):
+		return len(self.added) + len(self.changed) + len(self.removed)
+
+	def __repr__(self):
+		return '<SyncResult added={} changed={} removed={}>'.format(
+			len(self.added), len(self.changed), len(self.removed))
+
+
+class StateStore(object):
+	'''
+	Interface of the sync state stores, every method takes the key identifying the synced folder.
+	'''
+
+	def get_delta_link(self, key):
+		""" Returns the delta link saved by the last sync, None if the folder was never synced """
+		raise NotImplementedError
+
+	def is_known(self, key, item_id):
+		""" Returns whether the item was seen by a previous sync """
+		raise NotImplementedError
+
+	def save(self, key, delta_link, seen_ids, removed_ids):
+		""" Saves the outcome of a sync in one go
+
+		:param key: key of the synced folder
+		:param delta_link: delta link to resume from next time
+		:param seen_ids: ids of the items added or changed
+		:param removed_ids: ids of the items removed
+		"""
+		raise NotImplementedError
+
+	def clear(self, key):
+		""" Forgets everything about the folder, the next sync starts from scratch """
+		raise NotImplementedError
+
+
+class MemoryStateStore(StateStore):
+	'''State store living in memory only, mostly useful for tests and short lived scripts.'''
+
+	def __init__(self):
+		self._states = {}
+		self._lock = threading.Lock()
+
+	def _state(self, key):
+		return self._states.setdefault(key, {'delta_link': None, 'ids': set()})
+
+	def get_delta_link(self, key):
+		with self._lock:
+			return self._state(key)['delta_link']
+
+	def is_known(self, key, item_id):
+		with self._lock:
+			return item_id in self._state(key)['ids']
+
+	def save(self, key, delta_link, seen_ids, removed_ids):
+		with self._lock:
+			state = self._state(key)
+			state['ids'].update(seen_ids)
+			state['ids'].difference_update(removed_ids)
+			state['delta_link'] = delta_link
+
+	def clear(self, key):
+		with self._lock:
+			self._states.pop(key, None)
+
+
+class FileStateStore(MemoryStateStore):
+	'''
+	State store saved as JSON files. The delta links are kept in file_path, rewritten atomically
+	after every sync. The seen ids are kept in file_path + '.ids', a journal that every sync only
+	appends the ids it added and removed to, compacted once it is much larger than the ids it holds.
+	'''
+	# the journal is compacted when it holds more than compact_ratio times the no.of known ids
+	compact_ratio = 2
+
+	def __init__(self, file_path):
+		""" Loads the state saved at file_path, if any
+
+		:param file_path: path of the JSON file with the delta links
+		"""
+		super(FileStateStore, self).__init__()
+		self.file_path = file_path
+		self.ids_path = file_path + '.ids'
+		self._journal_size = 0
+
+		rewrite = False
+		if path.exists(file_path):
+			with open(file_path, 'r') as state_file:
+				for key, state in json.load(state_file).items():
+					if isinstance(state, dict):
+						# saved with the ids by a previous version
+						self._states[key] = {'delta_link': state['delta_link'], 'ids': set(state['ids'])}
+						rewrite = True
+					else:
+						self._state(key)['delta_link'] = state
+
+		if path.exists(self.ids_path):
+			with open(self.ids_path, 'r') as ids_file:
+				for line in ids_file:
+					try:
+						entry = json.loads(line)
+					except ValueError:
+						# the last line was cut short by a crash, it is dropped
+						rewrite = True
+						break
+					self._apply(entry)
+					self._journal_size += 1 + len(entry.get('added', ())) + len(entry.get('removed', ()))
+
+		if rewrite:
+			with self._lock:
+				self._compact()
+				self._write_links()
+
+	def _apply(self, entry):
+		if entry.get('clear'):
+			self._states.pop(entry['key'], None)
+			return
+		ids = self._state(entry['key'])['ids']
+		ids.update(entry.get('added', ()))
+		ids.difference_update(entry.get('removed', ()))
+
+	def save(self, key, delta_link, seen_ids, removed_ids):
+		with self._lock:
+			known = self._state(key)['ids']
+			removed_ids = set(removed_ids)
+			entry = {'key': key,
+					 'added': [item_id for item_id in seen_ids if item_id not in known and item_id not in removed_ids],
+					 'removed': [item_id for item_id in removed_ids if item_id in known]}
+			self._apply(entry)
+			self._state(key)['delta_link'] = delta_link
+			# the ids first, so a crash in between only makes the next sync read this delta again
+			self._append(entry)
+			self._write_links()
+
+	def clear(self, key):
+		with self._lock:
+			self._states.pop(key, None)
+			self._append({'key': key, 'clear': True})
+			self._write_links()
+
+	def _append(self, entry):
+		known = sum(len(state['ids']) for state in self._states.values())
+		if self._journal_size > self.compact_ratio * known + 1000:
+			self._compact()
+			return
+		with open(self.ids_path, 'a') as ids_file:
+			ids_file.write(json.dumps(entry) + '\n')
+			ids_file.flush()
+			os.fsync(ids_file.fileno())
+		self._journal_size += 1 + len(entry.get('added', ())) + len(entry.get('removed', ()))
+
+	def _compact(self):
+		''' Rewrites the journal with one line per key holding its ids '''
+		lines = [json.dumps({'key': key, 'added': sorted(state['ids'])}) + '\n'
+				 for key, state in self._states.items() if state['ids']]
+		atomic_write(self.ids_path, ''.join(lines))
+		self._journal_size = sum(1 + len(state['ids']) for state in self._states.values())
+		log.debug('sync ids compacted in {}'.format(self.ids_path))
+
+	def _write_links(self):
+		content = json.dumps(dict((key, state['delta_link']) for key, state in self._states.items()))
+		atomic_write(self.file_path, content)
+		log.debug('sync state saved to {}'.format(self.file_path))
+
+
+class SqliteStateStore(StateStore):
+	'''
+	State store saved in a sqlite database, the seen ids are looked up in the database instead of
+	being held in memory which suits very large mailboxes.
+	'''
+
+	def __init__(self, db_path):
+		""" Opens (and creates if needed) the database at db_path
+
+		:param db_path: path of the sqlite database
+		"""
+		self.db_path = db_path
+		self._lock = threading.Lock()
+		self._db = sqlite3.connect(db_path, check_same_thread=False)
+		with self._db:
+			self._db.execute('CREATE TABLE IF NOT EXISTS sync_links '
+							 '(key TEXT PRIMARY KEY, delta_link TEXT)')
+			self._db.execute('CREATE TABLE IF NOT EXISTS sync_items '
+							 '(key TEXT, item_id TEXT, PRIMARY KEY (key, item_id))')
+
+	def get_delta_link(self, key):
+		with self._lock:
+			row = self._db.execute('SELECT delta_link FROM sync_links WHERE key = ?', (key,)).fetchone()
+		return row[0] if row else None
+
+	def is_known(self, key, item_id):
+		with self._lock:
+			row = self._db.execute('SELECT 1 FROM sync_items WHERE key = ? AND item_id = ?',
+								   (key, item_id)).fetchone()
+		return row is not None
+
+	def save(self, key, delta_link, seen_ids, removed_ids):
+		with self._lock, self._db:
+			self._db.executemany('INSERT OR IGNORE INTO sync_items (key, item_id) VALUES (?, ?)',
+								 [(key, item_id) for item_id in seen_ids])
+			self._db.executemany('DELETE FROM sync_items WHERE key = ? AND item_id = ?',
+								 [(key, item_id) for item_id in removed_ids])
+			self._db.execute('INSERT OR REPLACE INTO sync_links (key, delta_link) VALUES (?, ?)',
+							 (key, delta_link))
+
+	def clear(self, key):
+		with self._lock, self._db:
+			self._db.execute('DELETE FROM sync_items WHERE key = ?', (key,))
+			self._db.execute('DELETE FROM sync_links WHERE key = ?', (key,))
+
+	def close(self):
+		self._db.close()
@@ -0,0 +1,78 @@
+'''
+Message templates, for sending many messages that only differ by their subject or body.
+
+The request of the message is serialized once when the template is made, recipients and
+attachments included. Sending only serializes the subject and the body and splices them in, instead
+of copying the message and serializing all of it again.
+'''
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class MessageTemplate(object):
+	'''
+	Precompiled request sending a message (O365.Message or fluent Message).
+
+	Example:
+		message = Message(auth=auth)
+		message.setRecipients('ops@example.com')
+		message.setSubject('Disk alert')
+		message.setBody('Disk usage report:\n')
+		template = MessageTemplate(message)
+		for host, usage in alerts:
+			template.send('{} is {}% full'.format(host, usage))
+
+	Changes made to the message after the template was made are not sent.
+	'''
+	# stand-ins for the subject and body, unlikely to be in any message
+	_marks = {'subject': u'\x00subject\x00', 'body': u'\x00body\x00'}
+
+	def __init__(self, message, **kwargs):
+		'''
+		:param message: the message to send, its subject and body are the default ones
+		:param kwargs: arguments of the message's send request, like user_id for a fluent Message
+		'''
+		if any(att.isLarge() for att in message.attachments):
+			raise RuntimeError('Attachments too large to be sent inline can not be part of a template')
+
+		self.message = message
+		self.kwargs = kwargs
+		self.subject = message.json.get('Subject') or ''
+		self.body = (message.json.get('Body') or {}).get('Content') or ''
+
+		data = json.dumps(message._sendData(subject=self._marks['subject'], body=self._marks['body']))
+		positions = sorted((data.index(json.dumps(mark)), field) for field, mark in self._marks.items())
+		self._fields = [field for position, field in positions]
+		self._parts = []
+		start = 0
+		for position, field in positions:
+			self._parts.append(data[start:position])
+			start = position + len(json.dumps(self._marks[field]))
+		self._parts.append(data[start:])
+
+	def render(self, body='', subject=None):
+		'''
+		Returns the json string of the request.
+
+		:param body: text appended to the body of the template
+		:param subject: subject replacing the one of the template
+		'''
+		values = {
+			'subject': json.dumps(self.subject if subject is None else subject),
+			'body': json.dumps(self.body + body),
+		}
+		first, second = self._fields
+		before, between, after = self._parts
+		return before + values[first] + between + values[second] + after
+
+	def send(self, body='', subject=None):
+		'''
+		Sends a message built from the template.
+
+		:param body: text appended to the body of the template
+		:param subject: subject replacing the one of the template
+		:returns: True if it was sent
+		'''
+		return self.message._post(self.render(body, subject), **self.kwargs)
@@ -0,0 +1,153 @@
+'''
+Token stores keeping the OAuth token between runs, and sharing it between the processes using the
+same app registration.
+
+A store is locked while the token is refreshed, so when several processes find the token expired
+only the first one refreshes it, the others pick the new token up from the store.
+'''
+import json
+import logging
+import os
+import os.path as path
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from O365._fileutil import atomic_write
+
+try:
+	import fcntl
+except ImportError:
+	# no advisory file locks (Windows), the lock only covers the threads of this process
+	fcntl = None
+
+log = logging.getLogger(__name__)
+
+
+class TokenStore(object):
+	'''
+	Interface of the token stores.
+	'''
+
+	def load(self):
+		""" Returns the saved token dictionary, None if there is none """
+		raise NotImplementedError
+
+	def save(self, token):
+		""" Saves the token dictionary, replacing the previous one """
+		raise NotImplementedError
+
+	def delete(self):
+		""" Forgets the saved token """
+		raise NotImplementedError
+
+	@contextmanager
+	def lock(self):
+		""" Context manager holding the store for the other threads and processes, while the token
+		is being refreshed. load and save can be called while holding it """
+		yield
+
+
+class FileTokenStore(TokenStore):
+	'''
+	Token saved as a JSON file. The file is replaced atomically so readers never see a half
+	written token, and refreshes are serialized with an advisory lock on a sibling .lock file.
+	'''
+
+	def __init__(self, token_path):
+		""" Creates a store for the token at token_path
+
+		:param token_path: path of the JSON file
+		"""
+		self.token_path = token_path
+		self._lock = threading.RLock()
+		self._depth = 0
+		self._lock_file = None
+
+	def load(self):
+		if not path.exists(self.token_path):
+			return None
+		with open(self.token_path, 'r') as token_file:
+			return json.load(token_file)
+
+	def save(self, token):
+		with self.lock():
+			atomic_write(self.token_path, json.dumps(token, indent=True))
+		log.debug('token saved to {}'.format(self.token_path))
+
+	def delete(self):
+		with self.lock():
+			if path.exists(self.token_path):
+				os.unlink(self.token_path)
+
+	@contextmanager
+	def lock(self):
+		with self._lock:
+			if self._depth == 0 and fcntl is not None:
+				self._lock_file = open(self.token_path + '.lock', 'a')
+				fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+			self._depth += 1
+			try:
+				yield
+			finally:
+				self._depth -= 1
+				if self._depth == 0 and self._lock_file is not None:
+					fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+					self._lock_file.close()
+					self._lock_file = None
+
+
+class SqliteTokenStore(TokenStore):
+	'''
+	Token saved in a sqlite database, several tokens can be kept in the same database under
+	different names. Refreshes are serialized with an immediate (write) transaction.
+	'''
+
+	def __init__(self, db_path, name='default'):
+		""" Opens (and creates if needed) the database at db_path
+
+		:param db_path: path of the sqlite database
+		:param name: name the token is saved under
+		"""
+		self.db_path = db_path
+		self.name = name
+		self._lock = threading.RLock()
+		self._depth = 0
+		# transactions are handled by hand, to hold the write lock across load and save
+		self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=60)
+		self._db.execute('CREATE TABLE IF NOT EXISTS tokens (name TEXT PRIMARY KEY, token TEXT)')
+
+	def load(self):
+		with self._lock:
+			row = self._db.execute('SELECT token FROM tokens WHERE name = ?', (self.name,)).fetchone()
+		return json.loads(row[0]) if row else None
+
+	def save(self, token):
+		with self._lock:
+			self._db.execute('INSERT OR REPLACE INTO tokens (name, token) VALUES (?, ?)',
+							 (self.name, json.dumps(token)))
+
+	def delete(self):
+		with self._lock:
+			self._db.execute('DELETE FROM tokens WHERE name = ?', (self.name,))
+
+	@contextmanager
+	def lock(self):
+		with self._lock:
+			if self._depth == 0:
+				self._db.execute('BEGIN IMMEDIATE')
+			self._depth += 1
+			try:
+				yield
+			except BaseException:
+				self._depth -= 1
+				if self._depth == 0:
+					# nothing the failed refresh wrote is kept
+					self._db.execute('ROLLBACK')
+				raise
+			self._depth -= 1
+			if self._depth == 0:
+				self._db.execute('COMMIT')
+
+	def close(self):
+		self._db.close()
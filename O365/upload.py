@@ -0,0 +1,188 @@
+'''
+Microsoft Graph upload sessions, used to attach files too large to be sent inline in a JSON body
+(about 3 MB). The file is sent in ranges read from disk one at a time, and an interrupted upload
+resumes from the ranges the server is still expecting.
+'''
+import json
+import logging
+import os
+
+import requests
+
+from O365.connection import Connection
+from O365.retry import RetryPolicy
+
+log = logging.getLogger(__name__)
+
+
+class UploadSession(object):
+	'''
+	Upload of a file to a Graph upload session.
+
+	Example:
+		upload = UploadSession.create(attachments_url, '/data/report.pdf', Connection().oauth)
+		try:
+			upload.upload()
+		except requests.ConnectionError:
+			# later, or in another process with the saved upload_url
+			UploadSession(upload.upload_url, '/data/report.pdf').resume()
+
+	Variables:
+		chunk_size -- no.of bytes sent per request, Graph requires a multiple of 320 KiB.
+		max_failures -- no.of consecutive failed ranges before giving up, the retry policy can give
+			up sooner.
+	'''
+	chunk_size = 10 * 320 * 1024
+	max_failures = 5
+
+	def __init__(self, upload_url, file_path, chunk_size=None, session=None, verify=True, retry_policy=None):
+		'''
+		:param upload_url: url of the upload session returned by createUploadSession
+		:param file_path: path of the file to upload
+		:param chunk_size: no.of bytes sent per request, a multiple of 320 KiB
+		:param session: session sending the ranges. The upload url is pre-authenticated so it
+			must not add an Authorization header, the pooled session of the connection if None
+		:param verify: whether or not to verify SSL certificate
+		:param retry_policy: RetryPolicy deciding the waits before a failed range is sent again, the
+			one of the default connection if None
+		'''
+		self.upload_url = upload_url
+		self.file_path = file_path
+		self.size = os.path.getsize(file_path)
+		if chunk_size:
+			self.chunk_size = chunk_size
+		self.session = session
+		self.verify = verify
+		self.next_ranges = ['0-']
+		self.response = None
+		self.retry_policy = retry_policy or Connection().retry_policy or RetryPolicy()
+
+	@classmethod
+	def create(cls, attachments_url, file_path, oauth, name=None, verify=True, connection=None, **kwargs):
+		'''
+		Creates an upload session for a file attachment of a message.
+
+		:param attachments_url: url of the attachments of the message
+		:param file_path: path of the file to upload
+		:param oauth: OAuth2Session of the connection, creating the upload session
+		:param name: name of the attachment, the name of the file if None
+		:param verify: whether or not to verify SSL certificate
+		:param connection: Connection sending the request creating the upload session, refreshing
+			its token and retrying when throttled. The request is sent with oauth if None
+		:param kwargs: arguments of the UploadSession
+		:returns: the UploadSession, ready to upload
+		'''
+		if oauth is None and connection is None:
+			raise RuntimeError('Upload sessions require the Microsoft Graph API, please use '
+							   '"Connection.oauth2" to configure the connection')
+
+		size = os.path.getsize(file_path)
+		name = name or os.path.basename(file_path)
+		data = {'AttachmentItem': {'attachmentType': 'file', 'name': name, 'size': size}}
+		headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+		if connection is not None:
+			response = connection.send_request('POST', attachments_url + '/createUploadSession',
+											   data=json.dumps(data), headers=headers, verify=verify)
+		else:
+			response = oauth.post(attachments_url + '/createUploadSession', json.dumps(data),
+								  headers=headers, verify=verify)
+		if response.status_code not in (200, 201):
+			raise RuntimeError('Unable to create an upload session for {}, status code {}: {}'.format(
+				name, response.status_code, response.text))
+
+		log.debug('upload session created for {} ({} bytes)'.format(name, size))
+		upload = cls(response.json()['uploadUrl'], file_path, verify=verify, **kwargs)
+		upload.next_ranges = response.json().get('nextExpectedRanges') or ['0-']
+		return upload
+
+	def _wait(self, failures, response=None, error=None):
+		''' Waits before sending a failed range again, as told by the retry policy (Retry-After or
+		backoff). Returns False if the policy gives up '''
+		policy = self.retry_policy
+		# the other server errors are retried like the transient ones
+		if response is not None and response.status_code not in policy.retry_statuses:
+			response = None
+			error = error or 'server error'
+		delay = policy.get_delay('PUT', failures - 1, None, response=response, error=error, idempotent=True)
+		if delay is None:
+			return False
+		policy.sleep(delay)
+		return True
+
+	def _session(self):
+		if self.session is None:
+			self.session = Connection.get_session()
+		return self.session
+
+	def _next_start(self):
+		''' Returns the offset of the first byte the server is expecting, None once complete '''
+		if not self.next_ranges:
+			return None
+		return int(self.next_ranges[0].split('-')[0])
+
+	def status(self):
+		'''
+		Asks the server which ranges it is still expecting.
+
+		:returns: list of the expected ranges, like ['3276800-']
+		'''
+		response = self._session().get(self.upload_url, verify=self.verify)
+		if response.status_code != 200:
+			raise RuntimeError('Unable to get the status of the upload, status code {}'.format(
+				response.status_code))
+		self.next_ranges = response.json().get('nextExpectedRanges') or []
+		return self.next_ranges
+
+	def resume(self):
+		''' Continues an interrupted upload from the ranges the server is expecting '''
+		self.status()
+		return self.upload()
+
+	def upload(self):
+		'''
+		Sends the file, a range at a time read from disk, from the first range the server expects.
+
+		:returns: the response of the last range
+		'''
+		failures = 0
+		with open(self.file_path, 'rb') as upload_file:
+			start = self._next_start()
+			while start is not None and start < self.size:
+				upload_file.seek(start)
+				chunk = upload_file.read(self.chunk_size)
+				end = start + len(chunk) - 1
+				headers = {'Content-Length': str(len(chunk)),
+						   'Content-Range': 'bytes {}-{}/{}'.format(start, end, self.size)}
+				try:
+					response = self._session().put(self.upload_url, data=chunk, headers=headers,
+												   verify=self.verify)
+				except (requests.ConnectionError, requests.Timeout) as e:
+					failures += 1
+					if failures >= self.max_failures or not self._wait(failures, error=e):
+						raise
+					log.info('range {}-{} failed ({}), asking where to resume'.format(start, end, e))
+					self.status()
+					start = self._next_start()
+					continue
+
+				if response.status_code in (200, 201, 202):
+					failures = 0
+					self.response = response
+					if response.status_code == 201:
+						self.next_ranges = []
+					else:
+						body = response.json() if response.content else {}
+						self.next_ranges = body.get('nextExpectedRanges') or []
+					start = self._next_start()
+				elif response.status_code in (429, 500, 502, 503, 504):
+					failures += 1
+					if failures >= self.max_failures or not self._wait(failures, response=response):
+						raise RuntimeError('Upload failed with status code {}'.format(response.status_code))
+					self.status()
+					start = self._next_start()
+				else:
+					raise RuntimeError('Upload failed with status code {}: {}'.format(
+						response.status_code, response.text))
+
+		log.debug('upload of {} complete'.format(self.file_path))
+		return self.response
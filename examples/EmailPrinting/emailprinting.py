@@ -62,7 +62,7 @@ def getLock():
 	return lock
 
 def processMessage(m,auth):
-	m.fetchAttachments()
+	# the attachments were listed by fetch_attachments_many, only the pdfs are downloaded
 	m.markAsRead()
 
 	resp = Message(auth=auth)
@@ -95,7 +95,7 @@ def processMessage(m,auth):
 	return True
 
 def verifyPDF(att,resp):
-	if '.pdf' not in att.json['Name'].lower():
+	if not att.isType('pdf'):
 		log.debug('{0} is not a pdf. skipping!'.format(att.json['Name']))
 		resp.setBody('I can only print pdfs. please convert your file and send it again.\n Problematic File: {0}'.format(att.json['Name']))
 		resp.sendMessage()
@@ -151,7 +151,12 @@ if __name__ == '__main__':
 			i = Inbox(auth)
 
 			log.debug("messages: {0}".format(len(i.messages)))
-			for m in i.messages:
+			# list the attachments of every message at once, printing them as they arrive. their
+			# content is only downloaded by getByteString, once they are known to be pdfs.
+			for m, error in fetch_attachments_many(i.messages, workers=8, lazy=True):
+				if error is not None:
+					log.error('could not download the attachments: {0}'.format(str(error)))
+					continue
 				processMessage(m,auth)
 			time.sleep(55)
 #		except Exception as e:
@@ -7,7 +7,7 @@ if __name__ == '__main__':
 	veh = open('./pw/veh.pw','r').read()
 	vj = json.loads(veh)
 
-	schedules = []
+	calendars = []
 	json_outs = {}
 
 	for veh in vj:
@@ -21,20 +21,19 @@ if __name__ == '__main__':
 		except:
 			print('Login failed for',e)
 
-		bookings = []
-
-		for cal in schedule.calendars:
-			print('attempting to fetch events for',e)
-			try:
-				result = cal.getEvents()
-				print('Got events',result,'got',len(cal.events))
-			except:
-				print('failed to fetch events')
-			print('attempting for event information')
-			for event in cal.events:
-				print('HERE!')
-				bookings.append(event.fullcalendarioJson())
-		json_outs[e] = bookings
+		calendars.extend(schedule.calendars)
+		json_outs[e] = []
+
+	# the events of all the vehicles are downloaded at once, sorted by start time
+	events, report = fetch_all_events(calendars, workers=16)
+	for event in events:
+		json_outs[event.auth[0]].append(event.fullcalendarioJson())
+
+	for fetch in report:
+		if fetch.ok:
+			print('Got',fetch.count,'events for',fetch.calendar.auth[0],'in',round(fetch.seconds,2),'seconds')
+		else:
+			print('failed to fetch events for',fetch.calendar.auth[0],fetch.error)
 
 	with open('bookings.json','w') as outs:
 		outs.write(json.dumps(json_outs,sort_keys=True,indent=4))
@@ -14,5 +14,37 @@ echo "python test_group.py"
 python test_group.py
 echo "python test_contact.py"
 python test_contact.py
+echo "python test_connection.py"
+python test_connection.py
+echo "python test_retry.py"
+python test_retry.py
+echo "python test_ratelimit.py"
+python test_ratelimit.py
+echo "python test_token_store.py"
+python test_token_store.py
+echo "python test_cache.py"
+python test_cache.py
+echo "python test_collection.py"
+python test_collection.py
+echo "python test_batch.py"
+python test_batch.py
+echo "python test_sync.py"
+python test_sync.py
+echo "python test_fluent_inbox.py"
+python test_fluent_inbox.py
+echo "python test_folders.py"
+python test_folders.py
+echo "python test_streaming.py"
+python test_streaming.py
+echo "python test_handlers.py"
+python test_handlers.py
+echo "python test_template.py"
+python test_template.py
+echo "python test_upload.py"
+python test_upload.py
+echo "python test_subscriptions.py"
+python test_subscriptions.py
+echo "python test_async.py"
+python test_async.py
 
 echo "all tests done."
@@ -14,5 +14,37 @@ echo "python3 test_group.py"
 python3 test_group.py
 echo "python3 test_contact.py"
 python3 test_contact.py
+echo "python3 test_connection.py"
+python3 test_connection.py
+echo "python3 test_retry.py"
+python3 test_retry.py
+echo "python3 test_ratelimit.py"
+python3 test_ratelimit.py
+echo "python3 test_token_store.py"
+python3 test_token_store.py
+echo "python3 test_cache.py"
+python3 test_cache.py
+echo "python3 test_collection.py"
+python3 test_collection.py
+echo "python3 test_batch.py"
+python3 test_batch.py
+echo "python3 test_sync.py"
+python3 test_sync.py
+echo "python3 test_fluent_inbox.py"
+python3 test_fluent_inbox.py
+echo "python3 test_folders.py"
+python3 test_folders.py
+echo "python3 test_streaming.py"
+python3 test_streaming.py
+echo "python3 test_handlers.py"
+python3 test_handlers.py
+echo "python3 test_template.py"
+python3 test_template.py
+echo "python3 test_upload.py"
+python3 test_upload.py
+echo "python3 test_subscriptions.py"
+python3 test_subscriptions.py
+echo "python3 test_async.py"
+python3 test_async.py
 
 echo "all tests done."
@@ -0,0 +1,104 @@
+from O365.async_connection import AsyncConnection
+from O365.async_fluent_inbox import AsyncFluentInbox
+from O365.connection import Connection, MicroDict
+import unittest
+import asyncio
+import threading
+import time
+
+base_url = 'https://graph.microsoft.com/v1.0/users/{user_id}/MailFolders/{folder_id}/messages'
+
+
+class Mailboxes:
+	'''mock up of the server, keeping track of how many requests are in flight'''
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.in_flight = 0
+		self.max_in_flight = 0
+
+	def get_page(self, url, **kwargs):
+		with self.lock:
+			self.in_flight += 1
+			self.max_in_flight = max(self.max_in_flight, self.in_flight)
+		time.sleep(0.02)
+		with self.lock:
+			self.in_flight -= 1
+
+		if url.endswith('MailFolders'):
+			return [MicroDict({'id': 'inbox-id', 'displayName': 'Inbox'})], None
+		user_id = url.split('/users/')[1].split('/')[0]
+		top = kwargs['params']['$top']
+		return [MicroDict({'id': '{}-{}'.format(user_id, i), 'hasAttachments': False}) for i in range(top)], None
+
+
+class TestAsync (unittest.TestCase):
+
+	def setUp(self):
+		con = Connection()
+		self.saved = (con.api_version, Connection.__dict__['get_page'])
+		con.api_version = '2.0'
+		self.server = Mailboxes()
+		Connection.get_page = staticmethod(self.server.get_page)
+
+	def tearDown(self):
+		con = Connection()
+		con.api_version = self.saved[0]
+		Connection.get_page = self.saved[1]
+
+	def test_many_mailboxes(self):
+		connection = AsyncConnection(max_concurrency=5)
+
+		async def unread(user_id):
+			inbox = AsyncFluentInbox(connection)
+			await inbox.from_folder('Inbox', user_id=user_id)
+			return await inbox.filter('IsRead eq false').fetch_first(2)
+
+		async def main():
+			return await asyncio.gather(*[unread('user{}'.format(i)) for i in range(20)])
+
+		results = asyncio.run(main())
+		connection.close()
+
+		self.assertEqual(20, len(results))
+		self.assertEqual(['user3-0', 'user3-1'], [m.json['Id'] for m in results[3]])
+		self.assertTrue(1 < self.server.max_in_flight <= 5)
+
+	def test_two_event_loops(self):
+		connection = AsyncConnection(max_concurrency=2)
+
+		async def collect(user_id):
+			url = base_url.format(user_id=user_id, folder_id='inbox-id')
+			return await asyncio.gather(*[connection.get_page(url, params={'$top': 1}) for i in range(4)])
+
+		# the connection outlives the event loop of the first run
+		self.assertEqual(4, len(asyncio.run(collect('bob'))))
+		self.assertEqual(4, len(asyncio.run(collect('alice'))))
+		connection.close()
+		self.assertTrue(self.server.max_in_flight <= 2)
+
+	def test_iter_response(self):
+		connection = AsyncConnection(max_concurrency=2)
+
+		async def collect():
+			url = base_url.format(user_id='bob', folder_id='inbox-id')
+			return [m['Id'] async for m in connection.iter_response(url, page_size=3, max_items=2)]
+
+		self.assertEqual(['bob-0', 'bob-1'], asyncio.run(collect()))
+		connection.close()
+
+	def test_pool_left_alone(self):
+		con = Connection('async-pool')
+		session = con.get_session()
+		try:
+			AsyncConnection(max_concurrency=50, connection=con).close()
+			self.assertIs(session, con.get_session())
+			self.assertEqual(10, con.pool_settings['pool_maxsize'])
+
+			AsyncConnection(max_concurrency=50, connection=con, resize_pool=True).close()
+			self.assertEqual(50, con.pool_settings['pool_maxsize'])
+		finally:
+			Connection.remove('async-pool')
+
+
+if __name__ == '__main__':
+	unittest.main()
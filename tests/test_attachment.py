@@ -1,7 +1,16 @@
 from O365 import attachment
+from O365.connection import Connection
+from O365 import message
 import unittest
 import json
 import base64
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
 from random import randint
 
 
@@ -66,5 +75,189 @@ class TestAttachment (unittest.TestCase):
 		self.att.setBase64(enc)
 		self.assertEqual(self.att.json['ContentBytes'],enc)
 
+class RawResp:
+	def __init__(self, content, status_code=200):
+		self.content = content
+		self.status_code = status_code
+		self.chunks = []
+		self.closed = False
+
+	def iter_content(self, chunk_size):
+		for i in range(0, len(self.content), chunk_size):
+			self.chunks.append(chunk_size)
+			yield self.content[i:i + chunk_size]
+
+	def close(self):
+		self.closed = True
+
+
+class RawMessage:
+	'''message serving the raw content of its attachments'''
+	att_url = 'https://graph.microsoft.com/v1.0/me/messages/{0}/attachments'
+	auth = None
+	verify = True
+
+	def __init__(self, content):
+		self.json = {'Id': 'mid'}
+		self.resp = RawResp(content)
+		self.urls = []
+
+	def _request(self, method, url, **kwargs):
+		self.urls.append(url)
+		return self.resp
+
+
+class TestDownload (unittest.TestCase):
+
+	def setUp(self):
+		self.content = os.urandom(100000)
+		self.message = RawMessage(self.content)
+		self.att = attachment.Attachment({'Id': 'aid', 'Name': 'file.pdf'})
+		self.att.message = self.message
+		self.dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def test_to_directory(self):
+		digest = self.att.download(self.dir, chunk_size=4096)
+		self.assertEqual('https://graph.microsoft.com/v1.0/me/messages/mid/attachments/aid/$value', self.message.urls[0])
+		with open(os.path.join(self.dir, 'file.pdf'), 'rb') as downloaded:
+			self.assertEqual(self.content, downloaded.read())
+		self.assertEqual(hashlib.sha256(self.content).hexdigest(), digest)
+		self.assertEqual(25, len(self.message.resp.chunks))
+		self.assertTrue(self.message.resp.closed)
+
+	def test_to_file_object(self):
+		out = io.BytesIO()
+		self.att.download(out, checksum=hashlib.sha256(self.content).hexdigest())
+		self.assertEqual(self.content, out.getvalue())
+
+	def test_checksum_mismatch(self):
+		target = os.path.join(self.dir, 'out.pdf')
+		self.assertRaises(RuntimeError, self.att.download, target, checksum='00')
+		self.assertEqual([], os.listdir(self.dir))
+
+	def test_not_downloaded(self):
+		self.assertRaises(RuntimeError, attachment.Attachment().download, self.dir)
+
+
+class JsonResp:
+	def __init__(self, value):
+		self.value = value
+		self.status_code = 200
+
+	def json(self, **kwargs):
+		return json.loads(json.dumps(self.value), **kwargs)
+
+
+class AttachmentServer:
+	'''serves the attachments of a message, with or without their content'''
+	def __init__(self):
+		self.requests = []
+
+	def get(self, url, params=None, **kwargs):
+		self.requests.append((url, params))
+		listing = [{'Id': 'a1', 'Name': 'notes.txt', 'Size': 2000000, 'ContentType': 'text/plain'},
+				   {'Id': 'a2', 'Name': 'print.pdf', 'Size': 13, 'ContentType': 'application/pdf'}]
+		if url.endswith('/attachments'):
+			if params is None:
+				for att in listing:
+					att['ContentBytes'] = 'dGVzdGluZyB3MDB0IQ=='
+			return JsonResp({'value': listing})
+		return JsonResp({'Id': 'a2', 'Name': 'print.pdf', 'ContentBytes': 'dGVzdGluZyB3MDB0IQ=='})
+
+
+class TestLazyAttachments (unittest.TestCase):
+
+	def setUp(self):
+		self.server = AttachmentServer()
+		self.connection = Connection('lazy-attachments')
+		self.connection.session = self.server
+		# other tests replace the Attachment class of the message module
+		self.Attachment = message.Attachment
+		message.Attachment = attachment.Attachment
+		self.message = message.Message({'Id': 'mid', 'HasAttachments': True}, auth=('a@b.c', 'pw'), connection=self.connection)
+
+	def tearDown(self):
+		message.Attachment = self.Attachment
+		self.connection.session = None
+		Connection.remove('lazy-attachments')
+
+	def test_listing_has_no_content(self):
+		self.assertEqual(2, self.message.fetchAttachments(lazy=True))
+		url, params = self.server.requests[0]
+		self.assertEqual({'$select': 'Id,Name,Size,ContentType'}, params)
+		self.assertEqual(['notes.txt', 'print.pdf'], [att.getName() for att in self.message.attachments])
+		self.assertEqual(2000000, self.message.attachments[0].getSize())
+		self.assertTrue(all('ContentBytes' not in att.json for att in self.message.attachments))
+
+	def test_content_fetched_when_read(self):
+		self.message.fetchAttachments(lazy=True)
+		pdfs = [att for att in self.message.attachments if att.isType('pdf')]
+		self.assertEqual(b'testing w00t!', pdfs[0].getByteString())
+		self.assertEqual('dGVzdGluZyB3MDB0IQ==', pdfs[0].getBase64())
+		# the content is fetched once, only for the attachment read
+		self.assertEqual(['https://outlook.office365.com/api/v1.0/me/messages/mid/attachments/a2'],
+						 [url for url, params in self.server.requests[1:]])
+
+	def test_eager(self):
+		self.message.fetchAttachments()
+		self.assertEqual(1, len(self.server.requests))
+		self.assertEqual(b'testing w00t!', self.message.attachments[0].getByteString())
+		self.assertEqual(1, len(self.server.requests))
+
+
+class SlowMessage:
+	'''message whose attachments take a while to download'''
+	fetched = []
+	lock = threading.Lock()
+
+	def __init__(self, name, size=10, fail=False):
+		self.name = name
+		self.size = size
+		self.fail = fail
+		self.attachments = []
+
+	def fetchAttachments(self):
+		time.sleep(0.05)
+		with SlowMessage.lock:
+			SlowMessage.fetched.append(self.name)
+		if self.fail:
+			raise RuntimeError('download failed')
+		self.attachments.append(attachment.Attachment({'Name': 'a.pdf', 'ContentBytes': 'x' * self.size}))
+		return 1
+
+
+class TestFetchAttachmentsMany (unittest.TestCase):
+
+	def setUp(self):
+		SlowMessage.fetched = []
+
+	def test_concurrent(self):
+		messages = [SlowMessage(i) for i in range(40)]
+		start = time.time()
+		results = list(attachment.fetch_attachments_many(messages, workers=10))
+		self.assertLess(time.time() - start, 1)
+		self.assertEqual(set(range(40)), set(message.name for message, error in results))
+		self.assertTrue(all(error is None and len(message.attachments) == 1 for message, error in results))
+
+	def test_errors(self):
+		results = dict((message.name, error) for message, error in attachment.fetch_attachments_many(
+			[SlowMessage(0), SlowMessage(1, fail=True)], workers=2))
+		self.assertEqual(None, results[0])
+		self.assertTrue(isinstance(results[1], RuntimeError))
+
+	def test_byte_budget(self):
+		messages = [SlowMessage(i, size=100) for i in range(20)]
+		results = attachment.fetch_attachments_many(messages, workers=4, max_bytes=150)
+		next(results)
+		time.sleep(0.3)
+		# the workers stop once the unconsumed messages hold more than max_bytes
+		self.assertLessEqual(len(SlowMessage.fetched), 6)
+		self.assertEqual(19, len(list(results)))
+		self.assertEqual(20, len(SlowMessage.fetched))
+
+
 if __name__ == '__main__':
 	unittest.main()
@@ -0,0 +1,81 @@
+from O365.batch import Batch
+from O365.connection import Connection
+from O365.fluent_message import Message
+import unittest
+import json
+
+
+class Resp:
+	def __init__(self,json_value,code=200):
+		self.json_value = json_value
+		self.status_code = code
+		self.text = json.dumps(json_value)
+
+	def json(self):
+		return self.json_value
+
+
+class TestBatch (unittest.TestCase):
+
+	def setUp(self):
+		con = Connection()
+		self.saved = (con.api_version, Connection.__dict__['send_request'])
+		con.api_version = '2.0'
+		self.payloads = []
+
+		def send_request(method, url, data=None, **kwargs):
+			payload = json.loads(data)
+			self.payloads.append(payload)
+			responses = []
+			for request in payload['requests']:
+				if request['url'].endswith('/bad'):
+					responses.append({'id': request['id'], 'status': 404,
+									  'body': {'error': {'message': 'not found'}}})
+				else:
+					responses.append({'id': request['id'], 'status': 200, 'body': {}})
+			# Graph does not keep the order of the responses
+			return Resp({'responses': list(reversed(responses))})
+
+		Connection.send_request = staticmethod(send_request)
+		self.messages = [Message({'Id': str(i), 'HasAttachments': False}, oauth=object()) for i in range(45)]
+
+	def tearDown(self):
+		con = Connection()
+		con.api_version = self.saved[0]
+		Connection.send_request = self.saved[1]
+
+	def test_chunking(self):
+		with Batch() as batch:
+			for message in self.messages:
+				message.markAsRead(batch=batch)
+
+		self.assertEqual([20, 20, 5], [len(p['requests']) for p in self.payloads])
+		first = self.payloads[0]['requests'][0]
+		self.assertEqual('PATCH', first['method'])
+		self.assertEqual('/me/messages/0', first['url'])
+		self.assertEqual({'IsRead': True}, first['body'])
+		self.assertEqual([], batch.errors)
+
+	def test_results_map_to_targets(self):
+		batch = Batch(sequential=True)
+		ok = self.messages[0].update_category('Green', batch=batch)
+		bad = batch.add('DELETE', 'https://graph.microsoft.com/v1.0/me/events/bad', target='event')
+		self.assertEqual(2, len(batch))
+		batch.flush()
+
+		self.assertTrue(ok.ok)
+		self.assertIs(self.messages[0], ok.target)
+		self.assertFalse(bad.ok)
+		self.assertEqual('not found', bad.error)
+		self.assertEqual(['event'], [request.target for request in batch.errors])
+		self.assertEqual(['0'], self.payloads[0]['requests'][1]['dependsOn'])
+
+	def test_requires_graph(self):
+		Connection().api_version = '1.0'
+		batch = Batch()
+		self.messages[0].moveToFolder('archive', batch=batch)
+		self.assertRaises(RuntimeError, batch.flush)
+
+
+if __name__ == '__main__':
+	unittest.main()
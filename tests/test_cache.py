@@ -0,0 +1,204 @@
+from O365.connection import Connection
+from O365.cache import ResponseCache, MemoryBackend, FileBackend
+import unittest
+import base64
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+
+class Resp:
+	def __init__(self, status_code, value=None, etag=None):
+		self.status_code = status_code
+		self.text = json.dumps(value) if value is not None else ''
+		self.headers = {'ETag': etag} if etag else {}
+
+	def json(self, **kwargs):
+		return json.loads(self.text, **kwargs)
+
+
+class FolderServer:
+	'''serves a folder list with an ETag, 304 when the client has the current one'''
+	def __init__(self):
+		self.folders = [{'Id': 'f1', 'DisplayName': 'Inbox'}]
+		self.version = 1
+		self.requests = []
+
+	def send_request(self, method, url, **kwargs):
+		headers = kwargs.get('headers') or {}
+		self.requests.append(headers.get('If-None-Match'))
+		etag = 'W/"{}"'.format(self.version)
+		if headers.get('If-None-Match') == etag:
+			return Resp(304)
+		return Resp(200, {'value': self.folders}, etag)
+
+
+class TestResponseCache (unittest.TestCase):
+
+	def setUp(self):
+		self.server = FolderServer()
+		self.con = Connection('cache-test')
+		self.con.auth = ('a@b.c', 'pw')
+		self.con.send_request = self.server.send_request
+		self.cache = ResponseCache(ttl=60)
+		self.con.set_cache(self.cache)
+
+	def tearDown(self):
+		Connection.remove('cache-test')
+
+	def expire(self):
+		for entry in self.cache.backend._entries.values():
+			entry['stored'] -= 61
+
+	def test_fresh_responses_are_served_locally(self):
+		for i in range(3):
+			folders = self.con.get_response('https://folders', cached=True)
+			self.assertEqual('Inbox', folders[0]['displayName'])
+		self.assertEqual([None], self.server.requests)
+		self.assertEqual({'hits': 2, 'revalidated': 0, 'misses': 1}, self.con.cache_stats())
+
+	def test_revalidation(self):
+		self.con.get_response('https://folders', cached=True)
+		self.expire()
+		self.assertEqual('f1', self.con.get_response('https://folders', cached=True)[0]['Id'])
+		self.assertEqual([None, 'W/"1"'], self.server.requests)
+		self.assertEqual(1, self.con.cache_stats()['revalidated'])
+
+		# the 304 restarted the ttl
+		self.con.get_response('https://folders', cached=True)
+		self.assertEqual(2, len(self.server.requests))
+
+	def test_changed_response_replaces_entry(self):
+		self.con.get_response('https://folders', cached=True)
+		self.server.folders.append({'Id': 'f2', 'DisplayName': 'Archive'})
+		self.server.version = 2
+		self.expire()
+		self.assertEqual(2, len(self.con.get_response('https://folders', cached=True)))
+		self.assertEqual(2, len(self.con.get_response('https://folders', cached=True)))
+		self.assertEqual(2, len(self.server.requests))
+
+	def test_callers_get_their_own_copy(self):
+		self.con.get_response('https://folders', cached=True)[0]['Id'] = 'changed'
+		self.assertEqual('f1', self.con.get_response('https://folders', cached=True)[0]['Id'])
+
+	def test_not_cached_unless_asked(self):
+		self.con.get_response('https://folders')
+		self.con.get_response('https://folders')
+		self.assertEqual(2, len(self.server.requests))
+
+	def test_keys_include_user_and_params(self):
+		self.con.get_response('https://folders', cached=True)
+		self.con.get_response('https://folders', cached=True, auth=('other@b.c', 'pw'))
+		self.con.get_response('https://folders', cached=True, params={'$top': 10})
+		self.assertEqual(3, len(self.server.requests))
+
+
+def jwt(**claims):
+	payload = base64.urlsafe_b64encode(json.dumps(claims).encode('utf-8')).decode('ascii').rstrip('=')
+	return 'header.{}.signature'.format(payload)
+
+
+class FakeOAuth:
+	def __init__(self, **claims):
+		self.access_token = jwt(**claims)
+
+
+class TestOAuthCacheKeys (unittest.TestCase):
+
+	def setUp(self):
+		self.server = FolderServer()
+		self.cache = ResponseCache(ttl=60)
+		self.cons = []
+
+	def tearDown(self):
+		for con in self.cons:
+			Connection.remove(con.name)
+
+	def connection(self, name, **claims):
+		con = Connection(name)
+		con.api_version = '2.0'
+		con.client_id = 'app'
+		con.oauth = FakeOAuth(**claims)
+		con.send_request = self.server.send_request
+		con.set_cache(self.cache)
+		self.cons.append(con)
+		return con
+
+	def test_connections_sharing_a_cache(self):
+		alice = self.connection('cache-alice', tid='t1', oid='alice')
+		bob = self.connection('cache-bob', tid='t1', oid='bob')
+		alice.get_response('https://folders', cached=True)
+		bob.get_response('https://folders', cached=True)
+		self.assertEqual(2, len(self.server.requests))
+		alice.get_response('https://folders', cached=True)
+		self.assertEqual(2, len(self.server.requests))
+
+	def test_token_user(self):
+		con = self.connection('cache-user', tid='t1', oid='alice')
+		con.get_response('https://folders', cached=True)
+		# a refreshed token of the same user
+		con.oauth = FakeOAuth(tid='t1', oid='alice', exp=1)
+		con.get_response('https://folders', cached=True)
+		self.assertEqual(1, len(self.server.requests))
+		# another user signed in
+		con.oauth = FakeOAuth(tid='t2', oid='carol')
+		con.get_response('https://folders', cached=True)
+		self.assertEqual(2, len(self.server.requests))
+
+
+class TestBackends (unittest.TestCase):
+
+	def test_memory_lru(self):
+		backend = MemoryBackend(max_entries=2)
+		backend.set('a', 1)
+		backend.set('b', 2)
+		backend.get('a')
+		backend.set('c', 3)
+		self.assertEqual(None, backend.get('b'))
+		self.assertEqual(1, backend.get('a'))
+
+	def test_file_backend_survives_restarts(self):
+		directory = tempfile.mkdtemp()
+		try:
+			cache = ResponseCache(backend=FileBackend(directory))
+			cache.store('key', '{"value": []}', 'W/"1"')
+			entry, fresh = ResponseCache(backend=FileBackend(directory)).lookup('key')
+			self.assertTrue(fresh)
+			self.assertEqual('W/"1"', entry['etag'])
+			entry, fresh = cache.lookup('key', now=time.time() + 3600)
+			self.assertFalse(fresh)
+			cache.invalidate()
+			self.assertEqual((None, False), cache.lookup('key'))
+		finally:
+			shutil.rmtree(directory)
+
+	def test_file_backend_concurrent_writes(self):
+		directory = tempfile.mkdtemp()
+		try:
+			backend = FileBackend(directory)
+			errors = []
+
+			def write(n):
+				for i in range(50):
+					try:
+						backend.set('key', {'body': '{}-{}'.format(n, i), 'etag': None, 'stored': 0})
+					except Exception as e:
+						errors.append(e)
+
+			threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+			for thread in threads:
+				thread.start()
+			for thread in threads:
+				thread.join()
+			self.assertEqual([], errors)
+			self.assertEqual('key', backend.get('key')['key'])
+			self.assertEqual(1, len(os.listdir(directory)))
+		finally:
+			shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,111 @@
+from O365.collection import ItemIndex
+import unittest
+import time
+
+
+class Item:
+	def __init__(self, item_id, version=0):
+		self.json = {'Id': item_id, 'Version': version}
+
+
+class TestItemIndex (unittest.TestCase):
+
+	def test_list_like(self):
+		items = ItemIndex([Item('a'), Item('b')])
+		items.append(Item('c'))
+		self.assertEqual(3, len(items))
+		self.assertEqual(['a', 'b', 'c'], [item.json['Id'] for item in items])
+		self.assertEqual('b', items[1].json['Id'])
+		self.assertEqual('c', items[-1].json['Id'])
+		self.assertIn('a', items)
+		self.assertIn(items[0], items)
+		self.assertNotIn(Item('a'), items)
+
+	def test_upsert_keeps_place(self):
+		items = ItemIndex([Item('a'), Item('b'), Item('c')])
+		self.assertEqual(0, items.upsert(Item('b', 1)).json['Version'])
+		self.assertEqual(3, len(items))
+		self.assertEqual(['a', 'b', 'c'], items.ids())
+		self.assertEqual(1, items.get('b').json['Version'])
+
+	def test_graph_ids(self):
+		items = ItemIndex()
+		item = Item(None)
+		item.json = {'id': 'x'}
+		items.upsert(item)
+		self.assertIs(item, items.get('x'))
+
+	def test_bounded(self):
+		items = ItemIndex(max_size=3)
+		for item_id in 'abcd':
+			items.upsert(Item(item_id))
+		self.assertEqual(['b', 'c', 'd'], items.ids())
+		# updating an item makes it the most recent one
+		items.upsert(Item('b', 1))
+		items.upsert(Item('e'))
+		self.assertEqual(['d', 'b', 'e'], items.ids())
+
+	def test_remove(self):
+		items = ItemIndex([Item('a'), Item('b')])
+		self.assertEqual('a', items.remove('a').json['Id'])
+		self.assertEqual(None, items.remove('a'))
+		self.assertEqual(['b'], items.ids())
+
+	def test_remove_item(self):
+		items = ItemIndex([Item('a'), Item('b')])
+		first = items[0]
+		self.assertIs(first, items.remove(first))
+		self.assertEqual(None, items.remove(Item('b')))
+		self.assertEqual(['b'], items.ids())
+
+	def test_list_api(self):
+		items = ItemIndex()
+		items.extend([Item('a'), Item('b'), Item('c'), Item('d')])
+		self.assertEqual('d', items.pop().json['Id'])
+		self.assertEqual('a', items.pop(0).json['Id'])
+		self.assertEqual(['b', 'c'], items.ids())
+
+		items[0] = Item('b', 1)
+		self.assertEqual(1, items.get('b').json['Version'])
+		items[-1] = Item('e')
+		self.assertEqual(['b', 'e'], items.ids())
+		# an item takes the place of the other one with its id
+		items[1] = Item('b', 2)
+		self.assertEqual(['b'], items.ids())
+		self.assertEqual(2, items[0].json['Version'])
+
+		self.assertEqual('b', items.pop().json['Id'])
+		self.assertRaises(IndexError, items.pop)
+		self.assertRaises(IndexError, items.__getitem__, 0)
+
+	def test_reading_does_not_keep_items(self):
+		items = ItemIndex(max_size=2)
+		items.extend([Item('a'), Item('b')])
+		items.get('a')
+		items[0]
+		items.upsert(Item('c'))
+		self.assertEqual(['b', 'c'], items.ids())
+		self.assertEqual(['b', 'c'], [item.json['Id'] for item in items])
+
+	def test_indexing_is_constant_time(self):
+		items = ItemIndex(Item(str(i)) for i in range(20000))
+		start = time.time()
+		for i in range(len(items)):
+			items[i]
+			items.append(Item('new{}'.format(i)))
+		self.assertLess(time.time() - start, 1)
+		self.assertEqual('new19999', items[-1].json['Id'])
+
+	def test_upsert_is_constant_time(self):
+		items = ItemIndex()
+		new = [Item(str(i)) for i in range(20000)]
+		start = time.time()
+		for item in new:
+			items.upsert(item)
+		for item in new:
+			items.upsert(item)
+		self.assertLess(time.time() - start, 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,321 @@
+from O365 import connection
+from O365.connection import Connection
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import requests
+from oauthlib.oauth2 import TokenExpiredError
+
+try:
+	from http.server import BaseHTTPRequestHandler, HTTPServer
+	from socketserver import ThreadingMixIn
+except ImportError:
+	from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+	from SocketServer import ThreadingMixIn
+
+
+class Server(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+
+class Handler(BaseHTTPRequestHandler):
+	'''small keep-alive server answering every GET with an empty value list'''
+	protocol_version = 'HTTP/1.1'
+
+	def do_GET(self):
+		body = json.dumps({'value': []}).encode('utf-8')
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+
+class TestConnectionPool (unittest.TestCase):
+
+	def setUp(self):
+		self.server = Server(('127.0.0.1', 0), Handler)
+		self.thread = threading.Thread(target=self.server.serve_forever)
+		self.thread.daemon = True
+		self.thread.start()
+		self.url = 'http://127.0.0.1:{}/me/messages'.format(self.server.server_port)
+
+		# other test modules patch the shared session, keep it aside
+		con = Connection()
+		self.saved = (con.api_version, con.auth, con.session, con.adapter, con.pool_settings)
+		con.session = None
+		Connection.login('test@unit.com', 'pass')
+		Connection.configure_pool(pool_connections=2, pool_maxsize=4)
+
+	def tearDown(self):
+		con = Connection()
+		if con.session:
+			con.session.close()
+		con.api_version, con.auth, con.session, con.adapter, con.pool_settings = self.saved
+		self.server.shutdown()
+		self.server.server_close()
+
+	def test_session_is_shared(self):
+		self.assertIs(Connection.get_session(), Connection.get_session())
+		self.assertEqual(4, Connection().adapter._pool_maxsize)
+
+	def test_connections_are_reused(self):
+		session = Connection.get_session()
+		for i in range(3):
+			session.get(self.url).json()
+
+		stats = Connection.pool_stats()['127.0.0.1:{}'.format(self.server.server_port)]
+		self.assertEqual(3, stats['requests'])
+		self.assertEqual(1, stats['connections'])
+		self.assertEqual(2, stats['reused'])
+
+	def test_configure_resets_session(self):
+		session = Connection.get_session()
+		Connection.configure_pool(keep_alive=False)
+		self.assertIsNot(session, Connection.get_session())
+		self.assertEqual('close', Connection.get_session().headers['Connection'])
+		self.assertEqual({}, Connection.pool_stats())
+
+	def test_configure_oauth_session(self):
+		con = Connection('pool-oauth')
+		con.oauth = requests.Session()
+		try:
+			con.configure_pool(keep_alive=False)
+			self.assertEqual('close', con.oauth.headers['Connection'])
+			adapter = con.adapter
+			closed = []
+			adapter.close = lambda: closed.append(adapter)
+
+			con.configure_pool(keep_alive=True)
+			self.assertNotIn('Connection', con.oauth.headers)
+			self.assertIs(con.adapter, con.oauth.get_adapter('https://graph.microsoft.com'))
+			self.assertEqual([adapter], closed)
+		finally:
+			con.oauth.close()
+			Connection.remove('pool-oauth')
+
+
+class Resp:
+	def __init__(self,json_value):
+		self.json_value = json_value
+		self.closed = False
+
+	def json(self, **kwargs):
+		return json.loads(json.dumps(self.json_value), **kwargs)
+
+	def iter_content(self, chunk_size):
+		body = json.dumps(self.json_value).encode('utf-8')
+		for i in range(0, len(body), 5):
+			yield body[i:i + 5]
+
+	def close(self):
+		self.closed = True
+
+
+pages = {
+	'https://graph.microsoft.com/v1.0/me/messages': {
+		'value': [{'id': '1'}, {'id': '2'}],
+		'@odata.nextLink': 'https://graph.microsoft.com/v1.0/me/messages?$skiptoken=a'},
+	'https://graph.microsoft.com/v1.0/me/messages?$skiptoken=a': {
+		'value': [{'id': '3'}, {'id': '4'}],
+		'@odata.nextLink': 'https://graph.microsoft.com/v1.0/me/messages?$skiptoken=b'},
+	'https://graph.microsoft.com/v1.0/me/messages?$skiptoken=b': {
+		'value': [{'id': '5'}]},
+}
+
+
+class TestMicroDict (unittest.TestCase):
+
+	def check(self, m):
+		self.assertEqual('hello', m['Subject'])
+		self.assertEqual('hello', m['subject'])
+		self.assertEqual('a@b.com', m['Sender']['EmailAddress']['Address'])
+		self.assertEqual('c@d.com', m['ToRecipients'][0]['EmailAddress']['Address'])
+		self.assertEqual(None, m['Missing'])
+		self.assertIs(m['Sender'], m['sender'])
+		self.assertIs(m['Sender']['EmailAddress'], m['Sender']['EmailAddress'])
+
+	def test_built(self):
+		self.check(connection.MicroDict({'subject': 'hello',
+										 'sender': {'emailAddress': {'address': 'a@b.com'}},
+										 'toRecipients': [{'emailAddress': {'address': 'c@d.com'}}]}))
+
+	def test_parsed(self):
+		self.check(json.loads('{"subject": "hello", "sender": {"emailAddress": {"address": "a@b.com"}}, '
+							  '"toRecipients": [{"emailAddress": {"address": "c@d.com"}}]}',
+							  object_hook=connection.micro_object))
+
+	def test_outlook_casing(self):
+		m = connection.MicroDict({'Subject': 'hello', 'Id': '1'})
+		self.assertEqual('hello', m['subject'])
+		self.assertEqual('1', m['Id'])
+
+
+class TestIterResponse (unittest.TestCase):
+
+	def setUp(self):
+		self.requested = []
+
+		self.responses = []
+
+		def send_request(method, url, data=None, **kwargs):
+			self.requested.append((url, kwargs.get('params')))
+			self.responses.append(Resp(pages[url]))
+			return self.responses[-1]
+
+		self.send_request = Connection.__dict__['send_request']
+		Connection.send_request = staticmethod(send_request)
+
+	def tearDown(self):
+		Connection.send_request = self.send_request
+
+	def test_follows_next_links(self):
+		ids = [m['Id'] for m in Connection.iter_response('https://graph.microsoft.com/v1.0/me/messages', page_size=2)]
+		self.assertEqual(['1', '2', '3', '4', '5'], ids)
+		self.assertEqual(3, len(self.requested))
+		self.assertEqual({'$top': 2}, self.requested[0][1])
+		self.assertEqual(None, self.requested[1][1])
+
+	def test_is_lazy(self):
+		values = Connection.iter_response('https://graph.microsoft.com/v1.0/me/messages')
+		self.assertEqual(0, len(self.requested))
+		next(values)
+		self.assertEqual(1, len(self.requested))
+
+	def test_max_items(self):
+		ids = [m['id'] for m in Connection.iter_response('https://graph.microsoft.com/v1.0/me/messages', max_items=3)]
+		self.assertEqual(['1', '2', '3'], ids)
+		self.assertEqual(2, len(self.requested))
+
+	def test_stream(self):
+		values = Connection.iter_response('https://graph.microsoft.com/v1.0/me/messages', page_size=2, stream=True)
+		self.assertEqual('1', next(values)['Id'])
+		self.assertFalse(self.responses[0].closed)
+		self.assertEqual(['2', '3', '4', '5'], [m['Id'] for m in values])
+		self.assertEqual(3, len(self.requested))
+		self.assertEqual({'$top': 2}, self.requested[0][1])
+		self.assertTrue(all(response.closed for response in self.responses))
+
+	def test_stream_max_items(self):
+		ids = [m['id'] for m in Connection.iter_response('https://graph.microsoft.com/v1.0/me/messages',
+														  max_items=3, stream=True)]
+		self.assertEqual(['1', '2', '3'], ids)
+		self.assertTrue(all(response.closed for response in self.responses))
+
+	def test_get_response_single_page(self):
+		self.assertEqual(2, len(Connection.get_response('https://graph.microsoft.com/v1.0/me/messages')))
+
+
+class TestRegistry (unittest.TestCase):
+
+	def tearDown(self):
+		Connection.remove('tenant-a')
+		Connection.remove('tenant-b')
+
+	def test_named_connections_are_independent(self):
+		a = Connection('tenant-a').login('user@a.com', 'secret')
+		b = Connection('tenant-b').login('user@b.com', 'secret')
+		self.assertIs(a, Connection('tenant-a'))
+		self.assertIsNot(a, b)
+		self.assertIsNot(a, Connection())
+		self.assertEqual(('user@a.com', 'secret'), a.auth)
+		self.assertEqual('b.com', b.tenant())
+		self.assertIsNot(a.get_session(), b.get_session())
+		self.assertIn('tenant-a', Connection.names())
+
+	def test_remove(self):
+		a = Connection('tenant-a')
+		Connection.remove('tenant-a')
+		self.assertNotIn('tenant-a', Connection.names())
+		self.assertIsNot(a, Connection('tenant-a'))
+
+	def test_class_calls_use_default(self):
+		con = Connection()
+		saved = con.auth, con.api_version
+		try:
+			Connection.login('user@default.com', 'secret')
+			self.assertEqual('user@default.com', con.auth[0])
+			self.assertEqual(None, Connection('tenant-a').auth)
+		finally:
+			con.auth, con.api_version = saved
+
+
+class OkResp:
+	status_code = 200
+	url = 'https://graph.microsoft.com/v1.0/me'
+
+
+class FakeOAuth:
+	'''OAuth session whose token refresh is slow enough for the threads to pile up'''
+
+	def __init__(self, expires_at):
+		self.token = {'access_token': 'old', 'refresh_token': 'r', 'expires_at': expires_at}
+		self.refreshes = 0
+		self.lock = threading.Lock()
+
+	@property
+	def access_token(self):
+		return self.token['access_token']
+
+	def refresh_token(self, url, **kwargs):
+		with self.lock:
+			self.refreshes += 1
+		time.sleep(0.05)
+		self.token = {'access_token': 'new', 'refresh_token': 'r', 'expires_at': time.time() + 3600}
+		return self.token
+
+	def request(self, method, url, **kwargs):
+		if self.access_token == 'old':
+			raise TokenExpiredError()
+		return OkResp()
+
+
+class TestTokenRefresh (unittest.TestCase):
+
+	def setUp(self):
+		self.token_dir = tempfile.mkdtemp()
+		self.token_path = os.path.join(self.token_dir, 'token')
+		self.con = Connection('refresh-test')
+		self.con.api_version = '2.0'
+		self.con.token_path = self.token_path
+
+	def tearDown(self):
+		Connection.remove('refresh-test')
+		shutil.rmtree(self.token_dir)
+
+	def send_concurrently(self):
+		threads = [threading.Thread(target=self.con.send_request, args=('GET', OkResp.url)) for i in range(10)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+	def test_single_flight_on_expired_error(self):
+		self.con.oauth = FakeOAuth(None)
+		self.send_concurrently()
+		self.assertEqual(1, self.con.oauth.refreshes)
+		with open(self.token_path) as token_file:
+			self.assertEqual('new', json.load(token_file)['access_token'])
+
+	def test_proactive_refresh(self):
+		self.con.oauth = FakeOAuth(time.time() + 10)
+		self.send_concurrently()
+		self.assertEqual(1, self.con.oauth.refreshes)
+
+	def test_no_refresh_while_valid(self):
+		self.con.oauth = FakeOAuth(time.time() + 3600)
+		self.con.oauth.token['access_token'] = 'valid'
+		self.con.send_request('GET', OkResp.url)
+		self.assertEqual(0, self.con.oauth.refreshes)
+
+
+if __name__ == '__main__':
+	unittest.main()
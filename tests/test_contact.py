@@ -38,7 +38,7 @@ def delete(url,headers,auth):
 
 	return Resp(None,204)
 
-contact.requests.delete = delete
+contact.Connection.get_session().delete = delete
 
 def post(url,data,headers,auth):
 	if url not in urls:
@@ -58,7 +58,7 @@ def post(url,data,headers,auth):
 	return Resp(data,202)
 	#return True
 
-contact.requests.post = post
+contact.Connection.get_session().post = post
 
 def patch(url,data,headers,auth):
 	if url not in urls:
@@ -75,7 +75,7 @@ def patch(url,data,headers,auth):
 	return Resp(data,202)
 	#return True
 
-contact.requests.patch = patch
+contact.Connection.get_session().patch = patch
 
 auth = ('test@unit.com','pass')
 
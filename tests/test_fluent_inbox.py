@@ -0,0 +1,127 @@
+from O365 import fluent_inbox
+from O365.connection import Connection, MicroDict
+import unittest
+
+base_url = 'https://graph.microsoft.com/v1.0/me/messages'
+
+
+def message(i):
+	return MicroDict({'id': str(i), 'subject': 'message {}'.format(i), 'hasAttachments': False})
+
+
+class Server:
+	'''mock up of a mailbox serving pages of messages through next links'''
+	def __init__(self, total):
+		self.messages = [message(i) for i in range(total)]
+		self.requests = []
+
+	def get_page(self, url, **kwargs):
+		self.requests.append((url, kwargs.get('params')))
+		if url == base_url:
+			params = kwargs['params']
+			start = params.get('$skip', 0)
+			size = params['$top']
+		else:
+			# like the server side skip tokens, the cursor points after the last message returned
+			last_id, size = url.split('?cursor=')[1].split(',')
+			start = [m['id'] for m in self.messages].index(last_id) + 1
+			size = int(size)
+
+		page = self.messages[start:start + size]
+		next_link = None
+		if start + size < len(self.messages):
+			next_link = '{}?cursor={},{}'.format(base_url, page[-1]['id'], size)
+		return page, next_link
+
+
+class FullMessage:
+	'''session answering the GET of a whole message'''
+	ok = True
+	status_code = 200
+
+	def __init__(self):
+		self.urls = []
+
+	def get(self, url, **kwargs):
+		self.urls.append(url)
+		return self
+
+	def json(self):
+		return {'id': '0', 'subject': 'message 0', 'hasAttachments': False,
+				'body': {'contentType': 'html', 'content': '<p>hello</p>'}}
+
+
+class TestFluentInbox (unittest.TestCase):
+
+	def setUp(self):
+		con = Connection()
+		self.saved = (con.api_version, Connection.__dict__['get_page'])
+		con.api_version = '2.0'
+
+		self.server = Server(10)
+		Connection.get_page = staticmethod(self.server.get_page)
+		self.inbox = fluent_inbox.FluentInbox()
+		# pages of the size of the fetches, to follow the cursor
+		self.inbox.page_size = 1
+
+	def tearDown(self):
+		con = Connection()
+		con.api_version = self.saved[0]
+		Connection.get_page = self.saved[1]
+
+	def test_fetch_next_follows_cursor(self):
+		first = self.inbox.fetch_first(3)
+		self.assertEqual(['0', '1', '2'], [m.json['Id'] for m in first])
+
+		following = self.inbox.fetch_next(3)
+		self.assertEqual(['3', '4', '5'], [m.json['Id'] for m in following])
+		self.assertEqual(base_url + '?cursor=2,3', self.server.requests[1][0])
+		self.assertEqual(None, self.server.requests[1][1])
+		self.assertEqual(6, self.inbox.fetched_count)
+
+	def test_no_drift_when_mail_arrives(self):
+		self.inbox.fetch_first(3)
+		self.server.messages.insert(0, message('new'))
+		# with $skip the third message would be fetched again
+		self.assertEqual('3', self.inbox.fetch_next(1)[0].json['Id'])
+
+	def test_uneven_counts(self):
+		self.inbox.fetch_first(2)
+		self.assertEqual(['2', '3', '4', '5', '6'], [m.json['Id'] for m in self.inbox.fetch_next(5)])
+		self.assertEqual(['7'], [m.json['Id'] for m in self.inbox.fetch_next(1)])
+		self.assertEqual(['8', '9'], [m.json['Id'] for m in self.inbox.fetch_next(5)])
+		self.assertEqual([], self.inbox.fetch_next(5))
+
+	def test_page_size(self):
+		self.server.messages = [message(i) for i in range(150)]
+		inbox = fluent_inbox.FluentInbox()
+		self.assertEqual(['0'], [m.json['Id'] for m in inbox.fetch_first(1)])
+		self.assertEqual(50, self.server.requests[0][1]['$top'])
+		following = inbox.fetch_next(100)
+		self.assertEqual([str(i) for i in range(1, 101)], [m.json['Id'] for m in following])
+		# the first page was handed out from the buffer, then two pages of 50
+		self.assertEqual(3, len(self.server.requests))
+
+	def test_skip_starts_new_query(self):
+		self.inbox.fetch_first(3)
+		self.assertEqual(['5'], [m.json['Id'] for m in self.inbox.skip(5).fetch(1)])
+		self.assertEqual(5, self.server.requests[-1][1]['$skip'])
+
+	def test_select(self):
+		messages = self.inbox.select('Subject', 'From').fetch_first(2)
+		self.assertEqual('Subject,From,HasAttachments', self.server.requests[0][1]['$select'])
+		self.assertEqual('message 0', messages[0].getSubject())
+
+		session = FullMessage()
+		messages[0].oauth = session
+		self.assertEqual('<p>hello</p>', messages[0].getBody())
+		self.assertEqual('<p>hello</p>', messages[0].getBody())
+		self.assertEqual(1, len(session.urls))
+		self.assertTrue(session.urls[0].endswith('/me/messages/0'))
+
+		self.inbox.select().fetch_first(2)
+		self.assertNotIn('$select', self.server.requests[-1][1])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,126 @@
+from O365.folders import FolderIndex
+from O365.fluent_inbox import FluentInbox
+from O365.connection import MicroDict
+import unittest
+import json
+import threading
+import time
+
+root_url = 'https://graph.microsoft.com/v1.0/me/MailFolders'
+
+
+def folder(folder_id, name, parent_id, children=0):
+	return MicroDict({'id': folder_id, 'displayName': name, 'parentFolderId': parent_id, 'childFolderCount': children})
+
+
+class Resp:
+	status_code = 200
+
+	def __init__(self, value):
+		self.value = value
+
+	def json(self, **kwargs):
+		return json.loads(json.dumps(self.value), **kwargs)
+
+
+class FolderServer:
+	'''mock up of a connection serving a folder tree, slowly'''
+	api_version = '2.0'
+
+	def __init__(self):
+		self.folders = [folder('inbox', 'Inbox', 'root', 2), folder('sent', 'Sent Items', 'root'),
+						folder('clients', 'Clients', 'inbox', 2), folder('archive', 'Archive', 'inbox'),
+						folder('acme', 'Acme', 'clients'), folder('beta', 'Beta', 'clients')]
+		self.listed = []
+		self.delta = []
+		self.lock = threading.Lock()
+
+	def iter_response(self, url, **kwargs):
+		time.sleep(0.1)
+		with self.lock:
+			self.listed.append(url)
+		parent_id = 'root' if url.endswith('/MailFolders') else url.split('/')[-2]
+		return [f for f in self.folders if f['parentFolderId'] == parent_id]
+
+	def send_request(self, method, url, **kwargs):
+		self.delta.append(url)
+		if url.endswith('/delta'):
+			return Resp({'value': self.folders, '@odata.deltaLink': root_url + '/delta?token=1'})
+		return Resp({'value': [{'id': 'beta', '@removed': {'reason': 'deleted'}},
+							   {'id': 'acme', 'displayName': 'Acme Corp', 'parentFolderId': 'inbox'},
+							   {'id': 'new', 'displayName': 'New', 'parentFolderId': 'acme', 'childFolderCount': 0}],
+					 '@odata.deltaLink': root_url + '/delta?token=2'})
+
+
+class TestFolderIndex (unittest.TestCase):
+
+	def setUp(self):
+		self.server = FolderServer()
+		self.index = FolderIndex(self.server, workers=4)
+
+	def test_crawl(self):
+		start = time.time()
+		self.index.load()
+		# the three levels are listed one after the other, the folders of a level at once
+		self.assertLess(time.time() - start, 0.35)
+		self.assertEqual(6, len(self.index))
+		# the folders without child folders are not listed
+		self.assertEqual(3, len(self.server.listed))
+
+	def test_lookup(self):
+		self.index.load()
+		self.assertEqual('acme', self.index.get('Inbox/Clients/Acme')['Id'])
+		self.assertEqual('acme', self.index.get('inbox/clients/acme/')['Id'])
+		self.assertEqual('Acme', self.index.get('acme')['DisplayName'])
+		self.assertEqual('Inbox/Clients/Beta', self.index.path('beta'))
+		self.assertEqual(['Acme', 'Beta'], sorted(f['DisplayName'] for f in self.index.children('Inbox/Clients')))
+		self.assertEqual(['Inbox', 'Sent Items'], sorted(f['DisplayName'] for f in self.index.children()))
+		self.assertTrue('Sent Items' in self.index)
+		self.assertRaises(RuntimeError, self.index.get, 'Inbox/Missing')
+
+	def test_refresh(self):
+		self.index.load()
+		self.index.refresh()
+		self.assertEqual(root_url + '/delta', self.server.delta[0])
+		self.index.refresh()
+		self.assertEqual(root_url + '/delta?token=1', self.server.delta[1])
+		self.assertEqual(root_url + '/delta?token=2', self.index.delta_link)
+
+		self.assertFalse('Inbox/Clients/Beta' in self.index)
+		# moved and renamed, with its new child folder
+		self.assertEqual('Inbox/Acme Corp/New', self.index.path('new'))
+		self.assertEqual('acme', self.index.get('Inbox/Acme Corp')['Id'])
+		self.assertFalse('Inbox/Clients/Acme' in self.index)
+		# the fields not sent back are kept
+		self.assertEqual(0, self.index.get('acme')['ChildFolderCount'])
+
+	def test_shared_by_inboxes(self):
+		self.index.load()
+		first = FluentInbox(connection=self.server, folder_index=self.index).from_folder('Inbox/Clients/Acme')
+		second = FluentInbox(connection=self.server, folder_index=self.index).from_folder('Sent Items')
+		self.assertEqual(root_url + '/acme/messages', first.url)
+		self.assertEqual(root_url + '/sent/messages', second.url)
+		self.assertEqual('archive', second.get_folder('Archive', by='DisplayName', parent_id='inbox')['Id'])
+		self.assertEqual(3, len(self.server.listed))
+
+	def test_path_crawls_once(self):
+		inbox = FluentInbox(connection=self.server)
+		inbox.from_folder('Inbox/Archive')
+		inbox.from_folder('Inbox/Clients/Beta')
+		self.assertEqual(root_url + '/beta/messages', inbox.url)
+		self.assertEqual(3, len(self.server.listed))
+
+	def test_other_mailbox_crawls_once(self):
+		self.index.load()
+		inbox = FluentInbox(connection=self.server, folder_index=self.index)
+		inbox.from_folder('Inbox/Clients/Acme', user_id='bob')
+		inbox.from_folder('Inbox/Clients/Beta', user_id='bob')
+		self.assertEqual('https://graph.microsoft.com/v1.0/users/bob/MailFolders/beta/messages', inbox.url)
+		inbox.from_folder('Inbox/Archive')
+		self.assertIs(self.index, inbox.folder_index)
+		# the shared index, then the mailbox of bob
+		self.assertEqual(6, len(self.server.listed))
+
+
+if __name__ == '__main__':
+	unittest.main()
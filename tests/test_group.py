@@ -47,7 +47,7 @@ def get(url,auth,params=None):
 
 	return ret
 
-group.requests.get = get
+group.Connection.get_session().get = get
 
 class TestGroup (unittest.TestCase):
 	
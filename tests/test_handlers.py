@@ -0,0 +1,170 @@
+from O365.handlers import O365Handler, BatchingO365Handler
+from O365.connection import Connection
+import unittest
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+
+class RecordingHandler(BatchingO365Handler):
+	'''keeps the digests instead of sending them'''
+
+	def __init__(self, *args, **kwargs):
+		self.sent = []
+		self.delay = kwargs.pop('delay', 0)
+		self.sending = threading.Event()
+		super(RecordingHandler, self).__init__(*args, **kwargs)
+
+	def _send(self, subject, body):
+		self.sending.set()
+		time.sleep(self.delay)
+		self.sent.append((subject, body))
+
+
+class Resp:
+	status_code = 202
+	text = ''
+
+
+class Session:
+	'''records the messages sent, or fails'''
+	def __init__(self, fail=False):
+		self.sent = []
+		self.fail = fail
+
+	def post(self, url, data, **kwargs):
+		if self.fail:
+			raise IOError('connection reset')
+		self.sent.append(data)
+		return Resp()
+
+
+CUSTOM = json.dumps({'Subject': 'Custom', 'Body': {'Content': 'c', 'ContentType': 'Text'},
+					 'ToRecipients': [], 'CcRecipients': [], 'BccRecipients': []})
+
+
+class TestHandler (unittest.TestCase):
+
+	def setUp(self):
+		self.session = Session()
+		self.connection = Connection('handlers-test')
+		self.connection.session = self.session
+		self.logger = logging.getLogger('test_handlers.O365Handler')
+		self.logger.propagate = False
+		self.handler = O365Handler(auth=('a@b.c', 'pw'), connection=self.connection)
+		self.handler._defaultMessage.setRecipients('ops@example.com')
+		self.handler._defaultMessage.setBody('Record: ')
+		self.logger.addHandler(self.handler)
+
+	def tearDown(self):
+		self.logger.removeHandler(self.handler)
+		self.connection.session = None
+		Connection.remove('handlers-test')
+
+	def test_emit(self):
+		self.logger.error('disk full')
+		self.logger.error(CUSTOM)
+		self.assertEqual(2, len(self.session.sent))
+		self.assertEqual('Record: disk full', json.loads(self.session.sent[0])['Message']['Body']['Content'])
+		self.assertEqual('Custom', json.loads(self.session.sent[1])['Message']['Subject'])
+		# the messages share the connection of the default message
+		self.assertIs(self.connection, self.handler._defaultMessage.connection)
+
+	def test_emit_does_not_raise(self):
+		self.connection.session = Session(fail=True)
+		self.logger.error('disk full')
+		self.logger.error(CUSTOM)
+
+
+class TestBatchingHandler (unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.logger = logging.getLogger('test_handlers')
+		self.logger.propagate = False
+		self.logger.setLevel(logging.INFO)
+
+	def tearDown(self):
+		for handler in list(self.logger.handlers):
+			self.logger.removeHandler(handler)
+			handler.close()
+		shutil.rmtree(self.dir)
+
+	def handler(self, **kwargs):
+		handler = RecordingHandler(auth=('a@b.c', 'pw'), **kwargs)
+		handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+		self.logger.addHandler(handler)
+		return handler
+
+	def test_digest_with_counts(self):
+		handler = self.handler(window=60)
+		for i in range(50):
+			self.logger.error('database down: %s', 'timeout')
+		self.logger.warning('disk at %d%%', 91)
+		handler.flush()
+
+		self.assertEqual(1, len(handler.sent))
+		subject, body = handler.sent[0]
+		self.assertTrue(subject.startswith('51 log records from '))
+		lines = body.split('\n')
+		self.assertEqual(2, len(lines))
+		self.assertTrue(lines[0].startswith('[50 times from '))
+		self.assertTrue(lines[0].endswith('ERROR database down: timeout'))
+		self.assertEqual('WARNING disk at 91%', lines[1])
+
+	def test_sent_when_max_records_wait(self):
+		handler = self.handler(window=60, max_records=10)
+		for i in range(10):
+			self.logger.error('error %d', i)
+		self.assertTrue(handler.sending.wait(2))
+
+	def test_sent_every_window(self):
+		handler = self.handler(window=0.1)
+		self.logger.error('error')
+		self.assertTrue(handler.sending.wait(2))
+
+	def test_emit_does_not_wait_for_sending(self):
+		handler = self.handler(window=60, max_records=10, delay=0.5)
+		record = self.logger.makeRecord('test_handlers', logging.ERROR, __file__, 1, 'error %d', (1,), None)
+		start = time.time()
+		for i in range(10000):
+			handler.emit(record)
+		# a few microseconds per record, while a digest is being sent
+		self.assertLess(time.time() - start, 0.1)
+
+	def test_drop_when_full(self):
+		handler = self.handler(window=60, capacity=5)
+		for i in range(8):
+			self.logger.error('error %d', i)
+		self.assertEqual(3, handler.stats['dropped'])
+		handler.flush()
+		self.assertIn('3 records were dropped', handler.sent[0][1])
+
+	def test_spill_when_full(self):
+		spill_path = os.path.join(self.dir, 'spill')
+		handler = self.handler(window=60, capacity=5, spill_path=spill_path)
+		for i in range(8):
+			self.logger.error('error %d', i % 2)
+		self.assertEqual(3, handler.stats['spilled'])
+		handler.flush()
+		subject, body = handler.sent[0]
+		self.assertTrue(subject.startswith('8 log records'))
+		# grouped by message format, with the spilled records
+		self.assertEqual(1, len(body.split('\n')))
+		self.assertTrue(body.startswith('[8 times'))
+		self.assertFalse(os.path.exists(spill_path))
+
+	def test_close_sends_waiting_records(self):
+		handler = self.handler(window=60)
+		self.logger.error('last words')
+		self.logger.removeHandler(handler)
+		handler.close()
+		self.assertEqual('ERROR last words', handler.sent[0][1])
+
+
+if __name__ == '__main__':
+	unittest.main()
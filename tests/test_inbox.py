@@ -39,7 +39,7 @@ def get(url,auth,params):
 
 	return ret
 
-inbox.requests.get = get
+inbox.Connection.get_session().get = get
 
 class TestInbox (unittest.TestCase):
 	
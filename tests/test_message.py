@@ -36,7 +36,7 @@ def get(url,**params):
 
 	return ret
 
-message.requests.get = get
+message.Connection.get_session().get = get
 
 def post(url,data,headers,auth):
 	if url != 'https://outlook.office365.com/api/v1.0/me/sendmail':
@@ -60,7 +60,7 @@ def post(url,data,headers,auth):
 
 
 
-message.requests.post = post
+message.Connection.get_session().post = post
 
 def patch(url,data,headers,auth):
 	if url != 'https://outlook.office365.com/api/v1.0/me/messages/big guid=':
@@ -75,7 +75,7 @@ def patch(url,data,headers,auth):
 		raise
 	return True
 
-message.requests.patch = patch
+message.Connection.get_session().patch = patch
 
 auth = ('test@unit.com','pass')
 
@@ -0,0 +1,142 @@
+from O365.connection import Connection, PooledAdapter, mailbox_from_url
+from O365.ratelimit import TokenBucket, RateLimiter, WaitHistogram
+from test_connection import Server, Handler
+import unittest
+import base64
+import json
+import threading
+import requests
+
+
+class TestTokenBucket (unittest.TestCase):
+
+	def test_burst_then_rate(self):
+		bucket = TokenBucket(rate=2, capacity=3)
+		now = bucket.updated
+		self.assertEqual([0, 0, 0], [bucket.reserve(now) for i in range(3)])
+		# tokens are reserved ahead, the callers queue up
+		self.assertAlmostEqual(0.5, bucket.reserve(now))
+		self.assertAlmostEqual(1.0, bucket.reserve(now))
+		self.assertAlmostEqual(0.0, bucket.reserve(now + 2))
+
+
+class TestRateLimiter (unittest.TestCase):
+
+	def setUp(self):
+		self.limiter = RateLimiter(mailbox_rate=1, mailbox_burst=2, tenant_rate=10, tenant_burst=3)
+		self.slept = []
+		self.limiter.sleep = self.slept.append
+
+	def test_per_mailbox(self):
+		self.limiter.acquire('bob', 'unit.com')
+		self.limiter.acquire('bob', 'unit.com')
+		self.assertEqual([], self.slept)
+		self.limiter.acquire('bob', 'unit.com')
+		self.assertEqual(1, len(self.slept))
+		self.assertTrue(0.9 < self.slept[0] <= 1)
+
+	def test_per_tenant(self):
+		for mailbox in ('a', 'b', 'c'):
+			self.limiter.acquire(mailbox, 'unit.com')
+		self.assertEqual([], self.slept)
+		self.limiter.acquire('d', 'unit.com')
+		self.assertEqual(1, len(self.slept))
+		self.limiter.acquire('e', 'other.com')
+		self.assertEqual(1, len(self.slept))
+
+	def test_histogram(self):
+		for i in range(3):
+			self.limiter.acquire('bob', 'unit.com')
+		stats = self.limiter.get_stats()
+		self.assertEqual(3, stats['count'])
+		self.assertEqual(('+Inf', 3), stats['buckets'][-1])
+		self.assertEqual((0.001, 2), stats['buckets'][0])
+
+	def test_histogram_bounds(self):
+		histogram = WaitHistogram([1, 10])
+		for value in (0.5, 5, 50):
+			histogram.observe(value)
+		self.assertEqual([(1, 1), (10, 2), ('+Inf', 3)], histogram.get_stats()['buckets'])
+
+
+class Owner:
+	'''mock up connection owning the adapter'''
+	def __init__(self, limiter):
+		self.rate_limiter = limiter
+
+	def tenant(self):
+		return 'unit.com'
+
+	def mailbox(self, request_url):
+		return mailbox_from_url(request_url)
+
+
+class FakeOAuth:
+	def __init__(self, **claims):
+		payload = base64.urlsafe_b64encode(json.dumps(claims).encode('utf-8')).decode('ascii')
+		self.access_token = 'header.{}.signature'.format(payload.rstrip('='))
+
+
+class TestBucketKeys (unittest.TestCase):
+
+	def tearDown(self):
+		for name in ('limit-a', 'limit-b', 'limit-basic'):
+			Connection.remove(name)
+
+	def connection(self, name, **claims):
+		con = Connection(name)
+		con.api_version = '2.0'
+		con.client_id = 'app'
+		con.oauth = FakeOAuth(**claims)
+		return con
+
+	def test_oauth_users_and_tenants(self):
+		alice = self.connection('limit-a', tid='t1', oid='Alice')
+		bob = self.connection('limit-b', tid='t2', oid='bob')
+		url = 'https://graph.microsoft.com/v1.0/me/messages'
+		self.assertEqual(('alice', 't1'), (alice.mailbox(url), alice.tenant()))
+		self.assertEqual(('bob', 't2'), (bob.mailbox(url), bob.tenant()))
+		# other mailboxes are still keyed by their url
+		self.assertEqual('carol@b.c', alice.mailbox('https://graph.microsoft.com/v1.0/users/Carol@b.c/messages'))
+
+	def test_tokens_without_claims(self):
+		con = self.connection('limit-a')
+		con.oauth.access_token = 'opaque'
+		self.assertEqual('app', con.tenant())
+		self.assertEqual('me limit-a', con.mailbox('https://graph.microsoft.com/v1.0/me/messages'))
+
+	def test_basic_auth(self):
+		con = Connection('limit-basic')
+		con.api_version = '1.0'
+		con.auth = ('Dave@Unit.com', 'pw')
+		self.assertEqual('unit.com', con.tenant())
+		self.assertEqual('dave@unit.com', con.mailbox('https://outlook.office365.com/api/v1.0/me/messages'))
+
+
+class TestPooledAdapterLimit (unittest.TestCase):
+
+	def test_requests_are_paced(self):
+		server = Server(('127.0.0.1', 0), Handler)
+		thread = threading.Thread(target=server.serve_forever)
+		thread.daemon = True
+		thread.start()
+
+		acquired = []
+
+		class Limiter:
+			def acquire(self, mailbox, tenant):
+				acquired.append((mailbox, tenant))
+
+		session = requests.Session()
+		session.mount('http://', PooledAdapter(owner=Owner(Limiter())))
+		url = 'http://127.0.0.1:{}/v1.0/users/Bob@unit.com/MailFolders'.format(server.server_port)
+		session.get(url)
+		session.close()
+		server.shutdown()
+		server.server_close()
+
+		self.assertEqual([('bob@unit.com', 'unit.com')], acquired)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,102 @@
+from O365.connection import Connection, mailbox_from_url
+from O365.retry import RetryPolicy
+import unittest
+import requests
+
+
+class Resp:
+	def __init__(self,code,headers=None):
+		self.status_code = code
+		self.headers = headers or {}
+		self.url = 'https://graph.microsoft.com/v1.0/me/messages'
+
+
+class TestRetryPolicy (unittest.TestCase):
+
+	def test_retry_after(self):
+		policy = RetryPolicy()
+		self.assertEqual(7, policy.get_delay('GET', 0, 'me', response=Resp(429, {'Retry-After': '7'})))
+		self.assertEqual(None, policy.get_delay('GET', 0, 'me', response=Resp(404)))
+		self.assertEqual(None, policy.get_delay('GET', 0, 'me', response=Resp(429, {'Retry-After': '3600'})))
+
+	def test_backoff(self):
+		policy = RetryPolicy(backoff_factor=1, max_backoff=5, max_retries=10)
+		for attempt in range(10):
+			delay = policy.get_delay('GET', attempt, 'me', response=Resp(503))
+			self.assertTrue(0 <= delay <= min(5, 2 ** attempt))
+		self.assertEqual(None, policy.get_delay('GET', 10, 'me', response=Resp(503)))
+
+	def test_post_is_not_retried(self):
+		policy = RetryPolicy()
+		self.assertEqual(None, policy.get_delay('POST', 0, 'me', response=Resp(503)))
+		self.assertEqual(None, policy.get_delay('POST', 0, 'me', error=requests.ConnectionError()))
+		self.assertEqual(2, policy.get_delay('POST', 0, 'me', response=Resp(429, {'Retry-After': '2'})))
+		self.assertEqual(2, policy.get_delay('POST', 0, 'me', response=Resp(503, {'Retry-After': '2'}), idempotent=True))
+
+	def test_mailbox_budget(self):
+		policy = RetryPolicy(mailbox_budget=2)
+		throttled = Resp(429, {'Retry-After': '1'})
+		self.assertEqual(1, policy.get_delay('GET', 0, 'bob', response=throttled))
+		self.assertEqual(1, policy.get_delay('GET', 0, 'bob', response=throttled))
+		self.assertEqual(None, policy.get_delay('GET', 0, 'bob', response=throttled))
+		self.assertEqual(1, policy.get_delay('GET', 0, 'alice', response=throttled))
+
+		stats = policy.get_stats()
+		self.assertEqual(3, stats['retries'])
+		self.assertEqual(4, stats['throttled'])
+		self.assertEqual(3, stats['throttled_time'])
+		self.assertEqual(1, stats['gave_up'])
+
+	def test_mailbox_from_url(self):
+		self.assertEqual('bob@unit.com', mailbox_from_url('https://graph.microsoft.com/v1.0/users/Bob@unit.com/MailFolders'))
+		self.assertEqual('me', mailbox_from_url('https://graph.microsoft.com/v1.0/me/messages?$top=10'))
+
+
+class TestConnectionRetry (unittest.TestCase):
+
+	def setUp(self):
+		con = Connection()
+		self.saved = (con.api_version, con.auth, con.retry_policy, Connection._send_once)
+		con.api_version = '1.0'
+		con.auth = ('test@unit.com', 'pass')
+		self.slept = []
+		self.policy = RetryPolicy()
+		self.policy.sleep = self.slept.append
+		Connection.set_retry_policy(self.policy)
+
+		self.responses = []
+
+		def send_once(connection, method, url, con_params):
+			response = self.responses.pop(0)
+			if isinstance(response, Exception):
+				raise response
+			return response
+
+		Connection._send_once = send_once
+
+	def tearDown(self):
+		con = Connection()
+		con.api_version, con.auth, con.retry_policy, Connection._send_once = self.saved
+
+	def test_retries_until_success(self):
+		self.responses = [Resp(429, {'Retry-After': '3'}), requests.ConnectionError(), Resp(200)]
+		response = Connection.send_request('GET', 'https://graph.microsoft.com/v1.0/me/messages')
+		self.assertEqual(200, response.status_code)
+		self.assertEqual(3, self.slept[0])
+		self.assertEqual(2, Connection.retry_stats()['retries'])
+
+	def test_gives_up(self):
+		self.policy.max_retries = 1
+		self.responses = [Resp(503), Resp(503)]
+		self.assertRaises(RuntimeError, Connection.send_request, 'GET', 'https://graph.microsoft.com/v1.0/me/messages')
+		self.assertEqual(1, len(self.slept))
+
+	def test_disabled(self):
+		Connection.set_retry_policy(None)
+		self.responses = [requests.ConnectionError()]
+		self.assertRaises(requests.ConnectionError, Connection.send_request, 'GET', 'https://graph.microsoft.com/v1.0/me')
+		self.assertEqual({}, Connection.retry_stats())
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -1,6 +1,8 @@
-from O365 import schedule
+from O365 import schedule, cal, event
+from O365.connection import MicroDict
 import unittest
 import json
+import time
 
 class Calendar:
 	'''mock up calendar class'''
@@ -47,5 +49,89 @@ class TestSchedule (unittest.TestCase):
 		self.assertEqual('pass',self.val.auth[1])
 
 
+class Account:
+	'''mock up connection of an account, serving the events of its calendars slowly'''
+	oauth = None
+	default_headers = None
+
+	def __init__(self, events, fail=()):
+		self.events = events
+		self.fail = fail
+		self.requests = []
+
+	def is_valid(self):
+		return True
+
+	def iter_response(self, url, **kwargs):
+		self.requests.append((url, kwargs))
+		time.sleep(0.1)
+		calendar_id = url.split('/')[-2]
+		if calendar_id in self.fail:
+			raise RuntimeError('calendar unavailable')
+		return [MicroDict({'Id': '{}-{}'.format(calendar_id, start), 'Subject': 'booking',
+						   'Start': '2018-01-0{}T10:00:00Z'.format(start)}) if isinstance(start, int) else
+				MicroDict({'Id': '{}-{}'.format(calendar_id, index), 'Subject': 'booking', 'Start': start})
+				for index, start in enumerate(self.events[calendar_id])]
+
+
+class TestFetchAllEvents (unittest.TestCase):
+
+	def setUp(self):
+		# other tests replace the Event class of the cal module
+		self.Event = cal.Event
+		cal.Event = event.Event
+
+	def tearDown(self):
+		cal.Event = self.Event
+
+	def calendars(self, account, ids):
+		return [cal.Calendar({'Id': calendar_id, 'Name': calendar_id}, ('a@b.c', 'pw'), connection=account) for calendar_id in ids]
+
+	def test_merged_by_start(self):
+		first = Account({'van': [3, 1], 'car': [2, 5]})
+		second = Account({'bus': [4, 1]})
+		calendars = self.calendars(first, ['van', 'car']) + self.calendars(second, ['bus'])
+
+		start = time.time()
+		events, report = schedule.fetch_all_events(calendars, '2018-01-01T00:00:00Z', '2018-02-01T00:00:00Z', workers=3)
+		self.assertLess(time.time() - start, 0.25)
+		self.assertEqual(['van-1', 'bus-1', 'car-2', 'van-3', 'bus-4', 'car-5'], [e.json['Id'] for e in events])
+		self.assertEqual([2, 2, 2], [fetch.count for fetch in report])
+		self.assertTrue(all(fetch.ok and fetch.seconds >= 0.1 for fetch in report))
+
+		url, kwargs = first.requests[0]
+		self.assertEqual('https://outlook.office365.com/api/v1.0/me/calendars/van/calendarView', url)
+		self.assertEqual({'startDateTime': '2018-01-01T00:00:00Z', 'endDateTime': '2018-02-01T00:00:00Z'}, kwargs['params'])
+		# the events are also kept by the calendars
+		self.assertEqual(2, len(calendars[0].events))
+		self.assertEqual('outlook.timezone="UTC"', kwargs['headers']['Prefer'])
+
+	def test_mixed_time_zones(self):
+		account = Account({
+			'utc': ['2018-01-01T09:30:00Z'],
+			'paris': ['2018-01-01T10:00:00+01:00', '2018-01-01T11:00:00.5+01:00'],
+			'graph': [{'dateTime': '2018-01-01T04:45:00.0000000', 'timeZone': 'America/New_York'},
+					  {'dateTime': '2018-01-01T08:15:00.0000000', 'timeZone': 'UTC'}],
+		})
+		events, report = schedule.fetch_all_events(self.calendars(account, ['utc', 'paris', 'graph']), workers=3)
+		# 08:15, 09:00, 09:30, 09:45, 10:00:00.5 UTC
+		self.assertEqual(['graph-1', 'paris-0', 'utc-0', 'graph-0', 'paris-1'], [e.json['Id'] for e in events])
+
+	def test_failures_reported(self):
+		account = Account({'van': [1], 'car': [2]}, fail=['car'])
+		events, report = schedule.fetch_all_events(self.calendars(account, ['van', 'car']), workers=2)
+		self.assertEqual(['van-1'], [e.json['Id'] for e in events])
+		self.assertTrue(report[0].ok)
+		self.assertTrue(isinstance(report[1].error, RuntimeError))
+
+	def test_schedule(self):
+		account = Account({'van': [2], 'car': [1]})
+		sch = schedule.Schedule(('a@b.c', 'pw'), connection=account)
+		for calendar in self.calendars(account, ['van', 'car']):
+			sch.calendars.upsert(calendar, calendar.json['Id'])
+		events, report = sch.fetch_all_events(workers=2)
+		self.assertEqual(['car-1', 'van-2'], [e.json['Id'] for e in events])
+
+
 if __name__ == '__main__':
 	unittest.main()
@@ -0,0 +1,51 @@
+from O365.connection import micro_object
+from O365.streaming import iter_values
+import unittest
+import json
+
+
+def chunked(value, size):
+	body = json.dumps(value).encode('utf-8')
+	return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+class TestIterValues (unittest.TestCase):
+
+	def setUp(self):
+		self.page = {'@odata.context': 'ctx',
+					 'value': [{'id': str(i), 'subject': u'résumé {}'.format(i), 'size': 1000 + i,
+								'body': {'content': 'x' * (i * 50)}} for i in range(30)],
+					 '@odata.nextLink': 'next'}
+
+	def test_any_chunk_size(self):
+		for size in (1, 2, 7, 64, 100000):
+			fields = {}
+			values = list(iter_values(chunked(self.page, size), fields))
+			self.assertEqual(self.page['value'], values)
+			self.assertEqual({'@odata.context': 'ctx', '@odata.nextLink': 'next'}, fields)
+
+	def test_is_incremental(self):
+		chunks = chunked(self.page, 16)
+		read = []
+
+		def reader():
+			for chunk in chunks:
+				read.append(chunk)
+				yield chunk
+
+		values = iter_values(reader())
+		next(values)
+		self.assertLess(len(read), len(chunks) / 10)
+
+	def test_object_hook(self):
+		value = next(iter_values(chunked(self.page, 10), object_hook=micro_object))
+		self.assertEqual('x' * 0, value['Body']['Content'])
+
+	def test_empty_and_missing(self):
+		self.assertEqual([], list(iter_values([b'{"value": []}'])))
+		self.assertRaises(RuntimeError, list, iter_values([b'{"error": {"code": "x"}}']))
+		self.assertRaises(ValueError, list, iter_values([b'{"value": [{"id": 1}']))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,183 @@
+from O365.subscriptions import Subscriptions, NotificationListener, LocalNotifier, _graph_time
+import unittest
+import json
+import threading
+import time
+
+import requests
+
+
+class Status:
+	def __init__(self, status_code):
+		self.status_code = status_code
+
+
+class GraphConnection:
+	'''mock up of a Graph connection keeping the subscriptions'''
+	api_version = '2.0'
+
+	def __init__(self):
+		self.requests = []
+		self.patch_error = None
+		self.status = 200
+
+	def send_request(self, method, url, **kwargs):
+		self.requests.append((method, url, None))
+		return Status(self.status)
+
+	def post_data(self, url, data, **kwargs):
+		self.requests.append(('POST', url, json.loads(data)))
+		subscription = json.loads(data)
+		del subscription['clientState']
+		subscription['id'] = 'sub{}'.format(len(self.requests))
+		return subscription
+
+	def patch_data(self, url, data, **kwargs):
+		self.requests.append(('PATCH', url, json.loads(data)))
+		if self.patch_error:
+			raise self.patch_error
+		return json.loads(data)
+
+	def delete_data(self, url, **kwargs):
+		self.requests.append(('DELETE', url, None))
+
+
+class TestSubscriptions (unittest.TestCase):
+
+	def setUp(self):
+		self.connection = GraphConnection()
+		self.subscriptions = Subscriptions(self.connection)
+
+	def test_create(self):
+		subscription = self.subscriptions.create('me/mailFolders/inbox/messages', 'https://example.com/hook')
+		method, url, data = self.connection.requests[0]
+		self.assertEqual('https://graph.microsoft.com/v1.0/subscriptions', url)
+		self.assertEqual('created', data['changeType'])
+		self.assertEqual(data['clientState'], subscription['clientState'])
+		self.assertEqual(set([data['clientState']]), self.subscriptions.client_states())
+
+	def test_renew_due(self):
+		first = self.subscriptions.create('me/messages', 'https://example.com/hook')
+		self.subscriptions.create('me/events', 'https://example.com/hook')
+		first['expirationDateTime'] = _graph_time(time.time() + 60)
+
+		renewed = self.subscriptions.renew_due(margin=3600)
+		self.assertEqual([first], renewed)
+		self.assertEqual(('PATCH', 'https://graph.microsoft.com/v1.0/subscriptions/' + first['id']),
+						 self.connection.requests[-1][:2])
+		self.assertEqual([], self.subscriptions.renew_due(margin=3600))
+
+	def test_failed_renewal_retried_later(self):
+		subscription = self.subscriptions.create('me/messages', 'https://example.com/hook')
+		subscription['expirationDateTime'] = _graph_time(time.time() + 60)
+		self.connection.patch_error = RuntimeError('connection reset')
+		self.assertEqual([], self.subscriptions.renew_due(margin=3600))
+		self.assertEqual([subscription['id']], list(self.subscriptions.subscriptions))
+
+	def test_deleted_subscription_created_again(self):
+		subscription = self.subscriptions.create('me/messages', 'https://example.com/hook', client_state='secret')
+		subscription['expirationDateTime'] = _graph_time(time.time() + 60)
+		self.connection.patch_error = RuntimeError('ResourceNotFound')
+		self.connection.status = 404
+		renewed = self.subscriptions.renew_due(margin=3600)
+		self.assertEqual(1, len(renewed))
+		self.assertNotEqual(subscription['id'], renewed[0]['id'])
+		self.assertEqual('me/messages', renewed[0]['resource'])
+		self.assertEqual([renewed[0]['id']], list(self.subscriptions.subscriptions))
+		self.assertEqual(set(['secret']), self.subscriptions.client_states())
+
+	def test_expired_subscription_created_again(self):
+		subscription = self.subscriptions.create('me/messages', 'https://example.com/hook')
+		subscription['expirationDateTime'] = _graph_time(time.time() - 60)
+		self.connection.patch_error = RuntimeError('ResourceNotFound')
+		self.assertEqual(1, len(self.subscriptions.renew_due()))
+		self.assertEqual('POST', self.connection.requests[-1][0])
+
+	def test_delete(self):
+		subscription = self.subscriptions.create('me/messages', 'https://example.com/hook')
+		self.subscriptions.delete(subscription['id'])
+		self.assertEqual('DELETE', self.connection.requests[-1][0])
+		self.assertEqual(set(), self.subscriptions.client_states())
+
+	def test_needs_graph(self):
+		self.connection.api_version = '1.0'
+		self.assertRaises(RuntimeError, self.subscriptions.create, 'me/messages', 'https://example.com/hook')
+
+
+class TestNotificationListener (unittest.TestCase):
+
+	def setUp(self):
+		self.received = []
+		self.listener = NotificationListener(host='127.0.0.1', port=0, client_states=['secret'])
+		self.listener.add_callback(self.received.append, change_type='created')
+		self.listener.start()
+		self.notifier = LocalNotifier(self.listener.url, client_state='secret')
+
+	def tearDown(self):
+		self.listener.stop()
+
+	def test_start_twice(self):
+		server = self.listener._server
+		self.listener.start()
+		self.assertIs(server, self.listener._server)
+		self.assertTrue(self.notifier.validate())
+
+	def test_serve_forever_survives_renewal_errors(self):
+		class Failing:
+			calls = 0
+
+			def renew_due(self, margin):
+				Failing.calls += 1
+				raise RuntimeError('connection reset')
+
+		thread = threading.Thread(target=self.listener.serve_forever, args=(Failing(), 0.01))
+		thread.start()
+		time.sleep(0.1)
+		self.assertTrue(thread.is_alive())
+		self.assertTrue(self.notifier.validate())
+		self.listener.stop()
+		thread.join(2)
+		self.assertFalse(thread.is_alive())
+		self.assertTrue(Failing.calls > 1)
+
+	def test_validation(self):
+		self.assertTrue(self.notifier.validate())
+
+	def test_dispatch(self):
+		start = time.time()
+		self.assertEqual(202, self.notifier.notify('Users/me/Messages/AAMk1'))
+		self.assertEqual(202, self.notifier.notify('Users/me/Messages/AAMk1', change_type='updated'))
+		self.listener.join()
+		self.assertLess(time.time() - start, 1)
+		self.assertEqual(['AAMk1'], [notification['resourceData']['id'] for notification in self.received])
+
+	def test_unknown_client_state(self):
+		LocalNotifier(self.listener.url, client_state='guess').notify('Users/me/Messages/AAMk1')
+		self.listener.join()
+		self.assertEqual([], self.received)
+		self.assertEqual(1, self.listener.stats['rejected'])
+
+	def test_slow_callback_does_not_delay_answer(self):
+		self.listener.add_callback(lambda notification: time.sleep(0.5))
+		start = time.time()
+		self.notifier.notify('Users/me/Messages/AAMk1')
+		self.assertLess(time.time() - start, 0.4)
+		self.listener.join()
+
+	def test_failing_callback(self):
+		def fail(notification):
+			raise ValueError('callback bug')
+		self.listener.add_callback(fail)
+		self.notifier.notify('Users/me/Messages/AAMk1')
+		self.listener.join()
+		self.assertEqual(1, len(self.received))
+		self.assertEqual(1, self.listener.stats['failed'])
+
+	def test_other_paths(self):
+		session = requests.Session()
+		self.assertEqual(404, session.post(self.listener.url.replace('/notifications', '/other')).status_code)
+		self.assertEqual(400, session.post(self.listener.url, data='not json').status_code)
+
+
+if __name__ == '__main__':
+	unittest.main()
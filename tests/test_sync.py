@@ -0,0 +1,179 @@
+from O365 import fluent_inbox
+from O365.connection import Connection
+from O365.sync import MemoryStateStore, FileStateStore, SqliteStateStore
+import unittest
+import json
+import os
+import tempfile
+import threading
+
+delta_url = 'https://graph.microsoft.com/v1.0/me/MailFolders/inbox/messages/delta'
+
+
+class Resp:
+	def __init__(self,json_value,code=200):
+		self.json_value = json_value
+		self.status_code = code
+
+	def json(self, **kwargs):
+		return json.loads(json.dumps(self.json_value), **kwargs)
+
+
+def message(i):
+	return {'id': i, 'subject': 'message ' + i, 'hasAttachments': False}
+
+
+class TestSync (unittest.TestCase):
+
+	def setUp(self):
+		con = Connection()
+		self.saved = (con.api_version, Connection.__dict__['send_request'])
+		con.api_version = '2.0'
+		self.responses = {}
+		self.requested = []
+
+		def send_request(method, url, data=None, **kwargs):
+			self.requested.append(url)
+			return self.responses[url]
+
+		Connection.send_request = staticmethod(send_request)
+		self.inbox = fluent_inbox.FluentInbox()
+		self.store = MemoryStateStore()
+
+	def tearDown(self):
+		con = Connection()
+		con.api_version = self.saved[0]
+		Connection.send_request = self.saved[1]
+
+	def test_initial_then_incremental(self):
+		self.responses[delta_url] = Resp({'value': [message('1'), message('2')],
+										  '@odata.nextLink': delta_url + '?$skiptoken=a'})
+		self.responses[delta_url + '?$skiptoken=a'] = Resp({'value': [message('3')],
+															 '@odata.deltaLink': delta_url + '?$deltatoken=b'})
+		result = self.inbox.sync(self.store)
+		self.assertEqual(['1', '2', '3'], [m.json['Id'] for m in result.added])
+		self.assertEqual(0, len(result.changed) + len(result.removed))
+
+		self.responses[delta_url + '?$deltatoken=b'] = Resp({
+			'value': [message('2'), message('4'), {'id': '3', '@removed': {'reason': 'deleted'}}],
+			'@odata.deltaLink': delta_url + '?$deltatoken=c'})
+		result = self.inbox.sync(self.store)
+		self.assertEqual(['4'], [m.json['Id'] for m in result.added])
+		self.assertEqual(['2'], [m.json['Id'] for m in result.changed])
+		self.assertEqual(['3'], result.removed)
+		self.assertEqual(delta_url + '?$deltatoken=c', self.store.get_delta_link(self.inbox.url))
+
+	def test_expired_token(self):
+		self.store.save(self.inbox.url, delta_url + '?$deltatoken=old', ['1'], [])
+		self.responses[delta_url + '?$deltatoken=old'] = Resp({}, 410)
+		self.responses[delta_url] = Resp({'value': [message('1')],
+										  '@odata.deltaLink': delta_url + '?$deltatoken=new'})
+		result = self.inbox.sync(self.store)
+		self.assertEqual(['1'], [m.json['Id'] for m in result.added])
+		self.assertEqual(delta_url + '?$deltatoken=new', self.store.get_delta_link(self.inbox.url))
+
+	def test_requires_graph(self):
+		Connection().api_version = '1.0'
+		self.assertRaises(RuntimeError, self.inbox.sync, self.store)
+
+
+class TestStateStores (unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+
+	def check_store(self, store):
+		self.assertEqual(None, store.get_delta_link('folder'))
+		store.save('folder', 'link1', ['a', 'b'], [])
+		store.save('folder', 'link2', ['c'], ['a'])
+		self.assertEqual('link2', store.get_delta_link('folder'))
+		self.assertFalse(store.is_known('folder', 'a'))
+		self.assertTrue(store.is_known('folder', 'b'))
+		self.assertFalse(store.is_known('other', 'b'))
+
+	def test_file_store(self):
+		file_path = os.path.join(self.dir, 'state.json')
+		self.check_store(FileStateStore(file_path))
+
+		reopened = FileStateStore(file_path)
+		self.assertEqual('link2', reopened.get_delta_link('folder'))
+		self.assertTrue(reopened.is_known('folder', 'c'))
+		reopened.clear('folder')
+		self.assertEqual(None, FileStateStore(file_path).get_delta_link('folder'))
+
+	def test_file_store_appends_ids(self):
+		file_path = os.path.join(self.dir, 'state.json')
+		store = FileStateStore(file_path)
+		store.save('folder', 'link1', ['id{}'.format(i) for i in range(5000)], [])
+		size = os.path.getsize(file_path + '.ids')
+		store.save('folder', 'link2', ['id1', 'new'], ['id2'])
+		# only the changes are written
+		self.assertLess(os.path.getsize(file_path + '.ids') - size, 100)
+		with open(file_path) as links:
+			self.assertEqual({'folder': 'link2'}, json.load(links))
+
+		reopened = FileStateStore(file_path)
+		self.assertTrue(reopened.is_known('folder', 'new'))
+		self.assertFalse(reopened.is_known('folder', 'id2'))
+		self.assertTrue(reopened.is_known('folder', 'id4999'))
+
+	def test_file_store_compaction(self):
+		file_path = os.path.join(self.dir, 'state.json')
+		store = FileStateStore(file_path)
+		store.save('folder', 'link', ['kept'], [])
+		for i in range(1000):
+			store.save('folder', 'link', ['id{}'.format(i)], ['id{}'.format(i - 1)])
+		with open(file_path + '.ids') as ids_file:
+			self.assertLess(len(ids_file.readlines()), 500)
+		reopened = FileStateStore(file_path)
+		self.assertEqual(set(['kept', 'id999']), reopened._states['folder']['ids'])
+
+	def test_file_store_cut_journal(self):
+		file_path = os.path.join(self.dir, 'state.json')
+		FileStateStore(file_path).save('folder', 'link', ['a'], [])
+		with open(file_path + '.ids', 'a') as ids_file:
+			ids_file.write('{"key": "folder", "added": ["b"')
+		store = FileStateStore(file_path)
+		self.assertTrue(store.is_known('folder', 'a'))
+		store.save('folder', 'link', ['c'], [])
+		self.assertTrue(FileStateStore(file_path).is_known('folder', 'c'))
+
+	def test_file_store_previous_format(self):
+		file_path = os.path.join(self.dir, 'state.json')
+		with open(file_path, 'w') as state_file:
+			json.dump({'folder': {'delta_link': 'link', 'ids': ['a', 'b']}}, state_file)
+		store = FileStateStore(file_path)
+		self.assertEqual('link', store.get_delta_link('folder'))
+		self.assertTrue(FileStateStore(file_path).is_known('folder', 'b'))
+
+	def test_file_store_threads(self):
+		store = FileStateStore(os.path.join(self.dir, 'state.json'))
+
+		def sync(n):
+			for i in range(50):
+				store.save('folder{}'.format(n), 'link{}'.format(i), ['{}-{}'.format(n, i)], [])
+
+		threads = [threading.Thread(target=sync, args=(n,)) for n in range(8)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		reopened = FileStateStore(store.file_path)
+		self.assertTrue(all(reopened.get_delta_link('folder{}'.format(n)) == 'link49' for n in range(8)))
+		self.assertTrue(reopened.is_known('folder7', '7-49'))
+
+	def test_sqlite_store(self):
+		db_path = os.path.join(self.dir, 'state.db')
+		store = SqliteStateStore(db_path)
+		self.check_store(store)
+		store.close()
+
+		reopened = SqliteStateStore(db_path)
+		self.assertTrue(reopened.is_known('folder', 'c'))
+		reopened.clear('folder')
+		self.assertFalse(reopened.is_known('folder', 'c'))
+		reopened.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,123 @@
+from O365.template import MessageTemplate
+from O365.handlers import O365Handler
+from O365.connection import Connection
+from O365 import message, fluent_message, attachment
+import unittest
+import json
+import logging
+
+
+class Resp:
+	status_code = 202
+	text = ''
+
+
+class Session:
+	'''records the messages sent'''
+	def __init__(self):
+		self.sent = []
+
+	def post(self, url, data, **kwargs):
+		self.sent.append((url, data))
+		return Resp()
+
+
+class TestMessageTemplate (unittest.TestCase):
+
+	def setUp(self):
+		self.session = Session()
+		self.connection = Connection('template-test')
+		self.connection.session = self.session
+		# other tests replace the Attachment class of the message module
+		self.Attachment = message.Attachment
+		message.Attachment = attachment.Attachment
+		self.message = message.Message(auth=('a@b.c', 'pw'), connection=self.connection)
+		self.message.setRecipients('ops@example.com')
+		self.message.setSubject('Alert')
+		self.message.setBody('Report:\n')
+
+	def tearDown(self):
+		message.Attachment = self.Attachment
+		self.connection.session = None
+		Connection.remove('template-test')
+
+	def test_render_matches_send_message(self):
+		template = MessageTemplate(self.message)
+		for body, subject in [('disk "full" é\n', None), ('', 'Other \\ subject')]:
+			rendered = json.loads(template.render(body, subject))
+			expected = self.message._sendData(subject=subject if subject is not None else 'Alert',
+											  body='Report:\n' + body)
+			self.assertEqual(expected, rendered)
+
+	def test_send(self):
+		template = MessageTemplate(self.message)
+		self.assertTrue(template.send('host1 is down'))
+		self.assertTrue(template.send('host2 is down', subject='Critical'))
+		url, data = self.session.sent[1]
+		self.assertEqual('https://outlook.office365.com/api/v1.0/me/sendmail', url)
+		self.assertEqual('Critical', json.loads(data)['Message']['Subject'])
+		self.assertEqual('Report:\nhost2 is down', json.loads(data)['Message']['Body']['Content'])
+		self.assertEqual('ops@example.com', json.loads(data)['Message']['ToRecipients'][0]['EmailAddress']['Address'])
+
+	def test_attachments_serialized_once(self):
+		att = attachment.Attachment()
+		att.setName('report.txt')
+		att.setByteString(b'report')
+		self.message.attachments.append(att)
+		template = MessageTemplate(self.message)
+		att.setByteString(b'changed')
+		self.assertEqual('cmVwb3J0\n', json.loads(template.render('x'))['Message']['Attachments'][0]['ContentBytes'])
+
+	def test_fluent_message(self):
+		fluent = fluent_message.Message(auth=('a@b.c', 'pw'), connection=self.connection)
+		fluent.setRecipients('ops@example.com')
+		fluent.setSubject('Alert')
+		MessageTemplate(fluent, user_id='shared@example.com').send('hello')
+		url, data = self.session.sent[0]
+		self.assertEqual('https://outlook.office365.com/api/v1.0/users/shared@example.com/sendmail', url)
+		self.assertEqual('hello', json.loads(data)['Message']['Body']['Content'])
+
+
+class TestHandler (unittest.TestCase):
+
+	def setUp(self):
+		self.session = Session()
+		self.connection = Connection('handler-test')
+		self.connection.session = self.session
+		self.handler = O365Handler(auth=('a@b.c', 'pw'), connection=self.connection)
+		self.handler._defaultMessage.setRecipients('ops@example.com')
+		self.handler._defaultMessage.setSubject('Log')
+		self.handler._defaultMessage.setBody('Record: ')
+
+	def tearDown(self):
+		self.connection.session = None
+		Connection.remove('handler-test')
+
+	def record(self, msg):
+		return logging.LogRecord('test', logging.ERROR, __file__, 1, msg, None, None)
+
+	def test_records_appended_to_default_body(self):
+		for i in range(3):
+			self.handler.emit(self.record('error {}'.format(i)))
+		bodies = [json.loads(data)['Message']['Body']['Content'] for url, data in self.session.sent]
+		self.assertEqual(['Record: error 0', 'Record: error 1', 'Record: error 2'], bodies)
+		# the default message is left alone
+		self.assertEqual('Record: ', self.handler._defaultMessage.getBody())
+
+	def test_json_record(self):
+		custom = {'Subject': 'Custom', 'Body': {'Content': 'c', 'ContentType': 'Text'},
+				  'ToRecipients': [], 'CcRecipients': [], 'BccRecipients': []}
+		self.handler.emit(self.record(json.dumps(custom)))
+		self.assertEqual('Custom', json.loads(self.session.sent[0][1])['Message']['Subject'])
+		self.assertEqual('Log', self.handler._defaultMessage.getSubject())
+
+	def test_refresh(self):
+		self.handler.emit(self.record('one'))
+		self.handler._defaultMessage.setSubject('Changed')
+		self.handler.refresh()
+		self.handler.emit(self.record('two'))
+		self.assertEqual('Changed', json.loads(self.session.sent[1][1])['Message']['Subject'])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,138 @@
+from O365.connection import Connection
+from O365.token_store import FileTokenStore, SqliteTokenStore
+import unittest
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from test_connection import FakeOAuth
+
+
+def increment(store_class, store_path, times):
+	'''reads, bumps and saves a counter kept in the token, under the store lock'''
+	store = store_class(store_path)
+	for i in range(times):
+		with store.lock():
+			token = store.load()
+			token['count'] += 1
+			store.save(token)
+
+
+class StoreTests(object):
+
+	def test_round_trip(self):
+		self.assertEqual(None, self.store.load())
+		self.store.save({'access_token': 'a', 'expires_at': 1.5})
+		self.assertEqual({'access_token': 'a', 'expires_at': 1.5}, self.store.load())
+		self.store.save({'access_token': 'b'})
+		self.assertEqual('b', self.store.load()['access_token'])
+		self.store.delete()
+		self.assertEqual(None, self.store.load())
+
+	def test_lock_is_reentrant(self):
+		with self.store.lock():
+			with self.store.lock():
+				self.store.save({'access_token': 'a'})
+			self.assertEqual('a', self.store.load()['access_token'])
+
+	def test_processes_do_not_lose_updates(self):
+		self.store.save({'access_token': 'a', 'count': 0})
+		processes = [multiprocessing.Process(target=increment, args=(type(self.store), self.store_path, 20)) for i in range(4)]
+		for process in processes:
+			process.start()
+		for process in processes:
+			process.join()
+		self.assertEqual(80, self.store.load()['count'])
+
+
+class TestFileTokenStore (StoreTests, unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.store = self.make_store()
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def make_store(self):
+		self.store_path = os.path.join(self.dir, 'token')
+		return FileTokenStore(self.store_path)
+
+	def test_no_temporary_files_left(self):
+		self.store.save({'access_token': 'a'})
+		self.assertEqual(['token'], [name for name in os.listdir(self.dir) if not name.endswith('.lock')])
+
+
+class TestSqliteTokenStore (StoreTests, unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.store = self.make_store()
+
+	def tearDown(self):
+		self.store.close()
+		shutil.rmtree(self.dir)
+
+	def make_store(self):
+		self.store_path = os.path.join(self.dir, 'tokens.db')
+		return SqliteTokenStore(self.store_path)
+
+	def test_names(self):
+		other = SqliteTokenStore(os.path.join(self.dir, 'tokens.db'), name='other')
+		self.store.save({'access_token': 'a'})
+		self.assertEqual(None, other.load())
+		other.close()
+
+	def test_failed_lock_body_rolls_back(self):
+		self.store.save({'access_token': 'a'})
+
+		def fail():
+			with self.store.lock():
+				self.store.save({'access_token': 'half'})
+				raise RuntimeError('refresh failed')
+
+		self.assertRaises(RuntimeError, fail)
+		self.assertEqual('a', self.store.load()['access_token'])
+		# the store is still usable
+		with self.store.lock():
+			self.store.save({'access_token': 'b'})
+		self.assertEqual('b', self.store.load()['access_token'])
+
+
+class TestSharedRefresh (unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.store = FileTokenStore(os.path.join(self.dir, 'token'))
+		self.con = Connection('shared-token')
+		self.con.api_version = '2.0'
+		self.con.token_store = self.store
+		self.con.oauth = FakeOAuth(time.time() - 1)
+
+	def tearDown(self):
+		Connection.remove('shared-token')
+		shutil.rmtree(self.dir)
+
+	def test_adopts_token_refreshed_by_another_process(self):
+		self.store.save({'access_token': 'other', 'refresh_token': 'r', 'expires_at': time.time() + 3600})
+		self.con.refresh_token('old')
+		self.assertEqual(0, self.con.oauth.refreshes)
+		self.assertEqual('other', self.con.oauth.access_token)
+
+	def test_refreshes_when_stored_token_is_stale(self):
+		self.store.save({'access_token': 'old', 'refresh_token': 'r', 'expires_at': time.time() - 1})
+		self.con.refresh_token('old')
+		self.assertEqual(1, self.con.oauth.refreshes)
+		self.assertEqual('new', self.store.load()['access_token'])
+
+	def test_forced_refresh_ignores_stored_token(self):
+		self.store.save({'access_token': 'other', 'refresh_token': 'r', 'expires_at': time.time() + 3600})
+		self.con.refresh_token()
+		self.assertEqual(1, self.con.oauth.refreshes)
+		self.assertEqual('new', self.store.load()['access_token'])
+
+
+if __name__ == '__main__':
+	unittest.main()
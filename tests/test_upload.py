@@ -0,0 +1,255 @@
+from O365.upload import UploadSession
+from O365.attachment import Attachment
+from O365.fluent_message import Message
+from O365.connection import Connection
+from O365.retry import RetryPolicy
+import unittest
+import json
+import os
+import shutil
+import tempfile
+
+import requests
+
+upload_url = 'https://upload.example.com/session'
+
+
+class Resp:
+	def __init__(self, status_code, value=None):
+		self.status_code = status_code
+		self.value = value
+		self.text = json.dumps(value)
+		self.content = self.text if value is not None else ''
+		self.headers = {}
+		self.url = upload_url
+
+	def json(self):
+		return self.value
+
+
+class UploadServer:
+	'''mock up of an upload session, keeping the bytes received'''
+	def __init__(self, size, fail_at=()):
+		self.size = size
+		self.received = b''
+		self.fail_at = list(fail_at)
+		self.puts = []
+
+	def expected(self):
+		return ['{}-'.format(len(self.received))] if len(self.received) < self.size else []
+
+	def get(self, url, **kwargs):
+		return Resp(200, {'nextExpectedRanges': self.expected()})
+
+	def put(self, url, data=None, headers=None, **kwargs):
+		assert 'Authorization' not in (headers or {})
+		self.puts.append(headers['Content-Range'])
+		if len(self.puts) in self.fail_at:
+			raise requests.ConnectionError('connection reset')
+		start = int(headers['Content-Range'].split(' ')[1].split('-')[0])
+		assert start == len(self.received)
+		self.received += data
+		if len(self.received) == self.size:
+			return Resp(201)
+		return Resp(200, {'nextExpectedRanges': self.expected()})
+
+
+class GraphServer:
+	'''mock up of the Graph calls sending a message with an upload session'''
+	def __init__(self, upload):
+		self.upload = upload
+		self.calls = []
+
+	def post(self, url, data=None, **kwargs):
+		self.calls.append(url)
+		if url.endswith('/me/messages'):
+			self.draft = json.loads(data)
+			return Resp(201, {'id': 'draft'})
+		if url.endswith('/createUploadSession'):
+			self.item = json.loads(data)['AttachmentItem']
+			return Resp(201, {'uploadUrl': upload_url, 'nextExpectedRanges': ['0-']})
+		if url.endswith('/send'):
+			return Resp(202)
+		raise AssertionError(url)
+
+	def delete(self, url, **kwargs):
+		self.calls.append('DELETE ' + url)
+		return Resp(204)
+
+
+class ConnectionGraph (GraphServer):
+	'''Graph calls sent through the connection, throttling the first request sending the message'''
+	token = {'access_token': 'token'}
+	access_token = 'token'
+
+	def request(self, method, url, **kwargs):
+		if method == 'DELETE':
+			return self.delete(url, **kwargs)
+		if url.endswith('/send') and not any(call.endswith('/send') for call in self.calls):
+			self.calls.append(url)
+			return Resp(429)
+		return self.post(url, **kwargs)
+
+
+class TestUploadSession (unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.path = os.path.join(self.dir, 'big.pdf')
+		self.content = os.urandom(1000000)
+		with open(self.path, 'wb') as big:
+			big.write(self.content)
+		self.inline_limit = Attachment.inline_limit
+		Attachment.inline_limit = 500000
+		self.waits = []
+		self.policy = RetryPolicy()
+		self.policy.sleep = self.waits.append
+
+	def tearDown(self):
+		Attachment.inline_limit = self.inline_limit
+		shutil.rmtree(self.dir)
+
+	def test_chunks(self):
+		server = UploadServer(len(self.content))
+		UploadSession(upload_url, self.path, chunk_size=327680, session=server, retry_policy=self.policy).upload()
+		self.assertEqual(self.content, server.received)
+		self.assertEqual(['bytes 0-327679/1000000', 'bytes 327680-655359/1000000',
+						  'bytes 655360-983039/1000000', 'bytes 983040-999999/1000000'], server.puts)
+
+	def test_retries_from_expected_range(self):
+		server = UploadServer(len(self.content), fail_at=[2])
+		UploadSession(upload_url, self.path, chunk_size=327680, session=server, retry_policy=self.policy).upload()
+		self.assertEqual(self.content, server.received)
+		self.assertEqual(5, len(server.puts))
+		# the failed range was sent again after a backoff
+		self.assertEqual(1, len(self.waits))
+
+	def test_server_errors_follow_retry_after(self):
+		server = UploadServer(len(self.content))
+		put = server.put
+		answers = [Resp(503), Resp(500)]
+		answers[0].headers = {'Retry-After': '7'}
+
+		def failing_put(url, **kwargs):
+			if answers:
+				return answers.pop(0)
+			return put(url, **kwargs)
+		server.put = failing_put
+
+		UploadSession(upload_url, self.path, chunk_size=327680, session=server, retry_policy=self.policy).upload()
+		self.assertEqual(self.content, server.received)
+		self.assertEqual(7, self.waits[0])
+		self.assertEqual(2, len(self.waits))
+
+	def test_resume(self):
+		server = UploadServer(len(self.content), fail_at=[2, 3])
+		upload = UploadSession(upload_url, self.path, chunk_size=327680, session=server, retry_policy=self.policy)
+		upload.max_failures = 2
+		self.assertRaises(requests.ConnectionError, upload.upload)
+		self.assertEqual(327680, len(server.received))
+
+		UploadSession(upload.upload_url, self.path, chunk_size=327680, session=server, retry_policy=self.policy).resume()
+		self.assertEqual(self.content, server.received)
+
+	def test_large_attachment_not_loaded(self):
+		small_path = os.path.join(self.dir, 'small.txt')
+		with open(small_path, 'wb') as small:
+			small.write(b'small')
+		self.assertFalse(Attachment(path=small_path).isLarge())
+
+		att = Attachment(path=self.path)
+		self.assertTrue(att.isLarge())
+		self.assertNotIn('ContentBytes', att.json)
+		self.assertEqual('big.pdf', att.getName())
+		self.assertIn('ContentBytes', att.inline())
+
+	def test_send_message(self):
+		upload = UploadServer(len(self.content))
+		graph = GraphServer(upload)
+		connection = Connection('upload-test')
+		connection.session = upload
+		connection.retry_policy = self.policy
+		try:
+			message = Message(oauth=graph, connection=connection)
+			message.setSubject('report')
+			message.setBody('see attached')
+			message.setRecipients('someone@example.com')
+			message.attachments.append(Attachment(path=self.path))
+			self.assertTrue(message.sendMessage())
+		finally:
+			connection.session = None
+			Connection.remove('upload-test')
+
+		self.assertEqual('https://graph.microsoft.com/v1.0/me/messages/draft/send', graph.calls[-1])
+		self.assertEqual([], graph.draft['Attachments'])
+		self.assertEqual({'attachmentType': 'file', 'name': 'big.pdf', 'size': 1000000}, graph.item)
+		self.assertEqual(self.content, upload.received)
+
+	def test_attachments_too_large_together(self):
+		paths = []
+		for i in range(3):
+			paths.append(os.path.join(self.dir, 'part{}.bin'.format(i)))
+			with open(paths[-1], 'wb') as part:
+				part.write(os.urandom(400000 + 3000 * i))
+		request_limit = Attachment.request_limit
+		Attachment.request_limit = 1200000
+		try:
+			message = Message(oauth=GraphServer(None))
+			message.attachments.extend(Attachment(path=path) for path in paths)
+			self.assertFalse(any(att.isLarge() for att in message.attachments))
+			# the largest one is uploaded, the two others fit
+			self.assertEqual([paths[2]], [att.path for att in message._uploads()])
+
+			message.attachments.pop()
+			self.assertEqual([], message._uploads())
+		finally:
+			Attachment.request_limit = request_limit
+
+	def test_send_through_connection(self):
+		upload = UploadServer(len(self.content))
+		graph = ConnectionGraph(upload)
+		connection = Connection('upload-test')
+		connection.api_version = '2.0'
+		connection.oauth = graph
+		connection.session = upload
+		connection.retry_policy = self.policy
+		try:
+			message = Message(oauth=graph, connection=connection)
+			message.setSubject('report')
+			message.setBody('see attached')
+			message.setRecipients('someone@example.com')
+			message.attachments.append(Attachment(path=self.path))
+			self.assertTrue(message.sendMessage())
+		finally:
+			connection.session = None
+			connection.oauth = None
+			Connection.remove('upload-test')
+
+		# the throttled request was sent again by the connection
+		self.assertEqual(2, sum(url.endswith('/send') for url in graph.calls))
+		self.assertEqual(1, len(self.waits))
+		self.assertEqual(self.content, upload.received)
+
+	def test_failed_upload_deletes_draft(self):
+		upload = UploadServer(len(self.content), fail_at=[1, 2, 3, 4, 5, 6])
+		graph = GraphServer(upload)
+		connection = Connection('upload-test')
+		connection.session = upload
+		connection.retry_policy = self.policy
+		try:
+			message = Message(oauth=graph, connection=connection)
+			message.setSubject('report')
+			message.setBody('see attached')
+			message.setRecipients('someone@example.com')
+			message.attachments.append(Attachment(path=self.path))
+			self.assertFalse(message.sendMessage())
+		finally:
+			connection.session = None
+			Connection.remove('upload-test')
+
+		self.assertEqual('DELETE https://graph.microsoft.com/v1.0/me/messages/draft', graph.calls[-1])
+		self.assertFalse(any(url.endswith('/send') for url in graph.calls))
+
+
+if __name__ == '__main__':
+	unittest.main()